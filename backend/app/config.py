@@ -1,8 +1,12 @@
 import os
 from pathlib import Path
+from typing import Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
+# Backend directory; relative storage paths are resolved against it
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
 class Settings(BaseSettings):
     # Execution mode
     MODE: str = os.getenv("MODE", "demo")  # demo or gpu
@@ -14,6 +18,16 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
     JOBS_DIR: str = os.getenv("JOBS_DIR", "static/jobs")
     
+    # Upload size limits in bytes; larger uploads are rejected with 413
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+    MAX_ANNOTATION_BYTES: int = int(os.getenv("MAX_ANNOTATION_BYTES", str(5 * 1024 * 1024)))
+    # Resumable upload sessions with no chunk for this many seconds are removed
+    UPLOAD_SESSION_TTL: float = float(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+    
+    # Job state storage: sqlite (durable, shared between processes) or memory
+    JOB_STORE: str = os.getenv("JOB_STORE", "sqlite")
+    JOB_DB_PATH: str = os.getenv("JOB_DB_PATH", "state/jobs.db")
+    
     # Plan2Scene repository paths
     PLAN2SCENE_ROOT: Path = Path(os.getenv("PLAN2SCENE_ROOT", "../plan2scene"))
     PLAN2SCENE_DATA_ROOT: Path = Path(os.getenv("PLAN2SCENE_DATA_ROOT", ""))  # Auto-computed if empty
@@ -24,6 +38,128 @@ class Settings(BaseSettings):
     # Raster-to-Vector repository path (optional, for future phase)
     RASTER_TO_VECTOR_ROOT: Path = Path(os.getenv("RASTER_TO_VECTOR_ROOT", "../raster-to-vector"))
     
+    # Job scheduling: total concurrent pipelines, plus a cap per pipeline mode
+    PIPELINE_SLOTS: int = int(os.getenv("PIPELINE_SLOTS", "4"))
+    DEMO_PIPELINE_SLOTS: int = int(os.getenv("DEMO_PIPELINE_SLOTS", "4"))
+    GPU_PIPELINE_SLOTS: int = int(os.getenv("GPU_PIPELINE_SLOTS", "1"))
+    
+    # Where pipelines run: inline (inside the API process) or external
+    # (dedicated `python -m app.worker` daemons; the API only enqueues)
+    WORKER_MODE: str = os.getenv("WORKER_MODE", "inline")
+    QUEUE_POLL_INTERVAL: float = float(os.getenv("QUEUE_POLL_INTERVAL", "1.0"))
+    
+    # Worker leases: a claimed job is requeued if its worker misses heartbeats
+    # for QUEUE_LEASE_TTL seconds; after QUEUE_MAX_ATTEMPTS leases it is failed
+    QUEUE_LEASE_TTL: float = float(os.getenv("QUEUE_LEASE_TTL", "30"))
+    QUEUE_HEARTBEAT_INTERVAL: float = float(os.getenv("QUEUE_HEARTBEAT_INTERVAL", "10"))
+    QUEUE_MAX_ATTEMPTS: int = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+    
+    # Job progress streaming: how often to check the shared store for updates
+    # made by other processes, and the SSE keep-alive comment interval
+    JOB_EVENTS_POLL_INTERVAL: float = float(os.getenv("JOB_EVENTS_POLL_INTERVAL", "1.0"))
+    SSE_KEEPALIVE_INTERVAL: float = float(os.getenv("SSE_KEEPALIVE_INTERVAL", "15"))
+    # Longest a GET /api/jobs/{id}?wait=N long-poll is held open
+    LONG_POLL_MAX_WAIT: float = float(os.getenv("LONG_POLL_MAX_WAIT", "60"))
+    
+    # Return the existing job for byte-identical resubmissions under the same
+    # pipeline mode, checkpoint and config instead of running the pipeline again
+    DEDUP_ENABLED: bool = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+    
+    # Wall-clock limit per pipeline stage command, in seconds (0 disables).
+    # STAGE_TIMEOUTS overrides it per stage, e.g. "gnn_texture_prop=3600,render_house_jsons=600"
+    STAGE_TIMEOUT: float = float(os.getenv("STAGE_TIMEOUT", "7200"))
+    STAGE_TIMEOUTS: str = os.getenv("STAGE_TIMEOUTS", "")
+    
+    # Attempts per stage command when it fails transiently (killed, file
+    # races, resource exhaustion); retries back off exponentially from
+    # STAGE_RETRY_BACKOFF seconds
+    STAGE_MAX_ATTEMPTS: int = int(os.getenv("STAGE_MAX_ATTEMPTS", "2"))
+    STAGE_RETRY_BACKOFF: float = float(os.getenv("STAGE_RETRY_BACKOFF", "5"))
+    
+    # Skip full-pipeline stages whose inputs, code, configs and parameters
+    # hash the same as when they last succeeded in the job's data root
+    # (recorded in <data root>/stage_manifest.json)
+    STAGE_SKIP_UP_TO_DATE: bool = os.getenv("STAGE_SKIP_UP_TO_DATE", "true").lower() in ("1", "true", "yes")
+    
+    # Seam correction backend: embark (Plan2Scene's script with Embark's
+    # texture-synthesis tool; copies crops uncorrected without
+    # seam_correct.json), numpy (built-in batched blending), copy (no
+    # correction) or auto (embark when configured, else numpy).
+    # SEAM_BLEND_METHOD is periodic (gradient-domain) or offset (offset-and-
+    # blend over SEAM_BLEND_WIDTH of each edge)
+    SEAM_CORRECTION_BACKEND: str = os.getenv("SEAM_CORRECTION_BACKEND", "auto")
+    SEAM_BLEND_METHOD: str = os.getenv("SEAM_BLEND_METHOD", "periodic")
+    SEAM_BLEND_WIDTH: float = float(os.getenv("SEAM_BLEND_WIDTH", "0.25"))
+    
+    # How staged files (scene.json inputs, tileable crops when seam correction
+    # is skipped, final outputs) are materialized: auto or reflink (reflink,
+    # then copy) or copy. Staged files can be rewritten in place later, so they
+    # are never hardlinked (hardlink behaves like copy here)
+    STAGING_LINK_MODE: str = os.getenv("STAGING_LINK_MODE", "auto")
+    
+    # Cross-job cache of room embedding, VGG crop selection and GNN outputs,
+    # keyed by the normalized scene.json, models, configs and parameters.
+    # Hits are hardlinked into the job; least recently used entries are
+    # evicted past STAGE_CACHE_MAX_BYTES (0 disables the cache). Defaults to
+    # <state dir>/stage_cache
+    STAGE_CACHE_DIR: str = os.getenv("STAGE_CACHE_DIR", "")
+    STAGE_CACHE_MAX_BYTES: int = int(os.getenv("STAGE_CACHE_MAX_BYTES", "0"))
+    
+    # Stage output logs (<job dir>/logs/<stage>.log): rotate past JOB_LOG_MAX_BYTES
+    # keeping JOB_LOG_BACKUPS old files; error messages carry the last
+    # STAGE_LOG_TAIL_LINES lines of stderr
+    JOB_LOG_MAX_BYTES: int = int(os.getenv("JOB_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    JOB_LOG_BACKUPS: int = int(os.getenv("JOB_LOG_BACKUPS", "2"))
+    STAGE_LOG_TAIL_LINES: int = int(os.getenv("STAGE_LOG_TAIL_LINES", "50"))
+    
+    # Per-stage resource accounting: run stage commands under the rusage shim
+    # (CPU time, peak RSS, I/O bytes) and sample their process group from
+    # /proc every RESOURCE_SAMPLE_INTERVAL seconds
+    RESOURCE_ACCOUNTING: bool = os.getenv("RESOURCE_ACCOUNTING", "true").lower() in ("1", "true", "yes")
+    RESOURCE_SAMPLE_INTERVAL: float = float(os.getenv("RESOURCE_SAMPLE_INTERVAL", "1.0"))
+    
+    # Warm stage workers: run stage scripts in up to STAGE_WORKERS long-lived
+    # processes per API/worker process that keep torch, Plan2Scene and loaded
+    # checkpoints in memory (0 = always start a fresh interpreter). Workers
+    # import STAGE_WORKER_PRELOAD up front and are replaced after
+    # STAGE_WORKER_MAX_RUNS scripts. Each keeps at most
+    # STAGE_WORKER_CHECKPOINT_CACHE_MB of checkpoints, least recently used
+    # dropped first (0 = no cache)
+    STAGE_WORKERS: int = int(os.getenv("STAGE_WORKERS", "0"))
+    STAGE_WORKER_MAX_RUNS: int = int(os.getenv("STAGE_WORKER_MAX_RUNS", "50"))
+    STAGE_WORKER_PRELOAD: str = os.getenv("STAGE_WORKER_PRELOAD", "torch,torchvision,plan2scene")
+    STAGE_WORKER_CHECKPOINT_CACHE_MB: int = int(os.getenv("STAGE_WORKER_CHECKPOINT_CACHE_MB", "4096"))
+    
+    # Run the model-driven full-pipeline stages (room embeddings, VGG crop
+    # selection, GNN propagation, texture embedding) of a job in one
+    # interpreter instead of four
+    STAGE_FUSION: bool = os.getenv("STAGE_FUSION", "false").lower() in ("1", "true", "yes")
+    
+    # Per-resource-class stage pools, e.g. "gpu=1,cpu=2,io=4": each stage waits
+    # for a slot in its class (gpu, cpu or io) before running, so with
+    # GPU_PIPELINE_SLOTS above the gpu pool size jobs overlap on different
+    # resources. Classes not listed are unbounded
+    STAGE_POOLS: str = os.getenv("STAGE_POOLS", "")
+    
+    # Full pipeline micro-batching: jobs reaching preprocessing within
+    # HOUSE_BATCH_WINDOW seconds of each other (0 disables) share one data
+    # root and one run of each stage, up to HOUSE_BATCH_MAX_HOUSES houses.
+    # Collecting jobs hold no pipeline slot: GPU_PIPELINE_SLOTS then caps
+    # running batches, and each can claim HOUSE_BATCH_MAX_HOUSES jobs
+    HOUSE_BATCH_WINDOW: float = float(os.getenv("HOUSE_BATCH_WINDOW", "0"))
+    HOUSE_BATCH_MAX_HOUSES: int = int(os.getenv("HOUSE_BATCH_MAX_HOUSES", "8"))
+    
+    # CPU fallback: pin each stage command to its own cores and cap its
+    # OpenMP/MKL/torch threads to match. Budgets are the fair share of the
+    # host's cores (less CPU_RESERVED_CORES) for GPU_PIPELINE_SLOTS jobs,
+    # shrunk under outside load but never below CPU_MIN_THREADS
+    CPU_AFFINITY: bool = os.getenv("CPU_AFFINITY", "true").lower() in ("1", "true", "yes")
+    CPU_RESERVED_CORES: int = int(os.getenv("CPU_RESERVED_CORES", "1"))
+    CPU_MIN_THREADS: int = int(os.getenv("CPU_MIN_THREADS", "1"))
+    
+    # Seconds to let running pipelines reach a stage boundary on shutdown
+    DRAIN_TIMEOUT: float = float(os.getenv("DRAIN_TIMEOUT", "600"))
+    
     # GPU availability flag - set to False to force CPU fallback
     plan2scene_gpu_enabled: bool = Field(True, env="PLAN2SCENE_GPU_ENABLED")
 
@@ -41,6 +177,50 @@ class Settings(BaseSettings):
     def plan2scene_code_root(self) -> Path:
         """Return the code/src directory of Plan2Scene for PYTHONPATH."""
         return self.PLAN2SCENE_ROOT / "code" / "src"
+    
+    @property
+    def gnn_conf_path(self) -> Path:
+        """GNN texture propagation config used by the full pipeline."""
+        return self.PLAN2SCENE_ROOT / "conf" / "plan2scene" / "texture_prop_conf" / "default.json"
+    
+    @property
+    def gnn_checkpoint_path(self) -> Path:
+        """Pretrained GNN texture propagation checkpoint."""
+        return self.PLAN2SCENE_ROOT / "data" / "checkpoints" / "texture-prop-synth-v2-epoch250.ckpt"
+    
+    def stage_timeout(self, stage_name: str) -> Optional[float]:
+        """Timeout for a stage command in seconds, or None for no limit."""
+        timeout = self.STAGE_TIMEOUT
+        for entry in self.STAGE_TIMEOUTS.split(","):
+            name, _, value = entry.partition("=")
+            if name.strip() == stage_name and value.strip():
+                timeout = float(value)
+        return timeout if timeout > 0 else None
+    
+    @property
+    def house_batching(self) -> bool:
+        """Whether full-pipeline jobs of this process are batched."""
+        return self.HOUSE_BATCH_WINDOW > 0 and self.MODE == "gpu" and self.PIPELINE_MODE == "full"
+    
+    @property
+    def jobs_dir(self) -> Path:
+        """Resolve the per-job output directory root."""
+        path = Path(self.JOBS_DIR)
+        return path if path.is_absolute() else BACKEND_DIR / path
+    
+    @property
+    def stage_cache_dir(self) -> Path:
+        """Resolve the stage output cache directory, defaulting to next to the job database."""
+        if not self.STAGE_CACHE_DIR:
+            return self.job_db_path.parent / "stage_cache"
+        path = Path(self.STAGE_CACHE_DIR)
+        return path if path.is_absolute() else BACKEND_DIR / path
+    
+    @property
+    def job_db_path(self) -> Path:
+        """Resolve the job database path, relative paths being relative to the backend directory."""
+        path = Path(self.JOB_DB_PATH)
+        return path if path.is_absolute() else BACKEND_DIR / path
 
 settings = Settings()
 
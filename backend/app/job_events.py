@@ -0,0 +1,134 @@
+"""
+Job change notifications for streaming and long-poll clients.
+
+JobEventBus is an in-process pub/sub keyed by job id. Updates made through
+update_job in this process are pushed to subscribers immediately. Updates
+made by other processes (API workers, `python -m app.worker` daemons) are
+picked up by a single poller that compares job versions in the shared job
+store every JOB_EVENTS_POLL_INTERVAL seconds while anyone is subscribed,
+so one cheap query serves every open stream in the process.
+
+Subscribers only ever see the latest state of a job: intermediate updates
+that arrive while a client is slow are coalesced.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set
+
+from app.config import settings
+from app.jobs import Job, add_update_listener, get_job_store
+
+logger = logging.getLogger(__name__)
+
+# Statuses after which a job never changes again
+TERMINAL_STATUSES = {"done", "failed", "cancelled"}
+
+
+class JobSubscription:
+    """Latest-value mailbox for one subscriber to one job."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.latest: Optional[Job] = None
+        self._changed = asyncio.Event()
+
+    def _deliver(self, job: Job) -> None:
+        if self.latest is None or job.version > self.latest.version:
+            self.latest = job
+            self._changed.set()
+
+    async def wait(self, after_version: int, timeout: Optional[float]) -> Optional[Job]:
+        """
+        Wait until the job's version exceeds `after_version`.
+
+        Returns:
+            The newer job, or None if `timeout` elapsed first
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self.latest is None or self.latest.version <= after_version:
+            self._changed.clear()
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return None
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+        return self.latest
+
+
+class JobEventBus:
+    """Fan-out of job updates to subscriptions on the running event loop."""
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._subscriptions: Dict[str, Set[JobSubscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._poller: Optional[asyncio.Task] = None
+        add_update_listener(self.publish)
+
+    def publish(self, job: Job) -> None:
+        """Deliver a job update; safe to call from any thread."""
+        loop = self._loop
+        if loop is None or job.job_id not in self._subscriptions:
+            return
+        try:
+            loop.call_soon_threadsafe(self._deliver, job)
+        except RuntimeError:
+            # Loop closed during shutdown
+            pass
+
+    def _deliver(self, job: Job) -> None:
+        for subscription in list(self._subscriptions.get(job.job_id, ())):
+            subscription._deliver(job)
+
+    @asynccontextmanager
+    async def subscribe(self, job_id: str) -> AsyncIterator[JobSubscription]:
+        """Subscribe to a job; the subscription starts with the job's current state."""
+        self._loop = asyncio.get_running_loop()
+        subscription = JobSubscription(job_id)
+        self._subscriptions.setdefault(job_id, set()).add(subscription)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        try:
+            job = await asyncio.to_thread(get_job_store().get, job_id)
+            if job:
+                subscription._deliver(job)
+            yield subscription
+        finally:
+            subscribers = self._subscriptions.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[job_id]
+
+    async def _poll(self) -> None:
+        """Pick up updates written by other processes until nobody is subscribed."""
+        store = get_job_store()
+        while self._subscriptions:
+            await asyncio.sleep(self.poll_interval)
+            job_ids = list(self._subscriptions)
+            try:
+                versions = await asyncio.to_thread(store.get_versions, job_ids)
+                for job_id, version in versions.items():
+                    seen = [s.latest.version if s.latest else -1 for s in self._subscriptions.get(job_id, ())]
+                    if seen and min(seen) < version:
+                        job = await asyncio.to_thread(store.get, job_id)
+                        if job:
+                            self._deliver(job)
+            except Exception as e:
+                logger.warning(f"Job event poll failed: {e}")
+
+
+_bus: Optional[JobEventBus] = None
+
+
+def get_job_event_bus() -> JobEventBus:
+    """Return the process-wide job event bus."""
+    global _bus
+    if _bus is None:
+        _bus = JobEventBus(settings.JOB_EVENTS_POLL_INTERVAL)
+    return _bus
@@ -0,0 +1,349 @@
+"""
+Durable pipeline job queue.
+
+The API enqueues jobs here and pipeline workers (`python -m app.worker`, or
+the API process itself when WORKER_MODE=inline) claim them. Rows live in the
+same SQLite database as the job store, so any number of processes on the
+host can share one queue.
+
+Claims are leases: a worker must heartbeat before `lease_expires_at`, or
+the job is handed to another worker. Every claim gets a fresh lease token
+and heartbeat/complete/requeue only succeed for the current token, so a
+worker that lost its lease (crash, pause, network partition on shared
+storage) can no longer act on the job.
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.db import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueueEntry:
+    """A claimed job with everything a worker needs to run it."""
+    job_id: str
+    mode: str
+    priority: int
+    upload_path: Path
+    output_dir: Path
+    r2v_path: Optional[Path] = None
+    lease_token: Optional[str] = None
+    attempts: int = 0
+
+    @classmethod
+    def from_row(cls, row, lease_token: Optional[str] = None) -> "QueueEntry":
+        payload = json.loads(row["payload"])
+        return cls(
+            job_id=row["job_id"],
+            mode=row["mode"],
+            priority=row["priority"],
+            upload_path=Path(payload["upload_path"]),
+            output_dir=Path(payload["output_dir"]),
+            r2v_path=Path(payload["r2v_path"]) if payload.get("r2v_path") else None,
+            lease_token=lease_token or row["lease_token"],
+            attempts=row["attempts"] or 0,
+        )
+
+
+class JobQueue:
+    """
+    Priority queue of pipeline jobs backed by SQLite.
+
+    Rows are 'queued' until a worker claims them and 'running' until the
+    worker reports completion, at which point they are removed. A running
+    job that is cancelled stays as 'cancelled' until its worker stops (or
+    its lease expires), so the queue knows the run may still be writing.
+    Per-mode limits are enforced at claim time across all workers sharing
+    the file.
+    """
+
+    def __init__(self, db_path: Path, lease_ttl: float = 30.0, max_attempts: int = 3):
+        self.db = SQLiteDatabase(db_path)
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        self._init_schema()
+
+    def _init_schema(self):
+        conn = self.db.connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_queue (
+                job_id TEXT PRIMARY KEY,
+                mode TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                worker_id TEXT,
+                lease_token TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        # Add lease columns to queues created before leases existed
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(job_queue)")}
+        for name, decl in (
+            ("lease_token", "TEXT"),
+            ("lease_expires_at", "REAL"),
+            ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+        ):
+            if name not in existing:
+                conn.execute(f"ALTER TABLE job_queue ADD COLUMN {name} {decl}")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_job_queue_pending "
+            "ON job_queue(state, priority DESC, enqueued_at)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_job_queue_lease "
+            "ON job_queue(state, lease_expires_at)"
+        )
+
+    def enqueue(
+        self,
+        job_id: str,
+        mode: str,
+        upload_path: Path,
+        output_dir: Path,
+        r2v_path: Optional[Path] = None,
+        priority: int = 0,
+        replace: bool = True
+    ) -> bool:
+        """
+        Add a job to the queue. With replace=False an existing row for the
+        job is left untouched. Returns True if the job was (re)queued.
+        """
+        payload = {
+            "upload_path": str(upload_path),
+            "output_dir": str(output_dir),
+            "r2v_path": str(r2v_path) if r2v_path else None,
+        }
+        conflict = "REPLACE" if replace else "IGNORE"
+        cursor = self.db.connect().execute(
+            f"INSERT OR {conflict} INTO job_queue (job_id, mode, priority, payload, state, enqueued_at, attempts) "
+            "VALUES (?, ?, ?, ?, 'queued', ?, 0)",
+            (job_id, mode, priority, json.dumps(payload), time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, worker_id: str, mode_limits: Optional[Dict[str, int]] = None) -> Optional[QueueEntry]:
+        """
+        Atomically lease the highest-priority queued job whose mode is below its limit.
+
+        Returns None when nothing is claimable. Jobs whose previous lease
+        expired are claimable again; call requeue_expired() to also account
+        for jobs that exhausted their attempts.
+        """
+        mode_limits = mode_limits or {}
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self.db.transaction() as conn:
+            running = {
+                row["mode"]: row["n"]
+                for row in conn.execute(
+                    "SELECT mode, COUNT(*) AS n FROM job_queue "
+                    "WHERE state IN ('running', 'cancelled') AND lease_expires_at >= ? GROUP BY mode",
+                    (now,),
+                )
+            }
+            saturated = [
+                mode for mode, limit in mode_limits.items()
+                if running.get(mode, 0) >= limit
+            ]
+            query = (
+                "SELECT * FROM job_queue WHERE (state = 'queued' "
+                "OR (state = 'running' AND lease_expires_at < ? AND attempts < ?))"
+            )
+            params: List[Any] = [now, self.max_attempts]
+            if saturated:
+                query += " AND mode NOT IN (" + ", ".join("?" for _ in saturated) + ")"
+                params.extend(saturated)
+            query += " ORDER BY priority DESC, enqueued_at LIMIT 1"
+            row = conn.execute(query, params).fetchone()
+            if row is None:
+                return None
+            if row["state"] == "running":
+                logger.warning(f"Lease on job {row['job_id']} held by {row['worker_id']} expired; reclaiming")
+            conn.execute(
+                "UPDATE job_queue SET state = 'running', started_at = ?, worker_id = ?, "
+                "lease_token = ?, lease_expires_at = ?, attempts = attempts + 1 WHERE job_id = ?",
+                (now, worker_id, token, now + self.lease_ttl, row["job_id"]),
+            )
+            row = conn.execute("SELECT * FROM job_queue WHERE job_id = ?", (row["job_id"],)).fetchone()
+        return QueueEntry.from_row(row)
+
+    def heartbeat(self, job_id: str, lease_token: str) -> bool:
+        """Extend a lease. Returns False if the lease was lost to another worker."""
+        cursor = self.db.connect().execute(
+            "UPDATE job_queue SET lease_expires_at = ? "
+            "WHERE job_id = ? AND lease_token = ? AND state = 'running'",
+            (time.time() + self.lease_ttl, job_id, lease_token),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, lease_token: str) -> bool:
+        """Remove a finished (done or failed) job. Returns False if the lease was lost."""
+        cursor = self.db.connect().execute(
+            "DELETE FROM job_queue WHERE job_id = ? AND lease_token = ?",
+            (job_id, lease_token),
+        )
+        return cursor.rowcount == 1
+
+    def requeue(self, job_id: str, lease_token: str) -> bool:
+        """
+        Give up a lease, returning the job to the queue at its original place in line.
+
+        A lease handed back this way (e.g. on a graceful drain) does not count
+        towards max_attempts; only leases that expired or died with their
+        worker do.
+        """
+        cursor = self.db.connect().execute(
+            "UPDATE job_queue SET state = 'queued', started_at = NULL, worker_id = NULL, "
+            "lease_token = NULL, lease_expires_at = NULL, attempts = MAX(attempts - 1, 0) "
+            "WHERE job_id = ? AND lease_token = ?",
+            (job_id, lease_token),
+        )
+        return cursor.rowcount == 1
+
+    def release_worker(self, worker_id: str) -> List[str]:
+        """
+        Requeue every job leased to `worker_id` without waiting for the leases
+        to expire. Only safe when that worker is known to be dead.
+        """
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM job_queue WHERE state = 'cancelled' AND worker_id = ?", (worker_id,))
+            job_ids = [
+                row["job_id"] for row in conn.execute(
+                    "SELECT job_id FROM job_queue WHERE state = 'running' AND worker_id = ?",
+                    (worker_id,),
+                )
+            ]
+            conn.execute(
+                "UPDATE job_queue SET state = 'queued', started_at = NULL, worker_id = NULL, "
+                "lease_token = NULL, lease_expires_at = NULL WHERE state = 'running' AND worker_id = ?",
+                (worker_id,),
+            )
+        return job_ids
+
+    def running_workers(self) -> List[str]:
+        """Return the distinct worker ids currently holding leases."""
+        return [
+            row["worker_id"] for row in self.db.connect().execute(
+                "SELECT DISTINCT worker_id FROM job_queue WHERE state IN ('running', 'cancelled')"
+            )
+        ]
+
+    def remove(self, job_id: str) -> bool:
+        """
+        Drop a job from the queue whatever its state. A running job is only
+        marked cancelled: the worker holding its lease finds out at its next
+        heartbeat, abandons the run and completes the row, and until then
+        contains() still reports it.
+        """
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE job_queue SET state = 'cancelled' WHERE job_id = ? AND state = 'running'",
+                (job_id,),
+            )
+            if cursor.rowcount == 0:
+                cursor = conn.execute("DELETE FROM job_queue WHERE job_id = ?", (job_id,))
+        return cursor.rowcount == 1
+
+    def contains(self, job_id: str) -> bool:
+        """True while the job is queued, running, or cancelled but possibly still running."""
+        return self.db.connect().execute(
+            "SELECT 1 FROM job_queue WHERE job_id = ?", (job_id,)
+        ).fetchone() is not None
+
+    def requeue_expired(self) -> Tuple[List[str], List[str]]:
+        """
+        Return expired leases to the queue.
+
+        Jobs that already lost max_attempts leases are removed instead, so a
+        job that keeps killing its worker cannot cycle forever. Leases given
+        back with requeue() are not counted.
+
+        Returns:
+            (requeued job ids, abandoned job ids)
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            # Cancelled runs whose worker stopped heartbeating are over
+            conn.execute("DELETE FROM job_queue WHERE state = 'cancelled' AND lease_expires_at < ?", (now,))
+            expired = conn.execute(
+                "SELECT job_id, attempts, worker_id FROM job_queue "
+                "WHERE state = 'running' AND lease_expires_at < ?",
+                (now,),
+            ).fetchall()
+            requeued, abandoned = [], []
+            for row in expired:
+                if row["attempts"] >= self.max_attempts:
+                    conn.execute("DELETE FROM job_queue WHERE job_id = ?", (row["job_id"],))
+                    abandoned.append(row["job_id"])
+                else:
+                    conn.execute(
+                        "UPDATE job_queue SET state = 'queued', started_at = NULL, worker_id = NULL, "
+                        "lease_token = NULL, lease_expires_at = NULL WHERE job_id = ?",
+                        (row["job_id"],),
+                    )
+                    requeued.append(row["job_id"])
+        for job_id in requeued:
+            logger.warning(f"Lease on job {job_id} expired; returned to queue")
+        for job_id in abandoned:
+            logger.error(f"Job {job_id} lost its lease {self.max_attempts} times; giving up")
+        return requeued, abandoned
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Return the 1-based position of a queued job, or None if it is not waiting."""
+        conn = self.db.connect()
+        row = conn.execute(
+            "SELECT priority, enqueued_at FROM job_queue WHERE job_id = ? AND state = 'queued'",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        ahead = conn.execute(
+            "SELECT COUNT(*) FROM job_queue WHERE state = 'queued' "
+            "AND (priority > ? OR (priority = ? AND enqueued_at < ?))",
+            (row["priority"], row["priority"], row["enqueued_at"]),
+        ).fetchone()[0]
+        return ahead + 1
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, Any] = {"queued": 0, "running": 0, "running_by_mode": {}}
+        for row in self.db.connect().execute(
+            "SELECT state, mode, COUNT(*) AS n FROM job_queue GROUP BY state, mode"
+        ):
+            counts[row["state"]] = counts.get(row["state"], 0) + row["n"]
+            if row["state"] == "running":
+                counts["running_by_mode"][row["mode"]] = row["n"]
+        return counts
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue, creating it on first use."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(
+                    settings.job_db_path,
+                    lease_ttl=settings.QUEUE_LEASE_TTL,
+                    max_attempts=settings.QUEUE_MAX_ATTEMPTS,
+                )
+    return _queue
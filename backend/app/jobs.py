@@ -1,6 +1,26 @@
-from dataclasses import dataclass, field
+"""
+Job state storage.
+
+Jobs are persisted through a pluggable JobStore. The default SQLiteJobStore
+keeps state in a WAL-mode database so it survives restarts and can be shared
+between several API/worker processes on the same host. MemoryJobStore keeps
+the original in-process behaviour for local experiments.
+"""
+
+import json
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, fields, asdict, replace
 from datetime import datetime
-from typing import Dict, Optional
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.db import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -11,38 +31,332 @@ class Job:
     video_url: Optional[str] = None
     current_stage: Optional[str] = None
     created_at: datetime = field(default_factory=datetime.utcnow)
+    # Submission inputs, kept so failed jobs can be retried
+    upload_path: Optional[str] = None
+    r2v_path: Optional[str] = None
+    priority: int = 0
+    # Submission fingerprint (inputs + pipeline identity) for deduplication
+    content_hash: Optional[str] = None
+    # Shared job whose result this deduplicated submission follows
+    alias_of: Optional[str] = None
+    # Incremented by the store on every update; lets readers detect changes
+    version: int = 0
+    # Resource usage of each stage command that ran, keyed by stage name
+    stage_resources: Optional[Dict[str, Dict[str, Any]]] = None
 
 
-_jobs: Dict[str, Job] = {}
+# Fields stored as ISO timestamps / JSON documents rather than plain SQLite values
+_DATETIME_FIELDS = {"created_at"}
+_JSON_FIELDS = {"stage_resources"}
 
 
-def create_job(job_id: str) -> Job:
-    job = Job(job_id=job_id)
-    _jobs[job_id] = job
-    return job
+class JobStore(ABC):
+    """Interface for job state backends."""
+
+    @abstractmethod
+    def create(self, job: Job) -> Job:
+        """Persist a new job."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return the job with the given id, or None."""
+
+    @abstractmethod
+    def update(self, job_id: str, changes: Dict[str, Any], if_status: Optional[str] = None) -> Optional[Job]:
+        """
+        Apply field changes to a job and return the updated job, or None if
+        missing. With `if_status`, changes apply only while the job has that
+        status (compare-and-set); otherwise nothing changes and None is returned.
+        """
+
+    @abstractmethod
+    def set_stage_resources(self, job_id: str, stage_name: str, usage: Dict[str, Any]) -> Optional[Job]:
+        """
+        Set one stage's entry in the job's stage_resources atomically, so
+        stages of a job finishing concurrently keep each other's entries.
+        Returns the updated job, or None if missing.
+        """
+
+    @abstractmethod
+    def get_versions(self, job_ids: List[str]) -> Dict[str, int]:
+        """Return the current version of each existing job in `job_ids`."""
+
+    @abstractmethod
+    def list_jobs(self, status: Optional[str] = None, limit: Optional[int] = None) -> List[Job]:
+        """Return jobs (newest first), optionally filtered by status."""
+
+    @abstractmethod
+    def find_by_content_hash(self, content_hash: str, statuses: List[str]) -> Optional[Job]:
+        """Return the newest job with this submission fingerprint in one of `statuses`."""
+
+
+class MemoryJobStore(JobStore):
+    """Process-local job store. State is lost on restart and not shared between workers."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Job) -> Job:
+        with self._lock:
+            self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        return replace(job) if job else None
+
+    def update(self, job_id: str, changes: Dict[str, Any], if_status: Optional[str] = None) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or (if_status is not None and job.status != if_status):
+                return None
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.version += 1
+            return replace(job)
+
+    def set_stage_resources(self, job_id: str, stage_name: str, usage: Dict[str, Any]) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            job.stage_resources = {**(job.stage_resources or {}), stage_name: usage}
+            job.version += 1
+            return replace(job)
+
+    def get_versions(self, job_ids: List[str]) -> Dict[str, int]:
+        return {job_id: self._jobs[job_id].version for job_id in job_ids if job_id in self._jobs}
+
+    def list_jobs(self, status: Optional[str] = None, limit: Optional[int] = None) -> List[Job]:
+        jobs = [j for j in self._jobs.values() if status is None or j.status == status]
+        jobs.sort(key=lambda j: j.created_at, reverse=True)
+        return jobs[:limit] if limit is not None else jobs
+
+    def find_by_content_hash(self, content_hash: str, statuses: List[str]) -> Optional[Job]:
+        matches = [
+            j for j in self._jobs.values()
+            if j.content_hash == content_hash and j.status in statuses
+        ]
+        return max(matches, key=lambda j: j.created_at, default=None)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    SQLite-backed job store.
+
+    Shares the WAL-mode database with the job queue, so every API and worker
+    process on the host sees the same job state.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db = SQLiteDatabase(db_path)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        return self.db.connect()
+
+    def _init_schema(self):
+        conn = self._connect()
+        columns = [f.name for f in fields(Job) if f.name != "job_id"]
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, "
+            + ", ".join(columns)
+            + ")"
+        )
+        # Add columns introduced after the database was created
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name in columns:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name}")
+                logger.info(f"Added column {name} to job store")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_content_hash ON jobs(content_hash)")
+
+    @staticmethod
+    def _encode(name: str, value: Any) -> Any:
+        if value is None:
+            return None
+        if name in _DATETIME_FIELDS:
+            return value.isoformat()
+        if name in _JSON_FIELDS:
+            return json.dumps(value)
+        return value
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Job:
+        values = {}
+        keys = row.keys()
+        for f in fields(Job):
+            if f.name not in keys:
+                continue
+            value = row[f.name]
+            if value is not None and f.name in _DATETIME_FIELDS:
+                value = datetime.fromisoformat(value)
+            elif value is not None and f.name in _JSON_FIELDS:
+                value = json.loads(value)
+            if value is None and f.name != "job_id":
+                continue
+            values[f.name] = value
+        return Job(**values)
+
+    def create(self, job: Job) -> Job:
+        data = {name: self._encode(name, value) for name, value in asdict(job).items()}
+        names = ", ".join(data)
+        placeholders = ", ".join("?" for _ in data)
+        self._connect().execute(
+            f"INSERT INTO jobs ({names}) VALUES ({placeholders})",
+            list(data.values()),
+        )
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = self._connect().execute(
+            "SELECT * FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return self._decode(row) if row else None
+
+    def update(self, job_id: str, changes: Dict[str, Any], if_status: Optional[str] = None) -> Optional[Job]:
+        conn = self._connect()
+        if changes:
+            assignments = ", ".join(f"{name} = ?" for name in changes)
+            values = [self._encode(name, value) for name, value in changes.items()]
+            query = f"UPDATE jobs SET {assignments}, version = COALESCE(version, 0) + 1 WHERE job_id = ?"
+            params = values + [job_id]
+            if if_status is not None:
+                query += " AND status = ?"
+                params.append(if_status)
+            cursor = conn.execute(query, params)
+            if cursor.rowcount == 0:
+                return None
+        return self.get(job_id)
+
+    def set_stage_resources(self, job_id: str, stage_name: str, usage: Dict[str, Any]) -> Optional[Job]:
+        # Read and write under one write lock (BEGIN IMMEDIATE)
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT stage_resources FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            resources = json.loads(row["stage_resources"]) if row["stage_resources"] else {}
+            resources[stage_name] = usage
+            conn.execute(
+                "UPDATE jobs SET stage_resources = ?, version = COALESCE(version, 0) + 1 WHERE job_id = ?",
+                (json.dumps(resources), job_id),
+            )
+        return self.get(job_id)
+
+    def get_versions(self, job_ids: List[str]) -> Dict[str, int]:
+        if not job_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in job_ids)
+        rows = self._connect().execute(
+            f"SELECT job_id, COALESCE(version, 0) AS version FROM jobs WHERE job_id IN ({placeholders})",
+            list(job_ids),
+        )
+        return {row["job_id"]: row["version"] for row in rows}
+
+    def list_jobs(self, status: Optional[str] = None, limit: Optional[int] = None) -> List[Job]:
+        query = "SELECT * FROM jobs"
+        params: List[Any] = []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [self._decode(row) for row in self._connect().execute(query, params)]
+
+    def find_by_content_hash(self, content_hash: str, statuses: List[str]) -> Optional[Job]:
+        placeholders = ", ".join("?" for _ in statuses)
+        row = self._connect().execute(
+            f"SELECT * FROM jobs WHERE content_hash = ? AND status IN ({placeholders}) "
+            "ORDER BY created_at DESC LIMIT 1",
+            [content_hash, *statuses],
+        ).fetchone()
+        return self._decode(row) if row else None
+
+
+_store: Optional[JobStore] = None
+_store_lock = threading.Lock()
+
+# Called with the updated job after every update_job in this process
+_update_listeners: List[Callable[[Job], None]] = []
+
+
+def get_job_store() -> JobStore:
+    """Return the process-wide job store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.JOB_STORE == "memory":
+                    _store = MemoryJobStore()
+                elif settings.JOB_STORE == "sqlite":
+                    _store = SQLiteJobStore(settings.job_db_path)
+                    logger.info(f"Using SQLite job store at {settings.job_db_path}")
+                else:
+                    raise ValueError(f"Unknown job store: {settings.JOB_STORE}")
+    return _store
+
+
+def add_update_listener(listener: Callable[[Job], None]) -> None:
+    """Register a callback for job updates made in this process (may run on any thread)."""
+    _update_listeners.append(listener)
+
+
+def create_job(job_id: str, **fields: Any) -> Job:
+    return get_job_store().create(Job(job_id=job_id, **fields))
 
 
 def get_job(job_id: str) -> Optional[Job]:
-    return _jobs.get(job_id)
+    return get_job_store().get(job_id)
 
 
 def update_job(
-    job_id: str, 
-    *, 
-    status: Optional[str] = None, 
-    scene_url: Optional[str] = None, 
+    job_id: str,
+    *,
+    status: Optional[str] = None,
+    scene_url: Optional[str] = None,
     video_url: Optional[str] = None,
-    current_stage: Optional[str] = None
+    current_stage: Optional[str] = None,
+    stage_resources: Optional[Dict[str, Dict[str, Any]]] = None,
+    if_status: Optional[str] = None
 ) -> Optional[Job]:
-    job = _jobs.get(job_id)
-    if not job:
-        return None
+    """
+    Update a job's fields. With `if_status`, the update only applies while the
+    job still has that status, so e.g. a finishing run cannot overwrite a
+    cancellation; None is returned if it did not apply.
+    """
+    changes: Dict[str, Any] = {}
     if status is not None:
-        job.status = status
+        changes["status"] = status
     if scene_url is not None:
-        job.scene_url = scene_url
+        changes["scene_url"] = scene_url
     if video_url is not None:
-        job.video_url = video_url
+        changes["video_url"] = video_url
     if current_stage is not None:
-        job.current_stage = current_stage
+        changes["current_stage"] = current_stage
+    if stage_resources is not None:
+        changes["stage_resources"] = stage_resources
+    job = get_job_store().update(job_id, changes, if_status=if_status)
+    if job and changes:
+        _notify(job)
+    return job
+
+
+def _notify(job: Job) -> None:
+    for listener in _update_listeners:
+        try:
+            listener(job)
+        except Exception as e:
+            logger.warning(f"Job update listener failed for {job.job_id}: {e}")
+
+
+def record_stage_resources(job_id: str, stage_name: str, usage: Dict[str, Any]) -> Optional[Job]:
+    """Store the resource usage of one stage on the job, replacing an earlier run's."""
+    job = get_job_store().set_stage_resources(job_id, stage_name, usage)
+    if job:
+        _notify(job)
     return job
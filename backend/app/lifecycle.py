@@ -0,0 +1,118 @@
+"""
+Process lifecycle signals shared by the scheduler and the pipeline.
+
+When a process is asked to stop (SIGTERM on a worker, lifespan shutdown on
+the API), the scheduler stops claiming jobs and sets the drain flag.
+Running pipelines check the flag at stage boundaries: the stage in flight
+finishes and is journaled, then the pipeline raises PipelineInterrupted
+and the job goes back to the queue to resume elsewhere.
+
+Each run of a job in this process is tracked by a JobRun, bound to the
+running task through a context variable (which follows the pipeline into
+worker threads). Stage subprocesses register with the current run and are
+started in their own process group, so cancelling the run kills the whole
+group, and the next stage boundary raises JobCancelled.
+"""
+
+import logging
+import os
+import signal
+import threading
+from contextvars import ContextVar
+from typing import Any, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+_drain_requested = threading.Event()
+
+
+class PipelineInterrupted(Exception):
+    """Raised at a stage boundary when the process is draining."""
+
+
+class JobCancelled(PipelineInterrupted):
+    """Raised when the job's run was cancelled; the job must not be requeued."""
+
+
+class JobRun:
+    """One execution of a job in this process and the subprocesses it started."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.cancelled = False
+        self._processes: Set[Any] = set()
+        self._lock = threading.Lock()
+
+    def register_process(self, process: Any) -> None:
+        """Track a subprocess started in its own process group; killed at once if already cancelled."""
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self.cancelled
+        if cancelled:
+            kill_process_group(process)
+
+    def unregister_process(self, process: Any) -> None:
+        with self._lock:
+            self._processes.discard(process)
+
+    def cancel(self) -> None:
+        """Mark the run cancelled and kill the process groups of its running subprocesses."""
+        with self._lock:
+            self.cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            kill_process_group(process)
+
+
+_current_run: ContextVar[Optional[JobRun]] = ContextVar("current_run", default=None)
+
+
+def bind_run(run: JobRun) -> None:
+    """Make `run` the current run for this task (and threads it starts)."""
+    _current_run.set(run)
+
+
+def current_run() -> Optional[JobRun]:
+    return _current_run.get()
+
+
+def kill_process_group(process: Any) -> None:
+    """
+    SIGKILL a subprocess started with start_new_session=True, and all its
+    children. The group is signalled even if the subprocess itself has
+    exited: children it left behind may still run and hold its pipes.
+    """
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        elif getattr(process, "returncode", None) is None:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to kill process group {process.pid}: {e}")
+
+
+def request_drain() -> None:
+    _drain_requested.set()
+
+
+def drain_requested() -> bool:
+    return _drain_requested.is_set()
+
+
+def check_cancelled(stage_name: str) -> None:
+    """Raise JobCancelled if the current run was cancelled."""
+    run = _current_run.get()
+    if run is not None and run.cancelled:
+        raise JobCancelled(f"Job {run.job_id} cancelled; stopped before stage {stage_name}")
+
+
+def check_drain(stage_name: str) -> None:
+    """
+    Raise JobCancelled if the current run was cancelled, or
+    PipelineInterrupted if a drain was requested; call between stages.
+    """
+    check_cancelled(stage_name)
+    if _drain_requested.is_set():
+        raise PipelineInterrupted(f"Process draining; stopped before stage {stage_name}")
@@ -1,22 +1,60 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from dataclasses import replace
 from pathlib import Path
+from typing import Optional
 from uuid import uuid4
+import asyncio
 import logging
 import json
 
 from . import schemas
-from .jobs import create_job, get_job
-from .worker import process_job
+from .jobs import Job, create_job, get_job, get_job_store, update_job
+from .metrics import get_stage_metrics
+from .job_events import TERMINAL_STATUSES, get_job_event_bus
+from .scheduler import get_scheduler
+from .uploads import (
+    ResumableUploads,
+    UploadGone,
+    UploadSession,
+    UploadSizeLimitMiddleware,
+    UploadTooLarge,
+    max_convert_body_bytes,
+    remove_uploads,
+    save_upload,
+)
+from .recovery import recover_jobs
 from .config import settings
+from .services.stage_journal import StageJournal
+from .services.job_logs import JobLogs
+from .services.stage_workers import get_stage_worker_pool
+from .services.stage_pools import get_stage_pools
+from .services.fingerprint import submission_fingerprint
+from .services.preprocessing_pipeline import PIPELINE_STAGES
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Plan2Scene Web Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.WORKER_MODE == "inline":
+        scheduler = get_scheduler()
+        await asyncio.to_thread(recover_jobs, scheduler)
+        scheduler.start()
+    yield
+    if settings.WORKER_MODE == "inline":
+        await get_scheduler().drain(settings.DRAIN_TIMEOUT)
+        pool = get_stage_worker_pool()
+        if pool is not None:
+            await pool.shutdown()
+
+
+app = FastAPI(title="Plan2Scene Web Backend", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -27,14 +65,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads while the body is still streaming
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_bytes=max_convert_body_bytes(settings.MAX_UPLOAD_BYTES, settings.MAX_ANNOTATION_BYTES),
+    paths=["/api/convert"],
+)
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_DIR = BASE_DIR / settings.UPLOAD_DIR
 STATIC_DIR = BASE_DIR / "static"
-JOBS_STATIC_DIR = BASE_DIR / settings.JOBS_DIR
+JOBS_STATIC_DIR = settings.jobs_dir
 
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 JOBS_STATIC_DIR.mkdir(parents=True, exist_ok=True)
 
+resumable_uploads = ResumableUploads(UPLOAD_DIR / "partial", ttl=settings.UPLOAD_SESSION_TTL)
+
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
 
@@ -53,11 +100,26 @@ def get_config():
     }
 
 
+@app.get("/api/scheduler")
+def get_scheduler_stats():
+    """Return pipeline slot usage and pending queue length."""
+    return get_scheduler().stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Per-stage resource totals, scheduler and stage pool gauges in Prometheus text format."""
+    return PlainTextResponse(
+        get_stage_metrics().render(get_scheduler().stats(), get_stage_pools().stats()),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
 @app.post("/api/convert", response_model=schemas.JobCreateResponse)
 async def create_conversion_job(
-    background_tasks: BackgroundTasks, 
     file: UploadFile = File(...),
-    r2v_annotation: UploadFile = File(None)
+    r2v_annotation: UploadFile = File(None),
+    priority: int = Form(0)
 ):
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Only image uploads are supported.")
@@ -65,52 +127,407 @@ async def create_conversion_job(
     job_id = uuid4().hex
     upload_path = UPLOAD_DIR / f"{job_id}_{file.filename}"
 
-    # Save floorplan image file
-    contents = await file.read()
-    upload_path.write_bytes(contents)
+    # Save floorplan image file, hashing it as it is written
+    image_sha256 = await save_upload(file, upload_path, settings.MAX_UPLOAD_BYTES)
 
     # Save R2V annotation file if provided
     r2v_path = None
+    r2v_sha256 = None
     if r2v_annotation and r2v_annotation.filename:
         r2v_path = UPLOAD_DIR / f"{job_id}_r2v_annotation.txt"
-        r2v_contents = await r2v_annotation.read()
-        r2v_path.write_bytes(r2v_contents)
+        try:
+            r2v_sha256 = await save_upload(r2v_annotation, r2v_path, settings.MAX_ANNOTATION_BYTES)
+        except UploadTooLarge:
+            remove_uploads([upload_path])
+            raise
         logger.info(f"R2V annotation file saved: {r2v_path}")
 
+    return await _submit_conversion(job_id, upload_path, r2v_path, image_sha256, r2v_sha256, priority)
+
+
+async def _submit_conversion(
+    job_id: str,
+    upload_path: Path,
+    r2v_path: Optional[Path],
+    image_sha256: str,
+    r2v_sha256: Optional[str],
+    priority: int,
+) -> schemas.JobCreateResponse:
+    """Create and queue a job for saved uploads, or return an identical earlier job."""
+    content_hash = await asyncio.to_thread(submission_fingerprint, image_sha256, r2v_sha256)
+
+    # Identical inputs under the same pipeline identity: follow the earlier job's result
+    # under a job id of our own, so cancel and retry never act on another submitter's job
+    if settings.DEDUP_ENABLED:
+        existing = await asyncio.to_thread(
+            get_job_store().find_by_content_hash, content_hash, ["done", "processing"]
+        )
+        if existing:
+            remove_uploads([upload_path, r2v_path])
+            await asyncio.to_thread(
+                create_job,
+                job_id,
+                status=existing.status,
+                current_stage=existing.current_stage,
+                priority=priority,
+                alias_of=existing.job_id,
+            )
+            logger.info(f"Submission {job_id} matches job {existing.job_id} ({existing.status}); not rerunning")
+            return schemas.JobCreateResponse(
+                job_id=job_id,
+                status=existing.status,
+                deduplicated=True,
+            )
+
     # Create job entry
-    create_job(job_id)
+    await asyncio.to_thread(
+        create_job,
+        job_id,
+        current_stage="queued",
+        upload_path=str(upload_path),
+        r2v_path=str(r2v_path) if r2v_path else None,
+        priority=priority,
+        content_hash=content_hash,
+    )
 
-    # Dispatch background task
+    # Queue for a pipeline slot
     job_output_dir = JOBS_STATIC_DIR / job_id
     job_output_dir.mkdir(parents=True, exist_ok=True)
     
-    background_tasks.add_task(process_job, job_id, upload_path, job_output_dir, r2v_path)
+    await get_scheduler().submit(job_id, upload_path, job_output_dir, r2v_path, priority=priority)
 
     return schemas.JobCreateResponse(job_id=job_id, status="processing")
 
 
+def _upload_status(session: UploadSession) -> schemas.UploadStatusResponse:
+    return schemas.UploadStatusResponse(
+        upload_id=session.upload_id,
+        filename=session.filename,
+        kind=session.kind,
+        size=session.size,
+        offset=session.offset,
+        complete=session.complete,
+    )
+
+
+def _get_upload_session(upload_id: str) -> UploadSession:
+    session = resumable_uploads.get(upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+@app.post("/api/uploads", response_model=schemas.UploadStatusResponse, status_code=201)
+async def create_upload(request: schemas.UploadCreateRequest):
+    """
+    Start a resumable upload. Send the file with PATCH /api/uploads/{id}
+    (header `Upload-Offset`), then turn it into a job with
+    POST /api/uploads/{id}/finalize.
+    """
+    limits = {"floorplan": settings.MAX_UPLOAD_BYTES, "annotation": settings.MAX_ANNOTATION_BYTES}
+    if request.kind not in limits:
+        raise HTTPException(status_code=400, detail="kind must be 'floorplan' or 'annotation'.")
+    if request.kind == "floorplan" and request.content_type and not request.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Only image uploads are supported.")
+    if request.size < 0:
+        raise HTTPException(status_code=400, detail="size must be non-negative.")
+    if request.size > limits[request.kind]:
+        raise UploadTooLarge(limits[request.kind])
+
+    session = await asyncio.to_thread(
+        resumable_uploads.create, request.filename, request.kind, request.size, request.content_type
+    )
+    return _upload_status(session)
+
+
+@app.get("/api/uploads/{upload_id}", response_model=schemas.UploadStatusResponse)
+async def get_upload(upload_id: str):
+    """Return the current offset of a resumable upload, to resume after a dropped connection."""
+    return _upload_status(_get_upload_session(upload_id))
+
+
+@app.patch("/api/uploads/{upload_id}", response_model=schemas.UploadStatusResponse)
+async def append_upload_chunk(upload_id: str, request: Request, upload_offset: int = Header(...)):
+    """Append the raw request body to the upload at `Upload-Offset`; returns the new offset."""
+    session = _get_upload_session(upload_id)
+    await resumable_uploads.append(session, upload_offset, request.stream())
+    return _upload_status(session)
+
+
+@app.post("/api/uploads/{upload_id}/finalize", response_model=schemas.JobCreateResponse)
+async def finalize_upload(upload_id: str, request: schemas.UploadFinalizeRequest):
+    """Create a conversion job from a completed floorplan upload (and optional annotation upload)."""
+    session = _get_upload_session(upload_id)
+    annotation = _get_upload_session(request.annotation_upload_id) if request.annotation_upload_id else None
+    if session.kind != "floorplan" or (annotation and annotation.kind != "annotation"):
+        raise HTTPException(status_code=400, detail="Expected a floorplan upload and an annotation upload.")
+    for pending in (session, annotation):
+        if pending and not pending.complete:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload {pending.upload_id} is incomplete ({pending.offset}/{pending.size} bytes).",
+            )
+
+    job_id = uuid4().hex
+    upload_path = UPLOAD_DIR / f"{job_id}_{session.filename}"
+    image_sha256 = await resumable_uploads.finalize(session, upload_path)
+
+    r2v_path = None
+    r2v_sha256 = None
+    if annotation:
+        r2v_path = UPLOAD_DIR / f"{job_id}_r2v_annotation.txt"
+        try:
+            r2v_sha256 = await resumable_uploads.finalize(annotation, r2v_path)
+        except UploadGone:
+            remove_uploads([upload_path])
+            raise
+
+    return await _submit_conversion(job_id, upload_path, r2v_path, image_sha256, r2v_sha256, request.priority)
+
+
+def _followed_job_id(job: Job) -> str:
+    """The job whose progress `job` reports: the shared job for a deduplicated submission."""
+    if job.alias_of and job.status != "cancelled":
+        return job.alias_of
+    return job.job_id
+
+
+def _job_dir(job: Job) -> Path:
+    """Output directory holding `job`'s results and logs."""
+    return JOBS_STATIC_DIR / (job.alias_of or job.job_id)
+
+
+async def _job_status(job: Job, followed: Optional[Job] = None) -> schemas.JobStatusResponse:
+    """
+    Status of `job`. A deduplicated submission reports the shared job's state
+    (`followed`, read from the store if omitted) until it is cancelled; its
+    version adds both jobs' versions so it still only ever increases.
+    """
+    view = job
+    if job.alias_of:
+        target = followed or await asyncio.to_thread(get_job, job.alias_of)
+        if target is not None:
+            version = target.version + job.version
+            view = replace(job, version=version) if job.status == "cancelled" else replace(target, version=version)
+    elif followed is not None:
+        view = followed
+    return schemas.JobStatusResponse(
+        job_id=job.job_id,
+        status=view.status,
+        scene_url=view.scene_url,
+        video_url=view.video_url,
+        current_stage=view.current_stage,
+        queue_position=await get_scheduler().queue_position(_followed_job_id(job)),
+        version=view.version,
+        stage_resources=view.stage_resources,
+    )
+
+
+def _job_etag(status: schemas.JobStatusResponse) -> str:
+    # Queue position moves without a job update, so it is part of the tag while queued
+    if status.queue_position is not None:
+        return f'"{status.version}.{status.queue_position}"'
+    return f'"{status.version}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
 @app.get("/api/jobs/{job_id}", response_model=schemas.JobStatusResponse)
-async def get_job_status(job_id: str):
-    job = get_job(job_id)
+async def get_job_status(
+    job_id: str,
+    response: Response,
+    wait: float = 0,
+    since_version: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Job status with an ETag; `If-None-Match` with the current tag returns 304.
+
+    With `wait=N`, the request is held for up to N seconds (capped at
+    LONG_POLL_MAX_WAIT) until the job's version exceeds `since_version`,
+    or changes from the version in `If-None-Match` if `since_version` is
+    omitted.
+    """
+    job = await asyncio.to_thread(get_job, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return schemas.JobStatusResponse(
-        job_id=job.job_id,
-        status=job.status,
-        scene_url=job.scene_url,
-        video_url=job.video_url,
-        current_stage=job.current_stage,
+    status = await _job_status(job)
+    etag = _job_etag(status)
+
+    if wait > 0 and status.status not in TERMINAL_STATUSES:
+        if since_version is None and _etag_matches(if_none_match, etag):
+            since_version = status.version
+        if since_version is not None and status.version <= since_version:
+            # A deduplicated submission waits on the shared job, whose version excludes its own
+            followed_id = _followed_job_id(job)
+            offset = job.version if followed_id != job_id else 0
+            async with get_job_event_bus().subscribe(followed_id) as subscription:
+                changed = await subscription.wait(since_version - offset, min(wait, settings.LONG_POLL_MAX_WAIT))
+            if changed:
+                status = await _job_status(job, changed)
+                etag = _job_etag(status)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return status
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Server-sent events for a job: a `job` event with the full status on
+    connect and after every change, until the job reaches a terminal status.
+    """
+    job = await asyncio.to_thread(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        nonlocal job
+        async with get_job_event_bus().subscribe(_followed_job_id(job)) as subscription:
+            version = -1
+            while not await request.is_disconnected():
+                followed = await subscription.wait(version, settings.SSE_KEEPALIVE_INTERVAL)
+                if followed is None:
+                    if job.alias_of:
+                        # Cancelling a deduplicated submission only updates its own record
+                        job = await asyncio.to_thread(get_job, job_id) or job
+                        if job.status == "cancelled":
+                            status = await _job_status(job)
+                            yield f"event: job\nid: {status.version}\ndata: {status.model_dump_json()}\n\n"
+                            break
+                    yield ": keepalive\n\n"
+                    continue
+                version = followed.version
+                status = await _job_status(job, followed)
+                yield f"event: job\nid: {status.version}\ndata: {status.model_dump_json()}\n\n"
+                if status.status in TERMINAL_STATUSES:
+                    break
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
+@app.get("/api/jobs/{job_id}/logs", response_model=schemas.JobLogResponse)
+async def get_job_logs(job_id: str, stage: Optional[str] = None, offset: int = 0, limit: int = 65536):
+    """
+    List a job's stage logs, or with `stage`, read up to `limit` bytes of
+    that stage's log from byte `offset`. Poll with the returned
+    `next_offset` to follow a running stage.
+    """
+    job = await asyncio.to_thread(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    logs = JobLogs.for_job_dir(_job_dir(job))
+    stages = await asyncio.to_thread(logs.list_stages)
+    response = schemas.JobLogResponse(job_id=job_id, stages=stages)
+    if stage is None:
+        return response
+
+    limit = max(1, min(limit, 1024 * 1024))
+    try:
+        data, next_offset, reset = await asyncio.to_thread(logs.read, stage, max(offset, 0), limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid stage name")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"No log for stage {stage}")
+    response.stage = stage
+    response.offset = 0 if reset else max(offset, 0)
+    response.next_offset = next_offset
+    response.data = data
+    response.reset = reset
+    return response
+
+
+@app.delete("/api/jobs/{job_id}", response_model=schemas.JobStatusResponse)
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running job. A run in this process is stopped at once
+    (its stage subprocesses are killed and the slot freed); a run in another
+    process stops at that worker's next heartbeat. Cancelling a deduplicated
+    submission only stops it following the shared job, which keeps running.
+    """
+    job = await asyncio.to_thread(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    status = await _job_status(job)
+    if status.status in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job is already {status.status}")
+
+    if job.alias_of:
+        job = await asyncio.to_thread(update_job, job_id, status="cancelled")
+        logger.info(f"Job {job_id} cancelled; no longer following job {job.alias_of}")
+        return await _job_status(job)
+    job = await asyncio.to_thread(update_job, job_id, status="cancelled", if_status="processing")
+    if not job:
+        raise HTTPException(status_code=409, detail="Job finished before it could be cancelled")
+    await get_scheduler().cancel(job_id)
+    logger.info(f"Job {job_id} cancelled")
+    return await _job_status(job)
+
+
+@app.post("/api/jobs/{job_id}/retry", response_model=schemas.JobRetryResponse)
+async def retry_job(job_id: str):
+    """
+    Re-queue a failed or cancelled job. Stages recorded in the job's stage journal are
+    skipped, so the pipeline resumes from the first incomplete stage. A cancelled job
+    whose run has not stopped yet (409) must be retried again later.
+    """
+    job = await asyncio.to_thread(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.alias_of:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job was deduplicated onto job {job.alias_of}; submit the inputs again to rerun",
+        )
+    if job.status not in ("failed", "cancelled"):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Only failed or cancelled jobs can be retried (status: {job.status})",
+        )
+    if not job.upload_path:
+        raise HTTPException(status_code=409, detail="Job has no recorded inputs to retry from")
+    if await asyncio.to_thread(get_scheduler().queue.contains, job_id):
+        # A cancelled run in another worker keeps writing until its next heartbeat
+        raise HTTPException(status_code=409, detail="Job is still stopping; retry once its run has ended")
+
+    job_output_dir = JOBS_STATIC_DIR / job_id
+    journal = StageJournal.for_job_dir(job_output_dir)
+    resume_from = await asyncio.to_thread(journal.first_incomplete, ["convert_r2v"] + PIPELINE_STAGES)
+
+    await asyncio.to_thread(update_job, job_id, status="processing", current_stage="queued")
+    await get_scheduler().submit(
+        job_id,
+        Path(job.upload_path),
+        job_output_dir,
+        Path(job.r2v_path) if job.r2v_path else None,
+        priority=job.priority,
+    )
+    logger.info(f"Job {job_id} retried, resuming from {resume_from}")
+
+    return schemas.JobRetryResponse(job_id=job_id, status="processing", resume_from=resume_from)
+
+
 @app.get("/api/jobs/{job_id}/download/walkthrough")
 async def download_walkthrough(job_id: str):
-    job = get_job(job_id)
+    job = await asyncio.to_thread(get_job, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    video_path = JOBS_STATIC_DIR / job_id / "walkthrough.mp4"
+    video_path = _job_dir(job) / "walkthrough.mp4"
     if not video_path.exists():
         raise HTTPException(status_code=404, detail="Video not found")
     
@@ -124,11 +541,11 @@ async def download_walkthrough(job_id: str):
 
 @app.get("/api/jobs/{job_id}/download/scene")
 async def download_scene(job_id: str):
-    job = get_job(job_id)
+    job = await asyncio.to_thread(get_job, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    model_path = JOBS_STATIC_DIR / job_id / "scene.glb"
+    model_path = _job_dir(job) / "scene.glb"
     if not model_path.exists():
         raise HTTPException(status_code=404, detail="Model not found")
     
@@ -146,10 +563,12 @@ def get_job_scene_preview(job_id: str) -> schemas.ScenePreviewResponse:
     Return a simplified, frontend-friendly representation of the Plan2Scene output
     for a given job. This does NOT expose textures, just room polygons + heights.
     """
-    job_dir = JOBS_STATIC_DIR / job_id
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
     
     scene_path = (
-        job_dir
+        _job_dir(job)
         / "plan2scene_data"
         / "processed"
         / "vgg_crop_select"
@@ -0,0 +1,128 @@
+"""
+Pipeline metrics.
+
+Stage resource usage is summed per stage in the `stage_metrics` table of the
+shared job database, so the totals cover every worker process on the host
+and survive restarts. GET /metrics renders them, together with scheduler
+slot usage, in the Prometheus text exposition format.
+"""
+
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.db import SQLiteDatabase
+from app.jobs import record_stage_resources
+
+logger = logging.getLogger(__name__)
+
+# Counters summed over runs: (column, metric name, help text)
+_COUNTERS = [
+    ("runs", "plan2scene_stage_runs_total", "Stage commands run"),
+    ("failures", "plan2scene_stage_failures_total", "Stage commands that failed or timed out"),
+    ("wall_seconds", "plan2scene_stage_wall_seconds_total", "Wall-clock time spent in stage commands"),
+    ("user_cpu_seconds", "plan2scene_stage_user_cpu_seconds_total", "User CPU time of stage process trees"),
+    ("sys_cpu_seconds", "plan2scene_stage_sys_cpu_seconds_total", "System CPU time of stage process trees"),
+    ("read_bytes", "plan2scene_stage_read_bytes_total", "Bytes stage process trees read from storage"),
+    ("write_bytes", "plan2scene_stage_write_bytes_total", "Bytes stage process trees wrote to storage"),
+]
+
+# Gauges kept as the maximum over runs
+_PEAKS = [
+    ("max_rss_bytes", "plan2scene_stage_max_rss_bytes", "Largest single-process RSS seen for a stage"),
+    ("peak_tree_rss_bytes", "plan2scene_stage_peak_tree_rss_bytes", "Largest combined RSS of a stage's process group"),
+]
+
+
+class StageMetrics:
+    """Per-stage resource totals in the shared SQLite database."""
+
+    def __init__(self, db_path: Path):
+        self.db = SQLiteDatabase(db_path)
+        self._init_schema()
+
+    def _init_schema(self):
+        columns = [name for name, _, _ in _COUNTERS + _PEAKS]
+        self.db.connect().execute(
+            "CREATE TABLE IF NOT EXISTS stage_metrics (stage TEXT PRIMARY KEY, "
+            + ", ".join(f"{name} REAL NOT NULL DEFAULT 0" for name in columns)
+            + ")"
+        )
+
+    def record(self, stage_name: str, usage: Dict[str, Any], failed: bool = False) -> None:
+        """Add one stage run to the totals."""
+        values = {name: float(usage.get(name) or 0) for name, _, _ in _COUNTERS + _PEAKS}
+        values["runs"] = 1
+        values["failures"] = 1 if failed else 0
+        names = list(values)
+        updates = [f"{name} = {name} + excluded.{name}" for name, _, _ in _COUNTERS]
+        updates += [f"{name} = MAX({name}, excluded.{name})" for name, _, _ in _PEAKS]
+        self.db.connect().execute(
+            f"INSERT INTO stage_metrics (stage, {', '.join(names)}) "
+            f"VALUES (?, {', '.join('?' for _ in names)}) "
+            f"ON CONFLICT(stage) DO UPDATE SET {', '.join(updates)}",
+            [stage_name, *values.values()],
+        )
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        rows = self.db.connect().execute("SELECT * FROM stage_metrics ORDER BY stage")
+        return {row["stage"]: {key: row[key] for key in row.keys() if key != "stage"} for row in rows}
+
+    def render(
+        self,
+        scheduler_stats: Optional[Dict[str, Any]] = None,
+        pool_stats: Optional[Dict[str, Dict[str, int]]] = None
+    ) -> str:
+        """Prometheus text exposition of the stage totals, scheduler and stage pool gauges."""
+        stages = self.snapshot()
+        lines: List[str] = []
+        for kind, metrics in (("counter", _COUNTERS), ("gauge", _PEAKS)):
+            for column, name, help_text in metrics:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for stage_name, values in stages.items():
+                    lines.append(f'{name}{{stage="{stage_name}"}} {_format(values[column])}')
+        if scheduler_stats:
+            for key, value in sorted(scheduler_stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"plan2scene_scheduler_{key}"
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name} {_format(value)}")
+        if pool_stats:
+            for key in ("size", "in_use", "waiting"):
+                name = f"plan2scene_stage_pool_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                for resource_class, values in sorted(pool_stats.items()):
+                    lines.append(f'{name}{{class="{resource_class}"}} {_format(values[key])}')
+        return "\n".join(lines) + "\n"
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+_metrics: Optional[StageMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_stage_metrics() -> StageMetrics:
+    """Return the process-wide stage metrics, creating the table on first use."""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = StageMetrics(settings.job_db_path)
+    return _metrics
+
+
+def record_stage_usage(job_id: Optional[str], stage_name: str, usage: Dict[str, Any], failed: bool = False) -> None:
+    """Store a stage's resource usage on its job and add it to the stage totals."""
+    try:
+        if job_id:
+            record_stage_resources(job_id, stage_name, usage)
+        get_stage_metrics().record(stage_name, usage, failed=failed)
+    except Exception as e:
+        # Accounting must never fail a pipeline
+        logger.warning(f"Could not record resource usage for stage {stage_name}: {e}")
@@ -0,0 +1,139 @@
+"""
+Startup crash recovery.
+
+Run once when an API (inline mode) or worker process starts, before it
+begins claiming jobs:
+
+1. Leases held by dead processes on this host are released immediately
+   instead of waiting for QUEUE_LEASE_TTL.
+2. Jobs still marked "processing" that have no queue row (their process died
+   before the queue existed or the row was lost) are re-enqueued.
+
+Before a job is re-enqueued its stage journal is reconciled with the stage
+output directories, so stages that finished but were never journaled are
+skipped when it resumes.
+"""
+
+import logging
+import os
+import socket
+from pathlib import Path
+from typing import List, Optional
+
+from app.config import settings
+from app.jobs import Job, get_job_store, update_job
+from app.scheduler import JobScheduler, current_pipeline_mode
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_is_dead(worker_id: Optional[str]) -> bool:
+    """True if `worker_id` is a host:pid on this host whose process no longer exists."""
+    if not worker_id or ":" not in worker_id:
+        return False
+    host, _, pid = worker_id.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+def reconcile_journal(job: Job, job_dir: Path) -> List[str]:
+    """
+    Record stages whose outputs exist on disk but are missing from the job's
+    stage journal. Only applies to the full GPU pipeline.
+
+    Returns:
+        Names of stages added to the journal
+    """
+    if settings.MODE != "gpu" or settings.PIPELINE_MODE != "full":
+        return []
+
+    from app.services.preprocessing_pipeline import Plan2ScenePreprocessor, STAGE_JOB_LABELS
+    from app.services.r2v_converter import extract_house_id_from_scene_json
+    from app.services.stage_journal import StageJournal
+
+    journal = StageJournal.for_job_dir(job_dir)
+    added: List[str] = []
+
+    scene_json = (journal.get("convert_r2v") or {}).get("outputs", {}).get("scene_json")
+    if not scene_json or not Path(scene_json).exists():
+        candidates = sorted((job_dir / "r2v_conversion").glob("*.scene.json"))
+        if not candidates or job.current_stage == "convert_r2v":
+            return added
+        scene_json = str(candidates[0])
+        journal.record("convert_r2v", output_dir=job_dir / "r2v_conversion", scene_json=scene_json)
+        added.append("convert_r2v")
+
+    house_id = extract_house_id_from_scene_json(Path(scene_json))
+    interrupted_stage = next(
+        (name for name, label in STAGE_JOB_LABELS.items() if label == job.current_stage),
+        None,
+    )
+    preprocessor = Plan2ScenePreprocessor(data_root=job_dir / "plan2scene_data")
+    for stage_name, output_dir in preprocessor.detect_completed_stages(
+        house_id, interrupted_stage=interrupted_stage
+    ).items():
+        if not journal.is_complete(stage_name):
+            journal.record(stage_name, output_dir=output_dir, recovered=True)
+            added.append(stage_name)
+    return added
+
+
+def recover_jobs(scheduler: JobScheduler) -> List[str]:
+    """
+    Re-enqueue jobs orphaned by a crash or restart.
+
+    Returns:
+        Ids of jobs that were returned to the queue
+    """
+    queue = scheduler.queue
+    recovered: List[str] = []
+
+    for worker_id in queue.running_workers():
+        if _worker_is_dead(worker_id):
+            job_ids = queue.release_worker(worker_id)
+            for job_id in job_ids:
+                update_job(job_id, current_stage="queued")
+            recovered.extend(job_ids)
+            logger.warning(f"Released {len(job_ids)} job(s) leased by dead worker {worker_id}")
+
+    jobs_dir = settings.jobs_dir
+    for job in get_job_store().list_jobs(status="processing"):
+        if job.alias_of or queue.contains(job.job_id):
+            continue  # Deduplicated submissions follow another job and never run
+        if not job.upload_path:
+            logger.error(f"Job {job.job_id} was interrupted and has no recorded inputs; marking failed")
+            update_job(job.job_id, status="failed")
+            continue
+
+        job_dir = jobs_dir / job.job_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            added = reconcile_journal(job, job_dir)
+            if added:
+                logger.info(f"Job {job.job_id}: recovered completed stages from disk: {added}")
+        except Exception as e:
+            logger.warning(f"Job {job.job_id}: could not reconcile stage journal: {e}")
+
+        requeued = queue.enqueue(
+            job.job_id,
+            current_pipeline_mode(),
+            Path(job.upload_path),
+            job_dir,
+            Path(job.r2v_path) if job.r2v_path else None,
+            priority=job.priority,
+            replace=False,
+        )
+        if requeued:
+            update_job(job.job_id, current_stage="queued")
+            recovered.append(job.job_id)
+            logger.warning(f"Job {job.job_id} was orphaned by a restart; re-enqueued")
+
+    scheduler.wake()
+    return recovered
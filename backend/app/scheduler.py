@@ -0,0 +1,315 @@
+"""
+Bounded job scheduler.
+
+The API submits jobs to the durable JobQueue; a JobScheduler consumes the
+queue, running at most PIPELINE_SLOTS pipelines per process. It runs inside
+the API process when WORKER_MODE=inline, or in dedicated worker daemons
+(`python -m app.worker`) when WORKER_MODE=external, in which case the API
+only enqueues and answers status calls.
+
+Each claimed job is held under a lease that the scheduler renews every
+heartbeat interval. If a renewal fails the job has been handed to another
+worker, so the local run is cancelled; expired leases of dead workers are
+returned to the queue by whichever scheduler notices them first.
+
+Queue and job-store calls are blocking SQLite writes that can wait up to
+the busy timeout while external workers hold the write lock, so they run
+in worker threads rather than on the event loop that also serves requests.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from app.config import settings
+from app.job_queue import JobQueue, QueueEntry, get_job_queue
+from app.jobs import update_job
+from app.lifecycle import JobCancelled, JobRun, PipelineInterrupted, bind_run, request_drain
+
+logger = logging.getLogger(__name__)
+
+JobRunner = Callable[..., Awaitable[None]]
+
+
+def current_pipeline_mode() -> str:
+    """Return the slot class for jobs submitted by this process: demo or gpu."""
+    return "demo" if settings.MODE == "demo" else "gpu"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobScheduler:
+    """
+    Claims jobs from the queue while local slots are free and runs them.
+
+    Higher priority values are dispatched first; equal priorities run in
+    submission order. Per-mode limits apply across every process sharing
+    the queue.
+    """
+
+    def __init__(
+        self,
+        runner: JobRunner,
+        queue: JobQueue,
+        total_slots: int,
+        mode_limits: Optional[Dict[str, int]] = None,
+        worker_id: Optional[str] = None,
+        poll_interval: float = 1.0,
+        heartbeat_interval: float = 10.0
+    ):
+        self.runner = runner
+        self.queue = queue
+        self.total_slots = max(1, total_slots)
+        self.mode_limits = mode_limits or {}
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self._running: Dict[str, asyncio.Task] = {}
+        self._leases: Dict[str, str] = {}
+        self._runs: Dict[str, JobRun] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._settling: Set[asyncio.Task] = set()
+
+    async def submit(
+        self,
+        job_id: str,
+        upload_path: Path,
+        output_dir: Path,
+        r2v_path: Optional[Path] = None,
+        priority: int = 0,
+        mode: Optional[str] = None
+    ) -> None:
+        """Enqueue a job; a local consumer (if running) is woken immediately."""
+        mode = mode or current_pipeline_mode()
+        await asyncio.to_thread(self.queue.enqueue, job_id, mode, upload_path, output_dir, r2v_path, priority=priority)
+        logger.info(f"Job {job_id} queued (priority={priority}, mode={mode})")
+        self.wake()
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def queue_position(self, job_id: str) -> Optional[int]:
+        """Return the 1-based position of a pending job, or None if it is not queued."""
+        return await asyncio.to_thread(self.queue.position, job_id)
+
+    def stats(self) -> dict:
+        return {
+            **self.queue.stats(),
+            "local_running": len(self._running),
+            "total_slots": self.total_slots,
+            "mode_limits": dict(self.mode_limits),
+        }
+
+    def start(self) -> None:
+        """Start consuming the queue on the current event loop."""
+        if self._loop_task is None:
+            self._wakeup = asyncio.Event()
+            self._loop_task = asyncio.create_task(self.run())
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+            logger.info(f"Scheduler {self.worker_id} consuming queue with {self.total_slots} slots")
+
+    async def run(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while True:
+            await self._reap_expired()
+            await self._dispatch()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _reap_expired(self) -> None:
+        """Return jobs whose worker stopped heartbeating to the queue."""
+        try:
+            requeued, abandoned = await asyncio.to_thread(self.queue.requeue_expired)
+        except Exception as e:
+            logger.error(f"Failed to reap expired leases: {e}")
+            return
+        for job_id in requeued:
+            await asyncio.to_thread(update_job, job_id, current_stage="queued")
+        for job_id in abandoned:
+            await asyncio.to_thread(update_job, job_id, status="failed", if_status="processing")
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            for job_id, token in list(self._leases.items()):
+                if self._leases.get(job_id) != token:
+                    continue  # Finished while earlier heartbeats were in flight
+                try:
+                    alive = await asyncio.to_thread(self.queue.heartbeat, job_id, token)
+                except Exception as e:
+                    # Transient database error: keep running, the lease has slack
+                    logger.error(f"Heartbeat for job {job_id} failed: {e}")
+                    continue
+                if not alive and self._leases.get(job_id) == token:
+                    # Lease expired or the job was cancelled; completing with the old token
+                    # afterwards only removes a cancelled row, never another worker's lease
+                    logger.error(f"Lost lease on job {job_id}; cancelling local run")
+                    self._abort(job_id)
+
+    def _abort(self, job_id: str) -> bool:
+        """Kill a local run's subprocesses and cancel its task, freeing the slot."""
+        run = self._runs.get(job_id)
+        task = self._running.get(job_id)
+        if run is not None:
+            run.cancel()
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Remove a job from the queue and stop it if it runs in this process.
+        A run in another process stops at that worker's next heartbeat.
+
+        Returns:
+            True if a local run was stopped
+        """
+        try:
+            await asyncio.to_thread(self.queue.remove, job_id)
+        except Exception as e:
+            logger.error(f"Failed to remove job {job_id} from queue: {e}")
+        stopped = self._abort(job_id)
+        if stopped:
+            logger.info(f"Job {job_id} cancelled; slot freed")
+        self.wake()
+        return stopped
+
+    async def _dispatch(self) -> None:
+        """Claim and start jobs until local slots are full or the queue is drained."""
+        while len(self._running) < self.total_slots:
+            try:
+                entry = await asyncio.to_thread(self.queue.claim, self.worker_id, self.mode_limits)
+            except Exception as e:
+                logger.error(f"Failed to claim job from queue: {e}")
+                return
+            if entry is None:
+                return
+            self._start(entry)
+
+    async def _run(self, run: JobRun, entry: QueueEntry) -> None:
+        bind_run(run)
+        await self.runner(entry.job_id, entry.upload_path, entry.output_dir, entry.r2v_path)
+
+    def _start(self, entry: QueueEntry) -> None:
+        run = JobRun(entry.job_id)
+        task = asyncio.create_task(self._run(run, entry))
+        self._runs[entry.job_id] = run
+        self._running[entry.job_id] = task
+        self._leases[entry.job_id] = entry.lease_token
+        task.add_done_callback(lambda t, job_id=entry.job_id: self._finished(job_id, t))
+        logger.info(f"Job {entry.job_id} started ({len(self._running)}/{self.total_slots} slots in use)")
+
+    def _finished(self, job_id: str, task: asyncio.Task) -> None:
+        self._running.pop(job_id, None)
+        run = self._runs.pop(job_id, None)
+        token = self._leases.pop(job_id, None)
+        if token is None:
+            # Lease already lost; the job now belongs to another worker
+            self.wake()
+            return
+        interrupted = (run is None or not run.cancelled) and (
+            task.cancelled() or (
+                isinstance(task.exception(), PipelineInterrupted)
+                and not isinstance(task.exception(), JobCancelled)
+            )
+        )
+        settle = asyncio.ensure_future(self._settle(job_id, token, interrupted))
+        self._settling.add(settle)
+        settle.add_done_callback(self._settling.discard)
+
+    async def _settle(self, job_id: str, token: str, interrupted: bool) -> None:
+        """Remove a finished job's queue row, or hand an interrupted one back."""
+        try:
+            if interrupted:
+                # Interrupted by shutdown: hand the job back for another worker
+                await asyncio.to_thread(self.queue.requeue, job_id, token)
+                logger.warning(f"Job {job_id} interrupted, returned to queue")
+            else:
+                await asyncio.to_thread(self.queue.complete, job_id, token)
+        except Exception as e:
+            logger.error(f"Failed to update queue for job {job_id}: {e}")
+        self.wake()
+
+    async def drain(self, timeout: float) -> None:
+        """
+        Stop claiming jobs and let running pipelines reach their next stage
+        boundary, where they checkpoint and return to the queue. Jobs still
+        running after `timeout` seconds are cancelled and requeued.
+        """
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+        request_drain()
+        tasks = list(self._running.values())
+        if tasks:
+            logger.info(f"Draining {len(tasks)} running job(s) (timeout {timeout:.0f}s)")
+            _done, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                logger.warning(f"{len(pending)} job(s) did not reach a stage boundary in time; cancelling")
+        await self.shutdown()
+
+    async def shutdown(self) -> None:
+        """Stop consuming and cancel running jobs."""
+        for attr in ("_loop_task", "_heartbeat_task"):
+            loop_task = getattr(self, attr)
+            if loop_task is not None:
+                loop_task.cancel()
+                await asyncio.gather(loop_task, return_exceptions=True)
+                setattr(self, attr, None)
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if self._settling:
+            await asyncio.gather(*self._settling, return_exceptions=True)
+
+
+def build_scheduler(total_slots: Optional[int] = None, worker_id: Optional[str] = None) -> JobScheduler:
+    """Create a scheduler configured from settings."""
+    from app.worker import process_job
+    total_slots = total_slots or settings.PIPELINE_SLOTS
+    gpu_slots = settings.GPU_PIPELINE_SLOTS
+    if settings.house_batching:
+        # Jobs collecting into a house batch hold a claim but no pipeline slot;
+        # the batcher caps running batches at GPU_PIPELINE_SLOTS instead
+        extra = settings.GPU_PIPELINE_SLOTS * (max(1, settings.HOUSE_BATCH_MAX_HOUSES) - 1)
+        total_slots += extra
+        gpu_slots += extra
+    return JobScheduler(
+        runner=process_job,
+        queue=get_job_queue(),
+        total_slots=total_slots,
+        mode_limits={
+            "demo": settings.DEMO_PIPELINE_SLOTS,
+            "gpu": gpu_slots,
+        },
+        worker_id=worker_id,
+        poll_interval=settings.QUEUE_POLL_INTERVAL,
+        heartbeat_interval=settings.QUEUE_HEARTBEAT_INTERVAL,
+    )
+
+
+_scheduler: Optional[JobScheduler] = None
+
+
+def get_scheduler() -> JobScheduler:
+    """Return the process-wide scheduler, configured from settings."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = build_scheduler()
+    return _scheduler
@@ -1,10 +1,22 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 
 class JobCreateResponse(BaseModel):
     job_id: str
     status: str
+    deduplicated: bool = False  # True if an identical earlier job was returned
+
+
+class StageResources(BaseModel):
+    wall_seconds: float = 0.0
+    user_cpu_seconds: float = 0.0
+    sys_cpu_seconds: float = 0.0
+    max_rss_bytes: int = 0  # Largest single process
+    peak_tree_rss_bytes: int = 0  # Largest combined RSS of the stage's processes
+    peak_processes: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
 
 
 class JobStatusResponse(BaseModel):
@@ -13,6 +25,51 @@ class JobStatusResponse(BaseModel):
     scene_url: Optional[str] = None
     video_url: Optional[str] = None
     current_stage: Optional[str] = None
+    queue_position: Optional[int] = None
+    version: int = 0  # Increases on every job update
+    stage_resources: Optional[Dict[str, StageResources]] = None  # Keyed by stage name
+
+
+class JobRetryResponse(BaseModel):
+    job_id: str
+    status: str
+    resume_from: Optional[str] = None  # First stage that will run; None if all were recorded
+
+
+class UploadCreateRequest(BaseModel):
+    filename: str
+    size: int  # Total bytes the client will send
+    kind: str = "floorplan"  # floorplan or annotation
+    content_type: Optional[str] = None
+
+
+class UploadStatusResponse(BaseModel):
+    upload_id: str
+    filename: str
+    kind: str
+    size: int
+    offset: int  # Bytes received so far; the next chunk starts here
+    complete: bool
+
+
+class UploadFinalizeRequest(BaseModel):
+    annotation_upload_id: Optional[str] = None  # Completed R2V annotation upload
+    priority: int = 0
+
+
+class StageLogInfo(BaseModel):
+    stage: str
+    size: int  # Bytes in the current (unrotated) log file
+
+
+class JobLogResponse(BaseModel):
+    job_id: str
+    stages: List[StageLogInfo]
+    stage: Optional[str] = None
+    offset: int = 0  # Where `data` starts in the stage log
+    next_offset: int = 0  # Pass as `offset` to continue reading
+    data: str = ""
+    reset: bool = False  # True if the log rotated and reading restarted at 0
 
 
 class RoomPreview(BaseModel):
@@ -0,0 +1,169 @@
+"""
+CPU core allocation for CPU-fallback stage commands.
+
+Without a GPU, every stage starts PyTorch/OpenMP with one thread per host
+core, so two concurrent jobs oversubscribe the machine and both run slower
+than they would one after the other. CpuAllocator instead gives each
+running CPU stage a disjoint set of cores: the command is pinned to them
+and told to use that many threads through OMP_NUM_THREADS,
+MKL_NUM_THREADS and friends (torch picks the count up in sitecustomize.py).
+Commands are started under `taskset -c`, or pinned with sched_setaffinity
+right after spawn where taskset is not installed; never from a preexec_fn,
+which can deadlock the child of a multi-threaded server between fork and
+exec.
+
+Cores are claimed with non-blocking flock() on one lock file per core
+under the state directory, so claims are disjoint across every API and
+worker process on the host and are released automatically if a process
+dies. A stage's budget is the fair share of the usable cores for
+GPU_PIPELINE_SLOTS concurrent jobs, capped by the cores that are free right
+now minus load from outside the pipelines (1-minute load average less the
+cores pipelines already hold).
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Thread-count variables honoured by OpenMP, MKL, OpenBLAS, numexpr and (via sitecustomize) torch
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "PLAN2SCENE_CPU_THREADS",
+)
+
+
+class CpuLease:
+    """Cores held for one stage command; release() gives them back."""
+
+    def __init__(self, cores: List[int], handles: List[int]):
+        self.cores = cores
+        self._handles = handles
+
+    @property
+    def threads(self) -> int:
+        return len(self.cores)
+
+    def env(self) -> Dict[str, str]:
+        return {name: str(self.threads) for name in THREAD_ENV_VARS}
+
+    def command_prefix(self) -> List[str]:
+        """`taskset -c <cores>` to start a command on the leased cores, or [] without taskset."""
+        if shutil.which("taskset") is None:
+            return []
+        return ["taskset", "-c", ",".join(str(core) for core in self.cores)]
+
+    def pin_process(self, pid: int) -> None:
+        """Restrict every thread of a running process to the leased cores."""
+        try:
+            for tid in os.listdir(f"/proc/{pid}/task"):
+                os.sched_setaffinity(int(tid), self.cores)
+        except OSError as e:
+            logger.debug(f"Could not pin process {pid}: {e}")
+
+    def release(self) -> None:
+        for handle in self._handles:
+            try:
+                os.close(handle)
+            except OSError:
+                pass
+        self._handles = []
+
+    def __enter__(self) -> "CpuLease":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class CpuAllocator:
+    """Hands out disjoint core sets to concurrent CPU stage commands on this host."""
+
+    def __init__(self, lock_dir: Path, concurrency: int, reserved_cores: int = 0, min_threads: int = 1):
+        self.lock_dir = Path(lock_dir)
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self.cores = sorted(os.sched_getaffinity(0))
+        self.concurrency = max(1, concurrency)
+        self.reserved_cores = reserved_cores
+        self.min_threads = max(1, min_threads)
+        self._lock = threading.Lock()
+
+    def _try_claim(self, core: int) -> Optional[int]:
+        handle = os.open(self.lock_dir / f"cpu{core}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(handle)
+            return None
+        return handle
+
+    def budget(self, free_cores: int) -> int:
+        """Threads for the next stage given how many cores are unclaimed."""
+        usable = max(1, len(self.cores) - self.reserved_cores)
+        fair_share = max(1, usable // self.concurrency)
+        held = len(self.cores) - free_cores
+        try:
+            external_load = max(0.0, os.getloadavg()[0] - held)
+        except OSError:
+            external_load = 0.0
+        available = free_cores - self.reserved_cores - int(external_load)
+        return max(self.min_threads, min(fair_share, available))
+
+    def acquire(self) -> Optional[CpuLease]:
+        """
+        Claim cores for a stage command.
+
+        Returns:
+            A lease on at least one core, or None if every core is claimed
+            (the command then runs unpinned with the minimum thread budget)
+        """
+        with self._lock:
+            handles: Dict[int, int] = {}
+            for core in self.cores:
+                handle = self._try_claim(core)
+                if handle is not None:
+                    handles[core] = handle
+            if not handles:
+                return None
+            wanted = min(self.budget(len(handles)), len(handles))
+            keep = sorted(handles)[:wanted]
+            for core, handle in handles.items():
+                if core not in keep:
+                    os.close(handle)
+            return CpuLease(keep, [handles[core] for core in keep])
+
+
+_allocator: Optional[CpuAllocator] = None
+_allocator_lock = threading.Lock()
+
+
+def get_cpu_allocator() -> Optional[CpuAllocator]:
+    """Return the host CPU allocator, or None if CPU_AFFINITY is off or unsupported."""
+    global _allocator
+    if not settings.CPU_AFFINITY or not hasattr(os, "sched_setaffinity"):
+        return None
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = CpuAllocator(
+                    settings.job_db_path.parent / "cpu_locks",
+                    concurrency=settings.GPU_PIPELINE_SLOTS,
+                    reserved_cores=settings.CPU_RESERVED_CORES,
+                    min_threads=settings.CPU_MIN_THREADS,
+                )
+    return _allocator
+
+
+def fallback_thread_env() -> Dict[str, str]:
+    """Thread budget for a CPU command that could not get a lease."""
+    return {name: str(max(1, settings.CPU_MIN_THREADS)) for name in THREAD_ENV_VARS}
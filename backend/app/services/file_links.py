@@ -0,0 +1,141 @@
+"""
+Zero-copy file staging.
+
+The pipeline stages the converted scene.json into `input/` and
+`full_archs/`, the tileable texture crops into `texture_crops` when seam
+correction is skipped, and the final video and scene.json into the job
+directory. Copying them costs disk I/O and space proportional to the crop
+set. materialize_file() tries the cheapest correct way instead, in the
+order given by STAGING_LINK_MODE:
+
+- reflink: a copy-on-write clone (FICLONE) on filesystems that support it
+  (btrfs, XFS, bcachefs, overlayfs over those); independent of the source
+- hardlink: a second name for the same inode, on the same filesystem
+- copy: shutil.copy2
+
+"auto" tries all three, "reflink" and "hardlink" try that method before
+copying, and "copy" always copies. A method that fails because the
+filesystem cannot do it is not tried again between the same two devices.
+
+Staged files are not immutable: a retried conversion normalizes its
+scene.json in place, seam correction and re-renders rewrite their outputs.
+A hardlinked destination would see those writes (and its writes would reach
+the source), so materializing with the STAGING_LINK_MODE default never
+hardlinks; only callers that pass mode="hardlink" explicitly, for files
+they detach before rewriting (see stage_cache.py), share inodes.
+"""
+
+import errno
+import logging
+import os
+import shutil
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# ioctl request number of FICLONE (_IOW(0x94, 9, int)) on Linux
+FICLONE = 0x40049409
+
+MODE_METHODS = {
+    "auto": ("reflink", "hardlink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "hardlink": ("hardlink", "copy"),
+    "copy": ("copy",),
+}
+
+# errnos meaning "this filesystem pair cannot do that", as opposed to real I/O errors
+_UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EPERM, errno.EMLINK, errno.ENOSYS}
+
+_unsupported: Dict[Tuple[str, int, int], bool] = {}
+_unsupported_lock = threading.Lock()
+
+
+def _reflink(src: Path, dst: Path) -> None:
+    import fcntl
+
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            dst.unlink(missing_ok=True)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _try(method: str, src: Path, dst: Path) -> bool:
+    """Run one method; False if the filesystem does not support it."""
+    if method == "copy":
+        shutil.copy2(src, dst)
+        return True
+    devices = (method, os.stat(src).st_dev, os.stat(dst.parent).st_dev)
+    if _unsupported.get(devices):
+        return False
+    try:
+        if method == "reflink":
+            _reflink(src, dst)
+        else:
+            os.link(src, dst)
+        return True
+    except (OSError, ImportError) as e:
+        if isinstance(e, OSError) and e.errno not in _UNSUPPORTED:
+            raise
+        with _unsupported_lock:
+            _unsupported[devices] = True
+        logger.debug(f"{method} unsupported from device {devices[1]} to {devices[2]}: {e}")
+        return False
+
+
+def materialize_file(src: Path, dst: Path, mode: Optional[str] = None) -> str:
+    """
+    Make `dst` hold the contents of `src`, replacing any existing file.
+
+    Args:
+        mode: auto, reflink, hardlink or copy (defaults to STAGING_LINK_MODE,
+            without hardlinks)
+
+    Returns:
+        The method that was used: reflink, hardlink or copy, or
+        "unchanged" if `dst` already is `src`
+    """
+    src, dst = Path(src), Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists() and os.path.samefile(src, dst):
+        return "unchanged"
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    if mode is None:
+        # Staged files may be rewritten in place later, so they never share an inode
+        methods = tuple(
+            method for method in MODE_METHODS.get(settings.STAGING_LINK_MODE, MODE_METHODS["auto"])
+            if method != "hardlink"
+        )
+    else:
+        methods = MODE_METHODS.get(mode, MODE_METHODS["auto"])
+    for method in methods:
+        if _try(method, src, dst):
+            return method
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def materialize_tree(src: Path, dst: Path, mode: Optional[str] = None) -> Counter:
+    """
+    Materialize every file under `src` at the same relative path under `dst`.
+
+    Returns:
+        Number of files per method used
+    """
+    methods: Counter = Counter()
+    for dirpath, _dirnames, filenames in os.walk(src):
+        base = Path(dirpath)
+        target = Path(dst) / base.relative_to(src)
+        target.mkdir(parents=True, exist_ok=True)
+        for name in filenames:
+            methods[materialize_file(base / name, target / name, mode)] += 1
+    return methods
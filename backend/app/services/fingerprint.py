@@ -0,0 +1,73 @@
+"""
+Content fingerprints for submissions and pipeline configuration.
+
+A submission fingerprint combines the SHA-256 of the uploaded floorplan and
+R2V annotation with the identity of everything that shapes the output:
+execution/pipeline mode, GPU vs CPU, the GNN checkpoint, the config and
+label files, and the seam correction backend and blending settings. Two
+submissions with the same fingerprint produce the same artifacts, so the
+second can reuse the first job.
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Optional
+
+from app.config import BACKEND_DIR, settings
+from app.services.preprocessing_pipeline import SEAM_CORRECT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Room type / surface labels passed to gnn_texture_prop
+LABELS_DIR = BACKEND_DIR / "static" / "plan2scene_labels"
+
+
+def file_identity(path: Path) -> Optional[str]:
+    """
+    Cheap identity for large files (checkpoints): path, size and mtime.
+    Returns None if the file does not exist.
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def file_digest(path: Path) -> Optional[str]:
+    """SHA-256 of a small file's contents, or None if it does not exist."""
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def pipeline_identity() -> str:
+    """Hash of the deployment settings and model files that determine pipeline output."""
+    identity = {
+        "mode": settings.MODE,
+        "pipeline_mode": settings.PIPELINE_MODE,
+        "gpu_enabled": settings.plan2scene_gpu_enabled,
+        "checkpoint": file_identity(settings.gnn_checkpoint_path),
+        "gnn_conf": file_digest(settings.gnn_conf_path),
+        "labels": {
+            path.name: file_digest(path)
+            for path in sorted(LABELS_DIR.glob("*.json"))
+        },
+        # "auto" and "embark" resolve on whether seam_correct.json is installed
+        "seam": {
+            "backend": settings.SEAM_CORRECTION_BACKEND.lower(),
+            "method": settings.SEAM_BLEND_METHOD,
+            "width": settings.SEAM_BLEND_WIDTH,
+            "embark_conf": file_digest(SEAM_CORRECT_CONFIG),
+        },
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+
+def submission_fingerprint(image_sha256: str, annotation_sha256: Optional[str]) -> str:
+    """Combine upload digests with the current pipeline identity."""
+    parts = [image_sha256, annotation_sha256 or "-", pipeline_identity()]
+    return hashlib.sha256(":".join(parts).encode()).hexdigest()
@@ -0,0 +1,419 @@
+"""
+Cross-job micro-batching of full-pipeline houses.
+
+Plan2Scene's stage scripts process every house in the split's house list,
+but each job normally gets its own data root with a single house, so every
+job pays for starting the interpreters and loading the models. With
+HOUSE_BATCH_WINDOW set, HouseBatcher collects the jobs that reach
+preprocessing within that many seconds of each other (up to
+HOUSE_BATCH_MAX_HOUSES), stages them under one shared data root with a
+unique house key per job (`<house id>_<job id>`), and runs each stage once
+for the whole batch. When the batch finishes, fails or is interrupted,
+each house's outputs are moved into its job's `plan2scene_data` directory
+under the job's own house id again, as a solo run would have named them:
+names and house references inside text outputs are rewritten, and the job
+gets its own house list and data_paths.json. The shared root is then
+removed. Every stage the batch completed is recorded in each member job's
+stage journal, so a retried or recovered job resumes after it on its own.
+
+Collecting jobs do not hold a pipeline slot. A batch keeps admitting jobs
+until it is full or, once its window has passed, until it takes one of
+GPU_PIPELINE_SLOTS pipeline slots; solo full-pipeline runs take one too.
+Slots are flock()ed files under the state directory, so the cap holds
+across every worker process on the host, and the scheduler claims up to
+HOUSE_BATCH_MAX_HOUSES jobs per slot (see build_scheduler).
+
+The batch runs under its own JobRun. Cancelling one job only detaches it;
+the batch is killed when its last job leaves. A stage failure or drain
+fails or interrupts every job in the batch.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+from uuid import uuid4
+
+from app.config import settings
+from app.lifecycle import JobRun, bind_run
+from app.services.job_logs import JobLogs
+from app.services.preprocessing_pipeline import FullPipelineResult, Plan2ScenePreprocessor
+from app.services.stage_journal import StageJournal
+
+logger = logging.getLogger(__name__)
+
+# Split and drop every batch runs with
+BATCH_SPLIT = "test"
+BATCH_DROP = 0.0
+
+# Outputs whose contents can name the house key (scene.json, house lists, CSVs)
+TEXT_SUFFIXES = (".json", ".txt", ".csv")
+
+
+class PipelineSlots:
+    """GPU_PIPELINE_SLOTS concurrent full-pipeline runs across every process on the host."""
+
+    def __init__(self, lock_dir: Path, slots: int, poll_interval: float = 0.5):
+        self.lock_dir = Path(lock_dir)
+        self.slots = max(1, slots)
+        self.poll_interval = poll_interval
+
+    def _try_claim(self) -> Optional[int]:
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        for slot in range(self.slots):
+            handle = os.open(self.lock_dir / f"slot{slot}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(handle)
+                continue
+            return handle
+        return None
+
+    @asynccontextmanager
+    async def hold(self) -> AsyncIterator[None]:
+        """Wait for a free pipeline slot and hold it for the duration of the block."""
+        handle = await asyncio.to_thread(self._try_claim)
+        while handle is None:
+            await asyncio.sleep(self.poll_interval)
+            handle = await asyncio.to_thread(self._try_claim)
+        try:
+            yield
+        finally:
+            os.close(handle)
+
+
+class _TeeStageLog:
+    """Writes one stage's output to the stage log of every job in a batch."""
+
+    def __init__(self, logs: List[Any]):
+        self._logs = logs
+
+    def write_line(self, line: str, stream: str = "stdout") -> None:
+        for log in self._logs:
+            log.write_line(line, stream)
+
+    def flush(self) -> None:
+        for log in self._logs:
+            log.flush()
+
+    def close(self) -> None:
+        for log in self._logs:
+            log.close()
+
+    def __enter__(self) -> "_TeeStageLog":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class _BatchLogs:
+    """JobLogs stand-in that fans stage output out to each member job."""
+
+    def __init__(self, logs: List[JobLogs]):
+        self._logs = logs
+
+    def stage(self, stage_name: str) -> _TeeStageLog:
+        return _TeeStageLog([logs.stage(stage_name) for logs in self._logs])
+
+
+class _BatchJournal:
+    """
+    StageJournal stand-in that records a batch's completed stages in each
+    member job's journal, with output paths where the split puts them.
+    A batch always starts from the first stage, so nothing is complete yet.
+    """
+
+    def __init__(self, batch: "HouseBatch", members: List["BatchMember"]):
+        self._batch = batch
+        self._members = members
+
+    def is_complete(self, stage_name: str) -> bool:
+        return False
+
+    def get(self, stage_name: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def record(self, stage_name: str, output_dir: Optional[Path] = None, **details: Any) -> None:
+        for member in self._members:
+            if member.job_id in self._batch.job_ids:
+                member.journal.record(
+                    stage_name,
+                    output_dir=_relocate(output_dir, self._batch.root, member),
+                    batch=self._batch.batch_id,
+                    **details
+                )
+
+
+@dataclass
+class BatchMember:
+    """One job's house in a batch."""
+    job_id: str
+    house_id: str
+    house_key: str
+    scene_json_path: Path
+    job_data_dir: Path
+    logs: JobLogs
+    journal: StageJournal
+    future: asyncio.Future
+
+
+@dataclass
+class HouseBatch:
+    """Houses sharing one data root and one run of each stage."""
+    batch_id: str
+    root: Path
+    members: Dict[str, BatchMember] = field(default_factory=dict)  # house key -> member
+    job_ids: List[str] = field(default_factory=list)  # Jobs still waiting on the batch
+    task: Optional[asyncio.Task] = None
+    running: bool = False  # Membership is frozen and houses are staged
+
+    def __post_init__(self):
+        self.run = JobRun(f"batch-{self.batch_id}")
+
+
+def _unkey(name: str, house_key: str, house_id: str) -> str:
+    """`name` with a leading batch house key replaced by the job's house id."""
+    return house_id + name[len(house_key):] if name.startswith(house_key) else name
+
+
+def _unkey_contents(path: Path, house_key: str, house_id: str) -> None:
+    """Replace references to `house_key` inside a text output with `house_id`."""
+    try:
+        text = path.read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return
+    if house_key in text:
+        path.write_text(text.replace(house_key, house_id), encoding="utf-8")
+
+
+def split_house_outputs(data_root: Path, dest_root: Path, house_key: str, house_id: str) -> None:
+    """
+    Move every file and directory named after `house_key` from a shared data
+    root into `dest_root`, renamed after `house_id` (at any depth) and with
+    the key replaced inside text outputs, so the job's data root looks as if
+    the house had run on its own. Files every house shares (house lists,
+    data_paths.json) are left behind; see Plan2ScenePreprocessor.prepare_house_layout.
+    """
+    for dirpath, dirnames, filenames in os.walk(data_root):
+        base = Path(dirpath)
+        names = [name for name in dirnames if name.startswith(house_key)]
+        for name in names:
+            dirnames.remove(name)
+        for name in names + [name for name in filenames if name.startswith(house_key)]:
+            dest = dest_root / (base / name).relative_to(data_root).parent / _unkey(name, house_key, house_id)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(base / name), str(dest))
+            if not dest.is_dir():
+                if dest.suffix in TEXT_SUFFIXES:
+                    _unkey_contents(dest, house_key, house_id)
+                continue
+            # Deepest entries first, so renaming a directory never moves a pending path
+            for inner_dirpath, inner_dirnames, inner_filenames in os.walk(dest, topdown=False):
+                for inner in inner_filenames:
+                    if inner.endswith(TEXT_SUFFIXES):
+                        _unkey_contents(Path(inner_dirpath) / inner, house_key, house_id)
+                for inner in inner_dirnames + inner_filenames:
+                    renamed = _unkey(inner, house_key, house_id)
+                    if renamed != inner:
+                        os.rename(Path(inner_dirpath) / inner, Path(inner_dirpath) / renamed)
+
+
+
+def _relocate(path: Optional[Path], data_root: Path, member: "BatchMember") -> Optional[Path]:
+    """Where `path` under the batch root ends up after the member's outputs are split out."""
+    if path is None:
+        return None
+    path = Path(path)
+    if not path.is_relative_to(data_root):
+        return path
+    parts = [_unkey(part, member.house_key, member.house_id) for part in path.relative_to(data_root).parts]
+    return member.job_data_dir.joinpath(*parts)
+
+
+class HouseBatcher:
+    """Groups full-pipeline jobs arriving within a window into one multi-house run."""
+
+    def __init__(self, batch_root: Path, window: float, max_houses: int, slots: PipelineSlots):
+        self.batch_root = Path(batch_root)
+        self.window = window
+        self.max_houses = max(1, max_houses)
+        self.slots = slots
+        self._pending: Optional[HouseBatch] = None
+
+    def pipeline_slot(self):
+        """Slot for a full pipeline run outside a batch (a job resuming from its journal)."""
+        return self.slots.hold()
+
+    async def run(
+        self,
+        job_id: str,
+        scene_json_path: Path,
+        house_id: str,
+        job_data_dir: Path,
+        logs: JobLogs,
+        journal: StageJournal
+    ) -> FullPipelineResult:
+        """
+        Run a job's house through the pipeline as part of the next batch.
+        Stages the batch completes are recorded in `journal`.
+
+        Returns:
+            The house's result, with output paths under `job_data_dir`
+
+        Raises:
+            PipelineInterrupted: If the batch stopped at a stage boundary
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._pending
+        if batch is None:
+            batch_id = uuid4().hex
+            batch = HouseBatch(batch_id, self.batch_root / batch_id)
+            self._pending = batch
+            loop.call_later(self.window, self._start, batch)
+        member = BatchMember(
+            job_id=job_id,
+            house_id=house_id,
+            house_key=f"{house_id}_{job_id}",
+            scene_json_path=scene_json_path,
+            job_data_dir=job_data_dir,
+            logs=logs,
+            journal=journal,
+            future=loop.create_future(),
+        )
+        batch.members[member.house_key] = member
+        batch.job_ids.append(job_id)
+        logger.info(f"Job {job_id} joined house batch {batch.batch_id} ({len(batch.members)} houses)")
+        if len(batch.members) >= self.max_houses:
+            self._close(batch)
+            self._start(batch)
+        try:
+            return await asyncio.shield(member.future)
+        except asyncio.CancelledError:
+            self._leave(batch, member)
+            raise
+
+    def _close(self, batch: HouseBatch) -> None:
+        """Stop admitting jobs to the batch."""
+        if batch is self._pending:
+            self._pending = None
+
+    def _start(self, batch: HouseBatch) -> None:
+        """Start waiting for a pipeline slot; the batch admits jobs until it gets one."""
+        if batch.task is not None:
+            return
+        if not batch.members:
+            self._close(batch)
+            return
+        logger.info(f"House batch {batch.batch_id} waiting for a pipeline slot ({len(batch.members)} houses)")
+        batch.task = asyncio.create_task(self._run_batch(batch))
+
+    def _leave(self, batch: HouseBatch, member: BatchMember) -> None:
+        """Detach a cancelled job; a batch nobody waits for any more is killed."""
+        member.future.cancel()
+        if member.job_id in batch.job_ids:
+            batch.job_ids.remove(member.job_id)
+        if not batch.running:
+            # Not staged yet: the house is never run
+            batch.members.pop(member.house_key, None)
+        if not batch.job_ids:
+            self._close(batch)
+            if batch.task is not None:
+                logger.info(f"Every job left house batch {batch.batch_id}; cancelling it")
+                batch.run.cancel()
+                batch.task.cancel()
+
+    def _restore_layout(self, batch: HouseBatch, member: BatchMember) -> None:
+        split_house_outputs(batch.root, member.job_data_dir, member.house_key, member.house_id)
+        # The batch root's house list and data_paths.json name every house and the shared root
+        Plan2ScenePreprocessor(data_root=member.job_data_dir, logs=member.logs).prepare_house_layout(
+            member.house_id, BATCH_SPLIT, BATCH_DROP
+        )
+
+    async def _split(self, batch: HouseBatch, members: List[BatchMember]) -> None:
+        """Move the outputs of every job still in the batch into its own data root.
+
+        The batch root is removed before any job is handed its result.
+        """
+        for member in members:
+            if not member.future.done():
+                await asyncio.to_thread(self._restore_layout, batch, member)
+        await asyncio.to_thread(shutil.rmtree, batch.root, True)
+
+    async def _run_batch(self, batch: HouseBatch) -> None:
+        bind_run(batch.run)
+        try:
+            async with self.slots.hold():
+                self._close(batch)
+                batch.running = True
+                members = list(batch.members.values())
+                logger.info(f"Starting house batch {batch.batch_id} with {len(members)} houses")
+                await self._run_members(batch, members)
+        except asyncio.CancelledError:
+            self._close(batch)
+            for member in batch.members.values():
+                member.future.cancel()
+            raise
+        finally:
+            await asyncio.to_thread(shutil.rmtree, batch.root, True)
+
+    async def _run_members(self, batch: HouseBatch, members: List[BatchMember]) -> None:
+        try:
+            batch.root.mkdir(parents=True, exist_ok=True)
+            preprocessor = Plan2ScenePreprocessor(
+                data_root=batch.root,
+                logs=_BatchLogs([member.logs for member in members])
+            )
+            results = await preprocessor.run_houses(
+                {member.house_key: member.scene_json_path for member in members},
+                split=BATCH_SPLIT,
+                drop=BATCH_DROP,
+                job_ids=batch.job_ids,
+                journal=_BatchJournal(batch, members)
+            )
+            # Failed batches are split too: the stages they completed are journaled
+            await self._split(batch, members)
+            for member in members:
+                if member.future.done():
+                    continue
+                result = results[member.house_key]
+                result.house_id = member.house_id
+                result.final_scene_json = _relocate(result.final_scene_json, batch.root, member)
+                result.rendered_video = _relocate(result.rendered_video, batch.root, member)
+                result.rendered_images = [_relocate(path, batch.root, member) for path in result.rendered_images]
+                member.future.set_result(result)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            # Interrupted at a stage boundary: keep the completed stages for the resumed jobs
+            try:
+                await self._split(batch, members)
+            except Exception as split_error:
+                logger.error(f"Could not split outputs of house batch {batch.batch_id}: {split_error}")
+            for member in members:
+                if not member.future.done():
+                    member.future.set_exception(e)
+
+
+_batcher: Optional[HouseBatcher] = None
+
+
+def get_house_batcher() -> Optional[HouseBatcher]:
+    """Return this process's house batcher, or None if full-pipeline jobs are not batched."""
+    global _batcher
+    if not settings.house_batching:
+        return None
+    if _batcher is None:
+        _batcher = HouseBatcher(
+            settings.job_db_path.parent / "batches",
+            window=settings.HOUSE_BATCH_WINDOW,
+            max_houses=settings.HOUSE_BATCH_MAX_HOUSES,
+            slots=PipelineSlots(settings.job_db_path.parent / "pipeline_slots", settings.GPU_PIPELINE_SLOTS),
+        )
+    return _batcher
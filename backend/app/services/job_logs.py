@@ -0,0 +1,127 @@
+"""
+Per-job stage logs.
+
+Stage commands stream their stdout/stderr line by line into
+`<job_dir>/logs/<stage>.log` (stderr lines prefixed with `[stderr]`).
+Each file is rotated to `<stage>.log.1`, `.2`, ... once it passes
+JOB_LOG_MAX_BYTES, so chatty scripts cannot fill the disk. A bounded ring
+buffer of the last lines is kept in memory for error messages.
+
+Readers page through a stage log by byte offset. An offset past the end of
+the current file means the file was rotated since the last read; reading
+then restarts at 0 and is flagged as a reset.
+"""
+
+import logging
+import re
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_STAGE_NAME = re.compile(r"^[a-z0-9_]+$")
+
+
+class StageLog:
+    """Rotating, line-oriented log file for one stage of one job."""
+
+    def __init__(self, path: Path, max_bytes: int, backups: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def write_line(self, line: str, stream: str = "stdout") -> None:
+        if stream == "stderr":
+            line = f"[stderr] {line}"
+        data = line + "\n"
+        self._file.write(data)
+        self._size += len(data.encode("utf-8", errors="replace"))
+        if self.max_bytes and self._size >= self.max_bytes:
+            self._rotate()
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                older = self.path.with_name(f"{self.path.name}.{index}")
+                if older.exists():
+                    older.replace(self.path.with_name(f"{self.path.name}.{index + 1}"))
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._size = 0
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "StageLog":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class JobLogs:
+    """The stage logs of one job, under `<job_dir>/logs`."""
+
+    def __init__(self, log_dir: Path):
+        self.log_dir = Path(log_dir)
+
+    @classmethod
+    def for_job_dir(cls, job_dir: Path) -> "JobLogs":
+        return cls(Path(job_dir) / "logs")
+
+    def _path(self, stage_name: str) -> Path:
+        if not _STAGE_NAME.match(stage_name):
+            raise ValueError(f"Invalid stage name: {stage_name!r}")
+        return self.log_dir / f"{stage_name}.log"
+
+    def stage(self, stage_name: str) -> StageLog:
+        """Open a stage's log for appending."""
+        return StageLog(self._path(stage_name), settings.JOB_LOG_MAX_BYTES, settings.JOB_LOG_BACKUPS)
+
+    def list_stages(self) -> List[Dict[str, Any]]:
+        """Stages with a log, least recently written first, with current file sizes."""
+        if not self.log_dir.exists():
+            return []
+        paths = sorted(self.log_dir.glob("*.log"), key=lambda path: path.stat().st_mtime)
+        return [{"stage": path.stem, "size": path.stat().st_size} for path in paths]
+
+    def read(self, stage_name: str, offset: int = 0, limit: int = 65536) -> Tuple[str, int, bool]:
+        """
+        Read up to `limit` bytes of a stage log starting at `offset`, ending
+        on a line boundary when possible.
+
+        Returns:
+            (text, next_offset, reset) where reset is True if the log was
+            rotated past `offset` and reading restarted at 0
+
+        Raises:
+            FileNotFoundError: If the stage has no log
+        """
+        path = self._path(stage_name)
+        size = path.stat().st_size
+        reset = offset > size
+        if reset:
+            offset = 0
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(limit)
+        if len(data) == limit:
+            cut = data.rfind(b"\n")
+            if cut >= 0:
+                data = data[:cut + 1]
+        return data.decode("utf-8", errors="replace"), offset + len(data), reset
+
+
+def tail_buffer() -> Deque[str]:
+    """Ring buffer for the last STAGE_LOG_TAIL_LINES lines of a stream."""
+    return deque(maxlen=settings.STAGE_LOG_TAIL_LINES)
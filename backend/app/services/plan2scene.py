@@ -8,6 +8,7 @@ Provides orchestration for different execution modes:
 """
 
 import asyncio
+import contextlib
 import shutil
 import logging
 from pathlib import Path
@@ -17,7 +18,12 @@ from enum import Enum
 
 from app.config import settings
 from app.services.plan2scene_commands import run_plan2scene_command, Plan2SceneCommandError
+from app.services.job_logs import JobLogs
+from app.services.file_links import materialize_file
+from app.services.stage_pools import stage_slot
 from app.jobs import update_job
+from app.metrics import record_stage_usage
+from app.lifecycle import PipelineInterrupted
 
 logger = logging.getLogger(__name__)
 
@@ -76,7 +82,7 @@ class Plan2SceneEngine:
                 return await self.run_demo_pipeline(output_dir)
             elif self.mode == "gpu":
                 if self.pipeline_mode == "preprocessed":
-                    return await self.run_gpu_pipeline_preprocessed(upload_path, output_dir)
+                    return await self.run_gpu_pipeline_preprocessed(upload_path, output_dir, job_id)
                 elif self.pipeline_mode == "full":
                     return await self.run_gpu_pipeline_full(job_id, upload_path, output_dir, r2v_annotation)
                 else:
@@ -88,6 +94,8 @@ class Plan2SceneEngine:
                 logger.error(error_msg)
                 return PipelineResult(success=False, error_message=error_msg)
         
+        except PipelineInterrupted:
+            raise
         except Plan2SceneCommandError as e:
             logger.error(f"Pipeline failed: {e}")
             return PipelineResult(
@@ -150,7 +158,8 @@ class Plan2SceneEngine:
     async def run_gpu_pipeline_preprocessed(
         self,
         upload_path: Path,
-        output_dir: Path
+        output_dir: Path,
+        job_id: Optional[str] = None
     ) -> PipelineResult:
         """
         Run GPU pipeline assuming preprocessed Rent3D++ data already exists.
@@ -160,6 +169,7 @@ class Plan2SceneEngine:
         Args:
             upload_path: Path to uploaded floorplan (not used in preprocessed mode)
             output_dir: Directory for outputs
+            job_id: Job that stage resource usage is recorded on
         
         Returns:
             PipelineResult with paths to generated assets
@@ -174,10 +184,10 @@ class Plan2SceneEngine:
         
         try:
             # Step 1: Texture Propagation (GNN)
-            await self._run_texture_propagation_preprocessed(upload_path, output_dir)
+            await self._run_texture_propagation_preprocessed(upload_path, output_dir, job_id)
             
             # Step 2: Rendering
-            await self._run_rendering_preprocessed(output_dir)
+            await self._run_rendering_preprocessed(output_dir, job_id)
             
             # Verify outputs
             video_path = output_dir / "walkthrough.mp4"
@@ -207,7 +217,8 @@ class Plan2SceneEngine:
     async def _run_texture_propagation_preprocessed(
         self,
         upload_path: Path,
-        output_dir: Path
+        output_dir: Path,
+        job_id: Optional[str] = None
     ):
         """Run texture propagation step (existing preprocessed behavior)."""
         texture_script = settings.PLAN2SCENE_ROOT / "code/scripts/plan2scene/texture_prop/gnn_texture_prop.py"
@@ -225,10 +236,10 @@ class Plan2SceneEngine:
         ]
         
         logger.info("Running texture propagation...")
-        result = await asyncio.to_thread(run_plan2scene_command, args)
+        await self._run_preprocessed_stage("gnn_texture_prop", args, output_dir, job_id)
         logger.info(f"✓ Texture propagation completed")
     
-    async def _run_rendering_preprocessed(self, output_dir: Path):
+    async def _run_rendering_preprocessed(self, output_dir: Path, job_id: Optional[str] = None):
         """Run rendering step (existing preprocessed behavior)."""
         render_script = settings.PLAN2SCENE_ROOT / "code/scripts/plan2scene/render_house_jsons.py"
         
@@ -243,9 +254,29 @@ class Plan2SceneEngine:
         ]
         
         logger.info("Running rendering...")
-        result = await asyncio.to_thread(run_plan2scene_command, args)
+        await self._run_preprocessed_stage("render_house_jsons", args, output_dir, job_id)
         logger.info(f"✓ Rendering completed")
     
+    async def _run_preprocessed_stage(
+        self,
+        stage_name: str,
+        args: list,
+        output_dir: Path,
+        job_id: Optional[str]
+    ):
+        """Run one preprocessed-mode stage command in its resource pool, with its timeout, log and resource accounting."""
+        async with stage_slot(stage_name):
+            with JobLogs.for_job_dir(output_dir).stage(stage_name) as log:
+                try:
+                    result = await run_plan2scene_command(args, timeout=settings.stage_timeout(stage_name), log=log)
+                except Plan2SceneCommandError as e:
+                    if e.resources is not None:
+                        record_stage_usage(job_id, stage_name, e.resources.to_dict(), failed=True)
+                    raise
+        if result.resources is not None:
+            record_stage_usage(job_id, stage_name, result.resources.to_dict())
+        return result
+    
     async def run_gpu_pipeline_full(
         self,
         job_id: str,
@@ -303,21 +334,35 @@ class Plan2SceneEngine:
                 convert_r2v_to_scene_json,
                 extract_house_id_from_scene_json
             )
-            from app.services.preprocessing_pipeline import Plan2ScenePreprocessor
+            from app.services.preprocessing_pipeline import PIPELINE_STAGES, Plan2ScenePreprocessor
+            from app.services.house_batcher import get_house_batcher
+            from app.services.stage_journal import StageJournal
             
-            # Stage 1: Convert R2V to scene.json
-            logger.info("Stage 1: Converting R2V output to scene.json...")
-            update_job(job_id, current_stage="convert_r2v")
-            r2v_output_dir = output_dir / "r2v_conversion"
-            r2v_output_dir.mkdir(parents=True, exist_ok=True)
+            # Completed stages from a previous attempt are skipped on retry
+            journal = StageJournal.for_job_dir(output_dir)
+            logs = JobLogs.for_job_dir(output_dir)
             
-            scene_json_path = await asyncio.to_thread(
-                convert_r2v_to_scene_json,
-                r2v_annotation,
-                r2v_output_dir,
-                scale_factor=0.08,
-                r2v_annot=True
-            )
+            # Stage 1: Convert R2V to scene.json
+            converted = (journal.get("convert_r2v") or {}).get("outputs", {}).get("scene_json")
+            if converted and Path(converted).exists():
+                scene_json_path = Path(converted)
+                logger.info(f"Stage 1: SKIPPED (scene.json from previous attempt: {scene_json_path})")
+            else:
+                logger.info("Stage 1: Converting R2V output to scene.json...")
+                update_job(job_id, current_stage="convert_r2v")
+                r2v_output_dir = output_dir / "r2v_conversion"
+                r2v_output_dir.mkdir(parents=True, exist_ok=True)
+                
+                async with stage_slot("convert_r2v"):
+                    with logs.stage("convert_r2v") as log:
+                        scene_json_path = await convert_r2v_to_scene_json(
+                            r2v_annotation,
+                            r2v_output_dir,
+                            scale_factor=0.08,
+                            r2v_annot=True,
+                            log=log
+                        )
+                journal.record("convert_r2v", output_dir=r2v_output_dir, scene_json=scene_json_path)
             
             house_id = extract_house_id_from_scene_json(scene_json_path)
             logger.info(f"✓ Scene.json generated for house: {house_id}")
@@ -332,16 +377,23 @@ class Plan2SceneEngine:
             job_data_dir.mkdir(parents=True, exist_ok=True)
             logger.info(f"Using job-specific data directory: {job_data_dir}")
             
-            preprocessor = Plan2ScenePreprocessor(data_root=job_data_dir)
-            
-            pipeline_result = await asyncio.to_thread(
-                preprocessor.run_full_pipeline,
-                scene_json_path,
-                house_id,
-                split="test",
-                drop=0.0,
-                job_id=job_id
-            )
+            # Fresh jobs can share a batched run; resumed jobs continue on their own
+            batcher = get_house_batcher()
+            if batcher is not None and journal.first_incomplete(PIPELINE_STAGES) == PIPELINE_STAGES[0]:
+                pipeline_result = await batcher.run(job_id, scene_json_path, house_id, job_data_dir, logs, journal)
+            else:
+                preprocessor = Plan2ScenePreprocessor(data_root=job_data_dir, logs=logs)
+                
+                # With batching on, solo runs share the batches' pipeline slots
+                async with batcher.pipeline_slot() if batcher is not None else contextlib.nullcontext():
+                    pipeline_result = await preprocessor.run_full_pipeline(
+                        scene_json_path,
+                        house_id,
+                        split="test",
+                        drop=0.0,
+                        job_id=job_id,
+                        journal=journal
+                    )
             
             if not pipeline_result.success:
                 error_msg = (
@@ -366,8 +418,8 @@ class Plan2SceneEngine:
             
             # Copy video if available
             if pipeline_result.rendered_video and pipeline_result.rendered_video.exists():
-                shutil.copy(pipeline_result.rendered_video, video_dest)
-                logger.info(f"✓ Copied video to {video_dest}")
+                method = materialize_file(pipeline_result.rendered_video, video_dest)
+                logger.info(f"✓ Staged video at {video_dest} ({method})")
             else:
                 logger.warning("No rendered video found, creating placeholder")
                 video_dest.write_text("GPU Full: Video rendering not yet implemented")
@@ -376,8 +428,8 @@ class Plan2SceneEngine:
             if pipeline_result.final_scene_json and pipeline_result.final_scene_json.exists():
                 # TODO: Convert scene.json to GLB format
                 # For now, copy the scene.json as a placeholder
-                shutil.copy(pipeline_result.final_scene_json, model_dest.with_suffix(".scene.json"))
-                logger.info(f"✓ Copied scene.json to {model_dest.with_suffix('.scene.json')}")
+                method = materialize_file(pipeline_result.final_scene_json, model_dest.with_suffix(".scene.json"))
+                logger.info(f"✓ Staged scene.json at {model_dest.with_suffix('.scene.json')} ({method})")
                 
                 # Create placeholder GLB
                 model_dest.write_text("GPU Full: GLB conversion not yet implemented. See .scene.json")
@@ -391,6 +443,8 @@ class Plan2SceneEngine:
                 model_path=model_dest if model_dest.exists() else None
             )
         
+        except PipelineInterrupted:
+            raise
         except Plan2SceneCommandError as e:
             logger.error(f"GPU Full pipeline failed: {e}")
             return PipelineResult(
@@ -5,13 +5,25 @@ Provides reusable helpers for running Plan2Scene and R2V-related commands
 with proper error handling, logging, and environment setup.
 """
 
-import subprocess
+import asyncio
 import logging
+import os
+import time
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Deque, Optional, Dict, List
 from dataclasses import dataclass
 
 from app.config import settings
+from app.lifecycle import JobCancelled, current_run, kill_process_group
+from app.services.cpu_allocator import CpuLease, fallback_thread_env, get_cpu_allocator
+from app.services.job_logs import StageLog, tail_buffer
+from app.services.resource_usage import (
+    ProcessTreeSampler,
+    ResourceUsage,
+    combine_usage,
+    read_shim_report,
+    wrap_command,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -19,10 +31,18 @@ logger = logging.getLogger(__name__)
 class Plan2SceneCommandError(Exception):
     """Custom exception for Plan2Scene command failures."""
     
-    def __init__(self, message: str, command: List[str], stderr: str, returncode: int):
+    def __init__(
+        self,
+        message: str,
+        command: List[str],
+        stderr: str,
+        returncode: int,
+        resources: Optional[ResourceUsage] = None
+    ):
         self.command = command
         self.stderr = stderr
         self.returncode = returncode
+        self.resources = resources
         super().__init__(message)
     
     def __str__(self):
@@ -30,7 +50,7 @@ class Plan2SceneCommandError(Exception):
             f"{self.args[0]}\n"
             f"Command: {' '.join(self.command)}\n"
             f"Return code: {self.returncode}\n"
-            f"Stderr: {self.stderr}"
+            f"Stderr (last lines): {self.stderr}"
         )
 
 
@@ -41,15 +61,217 @@ class CommandResult:
     stdout: str
     stderr: str
     command: List[str]
+    resources: Optional[ResourceUsage] = None
 
 
-def run_plan2scene_command(
+class Plan2SceneCommandTimeout(Plan2SceneCommandError):
+    """Raised when a command exceeds its wall-clock timeout and is killed."""
+
+
+# Longest partial line held while waiting for its newline
+_MAX_LINE_BYTES = 64 * 1024
+
+# Seconds to wait for a command's output pipes to close after it exits; past
+# that, children it left behind are killed and the rest of their output dropped
+PIPE_DRAIN_TIMEOUT = 10.0
+
+
+async def _pump_lines(
+    stream: asyncio.StreamReader,
+    name: str,
+    tail: Deque[str],
+    log: Optional[StageLog]
+) -> None:
+    """Forward a pipe line by line to the stage log, keeping the last lines in `tail`."""
+    pending = b""
+    while True:
+        chunk = await stream.read(65536)
+        if chunk:
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            if len(pending) > _MAX_LINE_BYTES:
+                lines.append(pending)
+                pending = b""
+        else:
+            lines = [pending] if pending else []
+        for raw in lines:
+            line = raw.decode(errors="replace").rstrip("\r")
+            tail.append(line)
+            if log is not None:
+                log.write_line(line, name)
+        if log is not None:
+            log.flush()
+        if not chunk:
+            return
+
+
+async def _run_process(
+    args: List[str],
+    cwd: Path,
+    env: Dict[str, str],
+    capture_output: bool = True,
+    timeout: Optional[float] = None,
+    log: Optional[StageLog] = None,
+    cpu_lease: Optional[CpuLease] = None
+) -> CommandResult:
+    """
+    Run a command in its own process group without tying up a thread.
+    
+    Output is streamed line by line into `log` (if given) as it is
+    produced; only the last STAGE_LOG_TAIL_LINES lines of each stream are
+    kept in memory and returned in the CommandResult.
+    
+    With RESOURCE_ACCOUNTING on, the command runs under the rusage shim
+    and the result (or timeout error) carries its ResourceUsage.
+    
+    The process is registered with the current job run, so cancelling the
+    job kills the command and anything it spawned. The same happens when
+    the awaiting task is cancelled or `timeout` seconds pass, and when the
+    command exits but children still hold its output pipes after
+    PIPE_DRAIN_TIMEOUT seconds.
+    
+    Raises:
+        JobCancelled: If the job was cancelled while the command ran
+        Plan2SceneCommandTimeout: If the command ran longer than `timeout`
+    """
+    pipe = asyncio.subprocess.PIPE if capture_output else None
+    report = None
+    exec_args = args
+    pin_after_spawn = False
+    if cpu_lease is not None:
+        # Pin through taskset rather than a preexec_fn, which is unsafe in a threaded process
+        prefix = cpu_lease.command_prefix()
+        exec_args = prefix + exec_args
+        pin_after_spawn = not prefix
+    if settings.RESOURCE_ACCOUNTING:
+        exec_args, report = wrap_command(exec_args)
+    start = time.monotonic()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *exec_args,
+            cwd=str(cwd),
+            env=env,
+            stdout=pipe,
+            stderr=pipe,
+            start_new_session=True
+        )
+    except BaseException:
+        if report is not None:
+            report.unlink(missing_ok=True)
+        raise
+    if pin_after_spawn:
+        cpu_lease.pin_process(process.pid)
+    run = current_run()
+    if run is not None:
+        run.register_process(process)
+    if log is not None:
+        log.write_line(f"$ {' '.join(args)}")
+    sampler = sampling = None
+    if report is not None:
+        # The new session's process group id is the child's pid
+        sampler = ProcessTreeSampler(process.pid, settings.RESOURCE_SAMPLE_INTERVAL)
+        sampling = asyncio.create_task(sampler.run())
+    stdout_tail, stderr_tail = tail_buffer(), tail_buffer()
+    pumps = []
+    if capture_output:
+        pumps = [
+            asyncio.ensure_future(_pump_lines(process.stdout, "stdout", stdout_tail, log)),
+            asyncio.ensure_future(_pump_lines(process.stderr, "stderr", stderr_tail, log)),
+        ]
+
+    async def wait_and_drain() -> None:
+        if not pumps:
+            await process.wait()
+            return
+        # Process.wait() also waits for the pipes to close, so watch for the exit itself
+        pending = set(pumps)
+        while pending and process.returncode is None:
+            _done, pending = await asyncio.wait(pending, timeout=0.5)
+        if pending:
+            _done, pending = await asyncio.wait(pending, timeout=PIPE_DRAIN_TIMEOUT)
+        if pending:
+            # The command exited but something it started still holds its pipes
+            logger.warning(f"{args[0]} exited with its output pipes still open; killing its process group")
+            kill_process_group(process)
+            _done, pending = await asyncio.wait(pending, timeout=PIPE_DRAIN_TIMEOUT)
+        if pending:
+            # Held by a process outside the group: give up on the rest of the output
+            for pump in pending:
+                pump.cancel()
+            return
+        await process.wait()
+
+    def usage() -> Optional[ResourceUsage]:
+        if report is None:
+            return None
+        return combine_usage(read_shim_report(report), sampler, time.monotonic() - start)
+
+    gathered = asyncio.ensure_future(wait_and_drain())
+    # On cancellation nobody awaits the wait again; retrieve its outcome so it is not reported
+    gathered.add_done_callback(lambda future: future.cancelled() or future.exception())
+    try:
+        await asyncio.wait_for(gathered, timeout)
+    except asyncio.TimeoutError:
+        kill_process_group(process)
+        await process.wait()
+        raise Plan2SceneCommandTimeout(
+            message=f"Command timed out after {timeout:.0f}s",
+            command=args,
+            stderr="\n".join(stderr_tail),
+            returncode=process.returncode,
+            resources=usage()
+        )
+    except BaseException:
+        # Cancelled: reap the whole process group before propagating
+        kill_process_group(process)
+        await asyncio.shield(process.wait())
+        if report is not None:
+            report.unlink(missing_ok=True)
+        raise
+    finally:
+        for pump in pumps:
+            pump.cancel()
+        if sampling is not None:
+            sampling.cancel()
+        if run is not None:
+            run.unregister_process(process)
+        if log is not None:
+            log.write_line(f"[exit {process.returncode}]")
+            log.flush()
+    if run is not None and run.cancelled:
+        if report is not None:
+            report.unlink(missing_ok=True)
+        raise JobCancelled(f"Job {run.job_id} cancelled while running {args[0]}")
+    return CommandResult(
+        returncode=process.returncode,
+        stdout="\n".join(stdout_tail),
+        stderr="\n".join(stderr_tail),
+        command=args,
+        resources=usage()
+    )
+
+
+def plan2scene_env(use_gpu: bool) -> Dict[str, str]:
+    """Environment for Plan2Scene commands, hiding GPUs from PyTorch in CPU fallback mode."""
+    # 🔑 CRITICAL: Inherit environment from parent process (including PYTHONPATH set in Dockerfile)
+    env = os.environ.copy()
+    
+    # CPU fallback: Hide GPUs from PyTorch if GPU is disabled
+    if not use_gpu:
+        env["CUDA_VISIBLE_DEVICES"] = ""
+        env["FORCE_CPU"] = "1"
+    return env
+
+
+async def run_plan2scene_command(
     args: List[str],
     cwd: Optional[Path] = None,
     env_overrides: Optional[Dict[str, str]] = None,
     check: bool = True,
     capture_output: bool = True,
-    use_gpu: Optional[bool] = None
+    use_gpu: Optional[bool] = None,
+    timeout: Optional[float] = None,
+    log: Optional[StageLog] = None
 ) -> CommandResult:
     """
     Execute a Plan2Scene-related command with proper environment setup.
@@ -61,12 +283,15 @@ def run_plan2scene_command(
         check: Raise Plan2SceneCommandError on non-zero exit code
         capture_output: Capture stdout/stderr for logging
         use_gpu: Whether to use GPU (defaults to settings.plan2scene_gpu_enabled)
+        timeout: Wall-clock limit in seconds; the process group is killed when exceeded
+        log: Stage log that receives the output line by line
     
     Returns:
         CommandResult with execution details
     
     Raises:
         Plan2SceneCommandError: If command fails and check=True
+        Plan2SceneCommandTimeout: If the command exceeds `timeout`
     """
     # Default to Plan2Scene root if no cwd specified
     if cwd is None:
@@ -76,15 +301,23 @@ def run_plan2scene_command(
     if use_gpu is None:
         use_gpu = settings.plan2scene_gpu_enabled
     
-    # 🔑 CRITICAL: Inherit environment from parent process (including PYTHONPATH set in Dockerfile)
-    import os
-    env = os.environ.copy()
+    env = plan2scene_env(use_gpu)
     
-    # CPU fallback: Hide GPUs from PyTorch if GPU is disabled
+    cpu_lease = None
     if not use_gpu:
-        env["CUDA_VISIBLE_DEVICES"] = ""
-        env["FORCE_CPU"] = "1"
         logger.info("CPU fallback mode enabled: hiding GPUs from PyTorch")
+        
+        # Give the command its own cores and a matching thread budget so
+        # concurrent CPU jobs do not oversubscribe the host
+        allocator = get_cpu_allocator()
+        if allocator is not None:
+            cpu_lease = allocator.acquire()
+            if cpu_lease is not None:
+                env.update(cpu_lease.env())
+                logger.info(f"CPU fallback: pinned to cores {cpu_lease.cores} ({cpu_lease.threads} threads)")
+            else:
+                env.update(fallback_thread_env())
+                logger.warning("CPU fallback: no free cores, running unpinned with the minimum thread budget")
     
     # Apply any user-provided environment overrides
     if env_overrides:
@@ -96,13 +329,8 @@ def run_plan2scene_command(
     logger.info(f"PYTHONPATH: {env.get('PYTHONPATH', 'not set')}")
     
     try:
-        result = subprocess.run(
-            args,
-            cwd=str(cwd),
-            env=env,
-            capture_output=capture_output,
-            text=True,
-            check=False  # We'll handle the check ourselves for better errors
+        result = await _run_process(
+            args, cwd, env, capture_output=capture_output, timeout=timeout, log=log, cpu_lease=cpu_lease
         )
         
         # Log output
@@ -118,15 +346,11 @@ def run_plan2scene_command(
                 message=error_msg,
                 command=args,
                 stderr=result.stderr,
-                returncode=result.returncode
+                returncode=result.returncode,
+                resources=result.resources
             )
         
-        return CommandResult(
-            returncode=result.returncode,
-            stdout=result.stdout,
-            stderr=result.stderr,
-            command=args
-        )
+        return result
     
     except FileNotFoundError as e:
         error_msg = f"Command not found: {args[0]}"
@@ -137,14 +361,19 @@ def run_plan2scene_command(
             stderr=str(e),
             returncode=-1
         )
+    finally:
+        if cpu_lease is not None:
+            cpu_lease.release()
 
 
-def run_r2v_command(
+async def run_r2v_command(
     args: List[str],
     cwd: Optional[Path] = None,
     env_overrides: Optional[Dict[str, str]] = None,
     check: bool = True,
-    use_gpu: Optional[bool] = None
+    use_gpu: Optional[bool] = None,
+    timeout: Optional[float] = None,
+    log: Optional[StageLog] = None
 ) -> CommandResult:
     """
     Execute an R2V-to-Plan2Scene command with proper environment setup.
@@ -157,6 +386,8 @@ def run_r2v_command(
         env_overrides: Additional environment variables
         check: Raise error on non-zero exit
         use_gpu: Whether to use GPU (defaults to settings.plan2scene_gpu_enabled)
+        timeout: Wall-clock limit in seconds; the process group is killed when exceeded
+        log: Stage log that receives the output line by line
     
     Returns:
         CommandResult with execution details
@@ -193,14 +424,7 @@ def run_r2v_command(
     logger.info(f"Working directory: {cwd}")
     
     try:
-        result = subprocess.run(
-            args,
-            cwd=str(cwd),
-            env=env,
-            capture_output=True,
-            text=True,
-            check=False
-        )
+        result = await _run_process(args, cwd, env, timeout=timeout, log=log)
         
         if result.stdout:
             logger.debug(f"R2V stdout:\n{result.stdout}")
@@ -213,15 +437,11 @@ def run_r2v_command(
                 message=error_msg,
                 command=args,
                 stderr=result.stderr,
-                returncode=result.returncode
+                returncode=result.returncode,
+                resources=result.resources
             )
         
-        return CommandResult(
-            returncode=result.returncode,
-            stdout=result.stdout,
-            stderr=result.stderr,
-            command=args
-        )
+        return result
     
     except FileNotFoundError as e:
         error_msg = f"R2V command not found: {args[0]}"
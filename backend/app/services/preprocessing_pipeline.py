@@ -10,17 +10,66 @@ Implements the complete Plan2Scene preprocessing pipeline stages:
 6. Rendering (PNG previews + video)
 """
 
+import asyncio
 import logging
+import time
 from pathlib import Path
 from typing import Optional, List, Dict, Any
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from app.config import settings
-from app.services.plan2scene_commands import run_plan2scene_command, Plan2SceneCommandError
+from app.services.plan2scene_commands import Plan2SceneCommandError
+from app.services.stage_journal import StageJournal
+from app.services.job_logs import JobLogs
+from app.services.resource_usage import ResourceUsage
+from app.services.stage_policy import StageRetryPolicy, default_stage_policy
+from app.services.stage_pools import resource_class_for, stage_slot
+from app.services.stage_dag import Artifact, StageGraph, StageManifest, StageSpec
+from app.services.file_links import materialize_file, materialize_tree
+from app.services.stage_cache import CACHEABLE_STAGES, detach_outputs, get_stage_cache, normalized_scene_digest
+from app.services.stage_workers import FusedStageRunner, run_stage_script
 from app.jobs import update_job
+from app.metrics import record_stage_usage
+from app.lifecycle import PipelineInterrupted, check_drain
 
 logger = logging.getLogger(__name__)
 
+# Preprocessing stage names in execution order (as reported in PipelineStageResult)
+PIPELINE_STAGES = [
+    "fill_room_embeddings",
+    "vgg_crop_selector",
+    "gnn_texture_prop",
+    "seam_correct_textures",
+    "embed_textures",
+    "render_house_jsons",
+]
+
+# Model-driven stages that share one interpreter per job when STAGE_FUSION is on
+FUSED_STAGES = (
+    "fill_room_embeddings",
+    "vgg_crop_selector",
+    "gnn_texture_prop",
+    "embed_textures",
+)
+
+# Seam correction config; without it the stage only copies the tileable crops
+SEAM_CORRECT_CONFIG = Path("/plan2scene/conf/plan2scene/seam_correct.json")
+
+# Built-in NumPy seam correction, run as a stage command
+SEAM_BLEND_SCRIPT = Path(__file__).resolve().parent / "seam_blend.py"
+
+SEAM_BACKENDS = ("auto", "embark", "numpy", "copy")
+
+# current_stage values reported on the job while each stage runs
+STAGE_JOB_LABELS = {
+    "fill_room_embeddings": "room_embeddings",
+    "vgg_crop_selector": "vgg_crop_selection",
+    "gnn_texture_prop": "texture_propagation",
+    "seam_correct_textures": "seam_correction",
+    "embed_textures": "texture_embedding",
+    "render_house_jsons": "rendering",
+}
+
 
 @dataclass
 class PipelineStageResult:
@@ -29,6 +78,10 @@ class PipelineStageResult:
     success: bool
     output_dir: Optional[Path] = None
     error_message: Optional[str] = None
+    skipped: bool = False
+    resources: Optional[ResourceUsage] = None  # Summed over all attempts
+    attempts: int = 1
+    retry_errors: List[str] = field(default_factory=list)  # Why each retried attempt failed
 
 
 @dataclass
@@ -57,14 +110,37 @@ class Plan2ScenePreprocessor:
     Based on Plan2Scene README "Inference on Rent3D++ dataset" section.
     """
     
-    def __init__(self, data_root: Optional[Path] = None):
+    # Per-stage changes to default_stage_policy(). Rendering is optional and
+    # its failure never fails the job, so it is not worth retrying.
+    STAGE_POLICY_OVERRIDES: Dict[str, Dict[str, Any]] = {
+        "render_house_jsons": {"max_attempts": 1},
+    }
+    
+    def __init__(
+        self,
+        data_root: Optional[Path] = None,
+        logs: Optional[JobLogs] = None,
+        policies: Optional[Dict[str, StageRetryPolicy]] = None,
+        fuse_stages: Optional[bool] = None
+    ):
         """
         Initialize preprocessor with data root directory.
         
         Args:
             data_root: Plan2Scene data directory (defaults to settings.plan2scene_data_root)
+            logs: Job logs that stage output is streamed into
+            policies: Retry/timeout policies replacing the defaults for some stages
+            fuse_stages: Run FUSED_STAGES in one interpreter (defaults to settings.STAGE_FUSION)
         """
         self.data_root = data_root or settings.plan2scene_data_root
+        self.logs = logs
+        self.fuse_stages = settings.STAGE_FUSION if fuse_stages is None else fuse_stages
+        self._fused: Optional[FusedStageRunner] = None
+        self.policies = {
+            stage_name: default_stage_policy(**self.STAGE_POLICY_OVERRIDES.get(stage_name, {}))
+            for stage_name in PIPELINE_STAGES
+        }
+        self.policies.update(policies or {})
         self.scripts_root = settings.PLAN2SCENE_ROOT / "code" / "scripts" / "plan2scene"
     
     def prepare_directory_structure(
@@ -131,6 +207,14 @@ class Plan2ScenePreprocessor:
         
         return dirs
     
+    def prepare_house_layout(self, house_id: str, split: str = "test", drop: float = 0.0) -> Path:
+        """
+        Directories, house list and data_paths.json for a house whose stage
+        outputs were placed in this data root by someone else (a house batch).
+        """
+        self.prepare_directory_structure(house_id, split, drop)
+        return self._create_custom_data_paths_config()
+    
     def _create_custom_data_paths_config(self) -> Path:
         """Create a custom data_paths.json that points to the job-specific directory."""
         import json
@@ -156,13 +240,188 @@ class Plan2ScenePreprocessor:
         logger.info(f"Created custom data_paths.json at {config_path}")
         return config_path
     
-    def run_full_pipeline(
+    def seam_backend(self) -> str:
+        """
+        Seam correction backend for this deployment: embark, numpy or copy.
+        
+        "auto" uses Embark's tool when seam_correct.json is installed and the
+        built-in NumPy blending otherwise; "embark" without the config falls
+        back to copying the crops uncorrected.
+        """
+        backend = settings.SEAM_CORRECTION_BACKEND.lower()
+        if backend not in SEAM_BACKENDS:
+            logger.warning(f"Unknown SEAM_CORRECTION_BACKEND {backend!r}; using auto")
+            backend = "auto"
+        if backend == "auto":
+            return "embark" if SEAM_CORRECT_CONFIG.exists() else "numpy"
+        if backend == "embark" and not SEAM_CORRECT_CONFIG.exists():
+            return "copy"
+        return backend
+    
+    def stage_resource_class(self, stage_name: str) -> str:
+        """Resource pool a stage runs in; seam correction depends on its backend."""
+        if stage_name == "seam_correct_textures":
+            backend = self.seam_backend()
+            if backend == "copy":
+                return "io"
+            if backend == "numpy":
+                return "cpu"
+        return resource_class_for(stage_name)
+    
+    def stage_specs(self, split: str, drop: float, custom_data_paths: Path) -> List[StageSpec]:
+        """
+        Declare each stage's inputs, outputs, code and parameters.
+        
+        Several stages write inside another stage's directory (texture
+        embedding into `vgg_crop_select/.../archs`, seam correction into
+        `gnn_prop/.../texture_crops`, rendering next to the embedded
+        archs), so those parts are excluded from the enclosing artifact.
+        """
+        processed = self.data_root / "processed"
+        drop_str = f"drop_{drop:.1f}"
+        house_list = Artifact(self.data_root / "input" / "data_lists" / f"{split}.txt")
+        full_archs = Artifact(processed / "full_archs" / split)
+        photo_assignments = Artifact(processed / "photo_assignments" / split / drop_str)
+        texture_gen = Artifact(processed / "texture_gen" / split / drop_str)
+        vgg_crop_select = Artifact(processed / "vgg_crop_select" / split / drop_str, exclude=("archs",))
+        gnn_prop = Artifact(processed / "gnn_prop" / split / f"drop_{drop}", exclude=("texture_crops",))
+        tileable_crops = Artifact(processed / "gnn_prop" / split / f"drop_{drop}" / "tileable_texture_crops")
+        texture_crops = Artifact(processed / "gnn_prop" / split / f"drop_{drop}" / "texture_crops")
+        archs_dir = processed / "vgg_crop_select" / split / f"drop_{drop}" / "archs"
+        embedded_archs = Artifact(archs_dir, exclude=("*.png", "*.mp4"))
+        renders = [
+            Artifact(archs_dir, exclude=("*.json",)),
+            Artifact(processed / "renders" / split / drop_str),
+        ]
+        params = {"split": split, "drop": drop}
+        
+        return [
+            StageSpec(
+                "fill_room_embeddings",
+                lambda: self._run_fill_room_embeddings(split, drop, custom_data_paths),
+                inputs=[house_list, full_archs, photo_assignments],
+                outputs=[texture_gen],
+                code=[self.scripts_root / "preprocessing" / "fill_room_embeddings.py", custom_data_paths],
+                params=params,
+            ),
+            StageSpec(
+                "vgg_crop_selector",
+                lambda: self._run_vgg_crop_selector(split, drop, custom_data_paths),
+                inputs=[house_list, full_archs, photo_assignments, texture_gen],
+                outputs=[vgg_crop_select],
+                code=[self.scripts_root / "crop_select" / "vgg_crop_selector.py", custom_data_paths],
+                params=params,
+            ),
+            StageSpec(
+                "gnn_texture_prop",
+                lambda: self._run_gnn_texture_prop(split, drop, custom_data_paths),
+                inputs=[house_list, full_archs, vgg_crop_select],
+                outputs=[gnn_prop],
+                code=[
+                    self.scripts_root / "texture_prop" / "gnn_texture_prop.py",
+                    custom_data_paths,
+                    settings.gnn_conf_path,
+                    settings.gnn_checkpoint_path,
+                    Path("/app/static/plan2scene_labels"),
+                ],
+                params=params,
+            ),
+            StageSpec(
+                "seam_correct_textures",
+                lambda: self._run_seam_correct_textures(split, drop),
+                inputs=[tileable_crops],
+                outputs=[texture_crops],
+                code=[
+                    self.scripts_root / "postprocessing" / "seam_correct_textures.py",
+                    SEAM_CORRECT_CONFIG,
+                    SEAM_BLEND_SCRIPT,
+                ],
+                params={
+                    **params,
+                    "backend": self.seam_backend(),
+                    "blend_method": settings.SEAM_BLEND_METHOD,
+                    "blend_width": settings.SEAM_BLEND_WIDTH,
+                },
+            ),
+            StageSpec(
+                "embed_textures",
+                lambda: self._run_embed_textures(split, drop, custom_data_paths),
+                inputs=[house_list, full_archs, texture_crops],
+                outputs=[embedded_archs],
+                code=[self.scripts_root / "postprocessing" / "embed_textures.py", custom_data_paths],
+                params=params,
+            ),
+            StageSpec(
+                "render_house_jsons",
+                lambda: self._run_rendering(split, drop, custom_data_paths),
+                inputs=[embedded_archs],
+                outputs=renders,
+                code=[self.scripts_root / "render_house_jsons.py", custom_data_paths],
+                params=params,
+                optional=True,
+            ),
+        ]
+    
+    def stage_output_dirs(self, split: str = "test", drop: float = 0.0) -> Dict[str, Path]:
+        """Return the directory each stage writes its outputs to."""
+        drop_str = f"drop_{drop:.1f}"
+        processed = self.data_root / "processed"
+        return {
+            "fill_room_embeddings": processed / "texture_gen" / split / drop_str,
+            "vgg_crop_selector": processed / "vgg_crop_select" / split / drop_str,
+            "gnn_texture_prop": processed / "gnn_prop" / split / drop_str,
+            "seam_correct_textures": processed / "gnn_prop" / split / drop_str / "texture_crops",
+            "embed_textures": processed / "vgg_crop_select" / split / drop_str / "archs",
+            "render_house_jsons": processed / "vgg_crop_select" / split / drop_str / "archs",
+        }
+    
+    def detect_completed_stages(
+        self,
+        house_id: str,
+        split: str = "test",
+        drop: float = 0.0,
+        interrupted_stage: Optional[str] = None
+    ) -> Dict[str, Path]:
+        """
+        Infer completed stages from what is on disk, for jobs whose journal
+        was not written (e.g. the process died right after a stage finished).
+        
+        Only the leading run of stages with outputs for `house_id` counts.
+        The stage that was running when the job was interrupted is never
+        considered complete, since its outputs may be partial; when that stage
+        is unknown the last detected stage is dropped for the same reason.
+        Rendering is never inferred.
+        
+        Returns:
+            Mapping of stage name -> output directory, in pipeline order
+        """
+        output_dirs = self.stage_output_dirs(split, drop)
+        detected: Dict[str, Path] = {}
+        for stage_name in PIPELINE_STAGES[:-1]:
+            if stage_name == interrupted_stage:
+                return detected
+            output_dir = output_dirs[stage_name]
+            if not output_dir.exists():
+                break
+            if stage_name == "seam_correct_textures":
+                has_outputs = any(output_dir.iterdir())
+            else:
+                has_outputs = any(output_dir.rglob(f"{house_id}*"))
+            if not has_outputs:
+                break
+            detected[stage_name] = output_dir
+        if interrupted_stage is None and detected:
+            detected.pop(list(detected)[-1])
+        return detected
+    
+    async def run_full_pipeline(
         self,
         scene_json_path: Path,
         house_id: str,
         split: str = "test",
         drop: float = 0.0,
-        job_id: Optional[str] = None
+        job_id: Optional[str] = None,
+        journal: Optional[StageJournal] = None
     ) -> FullPipelineResult:
         """
         Execute the complete Plan2Scene preprocessing pipeline.
@@ -180,6 +439,8 @@ class Plan2ScenePreprocessor:
             house_id: Unique house identifier
             split: Dataset split (test, train, val)
             drop: Drop rate (0.0 for full inference)
+            job_id: Job to report current_stage on
+            journal: Stage journal; leading stages it records as complete are skipped
         
         Returns:
             FullPipelineResult with output paths and status
@@ -188,125 +449,316 @@ class Plan2ScenePreprocessor:
         logger.info(f"  Scene JSON: {scene_json_path}")
         logger.info(f"  Split: {split}, Drop: {drop}")
         
-        result = FullPipelineResult(
-            success=False,
-            house_id=house_id
+        results = await self.run_houses(
+            {house_id: scene_json_path},
+            split=split,
+            drop=drop,
+            job_ids=[job_id] if job_id else None,
+            journal=journal
         )
+        return results[house_id]
+    
+    async def run_houses(
+        self,
+        scenes: Dict[str, Path],
+        split: str = "test",
+        drop: float = 0.0,
+        job_ids: Optional[List[str]] = None,
+        journal: Optional[StageJournal] = None
+    ) -> Dict[str, FullPipelineResult]:
+        """
+        Run the pipeline once over every house in `scenes` (house key -> scene.json).
+        
+        Stage scripts iterate over the split's house list, so all houses
+        staged in this data root go through each stage in a single run and
+        model loading is paid once. A stage failure fails every house.
+        
+        Args:
+            scenes: Input scene.json per house key; keys must be unique in the data root
+            split: Dataset split (test, train, val)
+            drop: Drop rate (0.0 for full inference)
+            job_ids: Jobs to report current_stage and resource usage on; usage is split evenly
+            journal: Stage journal; leading stages it records as complete are skipped
+        
+        Returns:
+            FullPipelineResult per house key
+        """
+        job_ids = job_ids or []
+        results = {house_id: FullPipelineResult(success=False, house_id=house_id) for house_id in scenes}
+        if self.fuse_stages:
+            self._fused = FusedStageRunner()
         
         try:
-            # Prepare directory structure
-            dirs = self.prepare_directory_structure(house_id, split, drop)
-            
-            # Create custom data_paths.json for this job
-            custom_data_paths = self._create_custom_data_paths_config()
-            
-            # Copy input scene.json to input directory
-            input_scene_json = dirs["input"] / scene_json_path.name
-            if not input_scene_json.exists():
-                import shutil
-                shutil.copy(scene_json_path, input_scene_json)
-                logger.info(f"Copied scene.json to {input_scene_json}")
-            
-            # Also copy scene.json to full_archs directory (expected by Plan2Scene)
-            arch_scene_json = dirs["full_archs"] / f"{house_id}.scene.json"
-            if not arch_scene_json.exists():
-                import shutil
-                shutil.copy(scene_json_path, arch_scene_json)
-                logger.info(f"Copied scene.json to {arch_scene_json}")
-            
-            # Stage 1: Fill room embeddings
-            if job_id:
-                update_job(job_id, current_stage="room_embeddings")
-            stage_result = self._run_fill_room_embeddings(split, drop, custom_data_paths)
-            result.stage_results.append(stage_result)
-            if not stage_result.success:
-                result.failed_stage = stage_result.stage_name
-                result.error_message = stage_result.error_message
-                return result
+            # Prepare directory structure and stage each house's scene.json
+            house_dirs = {
+                house_id: await asyncio.to_thread(
+                    self._stage_house, scene_json_path, house_id, split, drop, keyed=len(scenes) > 1
+                )
+                for house_id, scene_json_path in scenes.items()
+            }
             
-            # Stage 2: VGG crop selection
-            if job_id:
-                update_job(job_id, current_stage="vgg_crop_selection")
-            stage_result = self._run_vgg_crop_selector(split, drop, custom_data_paths)
-            result.stage_results.append(stage_result)
-            if not stage_result.success:
-                result.failed_stage = stage_result.stage_name
-                result.error_message = stage_result.error_message
-                return result
+            # Create custom data_paths.json for this data root
+            custom_data_paths = await asyncio.to_thread(self._create_custom_data_paths_config)
             
-            # Stage 3: GNN texture propagation
-            if job_id:
-                update_job(job_id, current_stage="texture_propagation")
-            stage_result = self._run_gnn_texture_prop(split, drop, custom_data_paths)
-            result.stage_results.append(stage_result)
-            if not stage_result.success:
-                result.failed_stage = stage_result.stage_name
-                result.error_message = stage_result.error_message
-                return result
+            # Stages 1-6, ordered by their declared inputs and outputs. Stages
+            # whose inputs, code and parameters are unchanged since they last
+            # succeeded here are skipped. Rendering never fails the pipeline.
+            graph = StageGraph(self.stage_specs(split, drop, custom_data_paths))
+            manifest = None
+            if settings.STAGE_SKIP_UP_TO_DATE:
+                manifest = await asyncio.to_thread(StageManifest.for_data_root, self.data_root)
             
-            # Stage 4: Seam correction
-            if job_id:
-                update_job(job_id, current_stage="seam_correction")
-            stage_result = self._run_seam_correct_textures(split, drop)
-            result.stage_results.append(stage_result)
-            if not stage_result.success:
-                result.failed_stage = stage_result.stage_name
-                result.error_message = stage_result.error_message
-                return result
+            # Outputs of cacheable stages are shared across jobs; a batch's
+            # outputs cover several houses, so only single-house runs use the cache
+            cache = get_stage_cache() if len(scenes) == 1 else None
+            if cache is not None:
+                (house_key, scene_json_path), = scenes.items()
+                scene_digest = await asyncio.to_thread(normalized_scene_digest, scene_json_path)
             
-            # Stage 5: Embed textures
-            if job_id:
-                update_job(job_id, current_stage="texture_embedding")
-            stage_result = self._run_embed_textures(split, drop, custom_data_paths)
-            result.stage_results.append(stage_result)
-            if not stage_result.success:
-                result.failed_stage = stage_result.stage_name
-                result.error_message = stage_result.error_message
-                return result
+            stage_results: List[PipelineStageResult] = []
+            for result in results.values():
+                result.stage_results = stage_results
             
-            # Find the final scene.json with embedded textures
-            embedded_scene_json = dirs["embed_textures"] / f"{house_id}.scene.json"
-            if embedded_scene_json.exists():
-                result.final_scene_json = embedded_scene_json
+            resuming = journal is not None
+            for spec in graph:
+                stage_name = spec.name
+                # Skip the leading stages a previous attempt already completed
+                if resuming and journal.is_complete(stage_name):
+                    entry = journal.get(stage_name)
+                    logger.info(f"Stage {stage_name}: SKIPPED (completed in a previous attempt)")
+                    stage_results.append(PipelineStageResult(
+                        stage_name=stage_name,
+                        success=True,
+                        output_dir=Path(entry["output_dir"]) if entry.get("output_dir") else None,
+                        skipped=True
+                    ))
+                    continue
+                resuming = False
+                
+                key = await asyncio.to_thread(spec.key) if manifest is not None else None
+                if manifest is not None and await asyncio.to_thread(manifest.is_up_to_date, spec, key):
+                    logger.info(f"Stage {stage_name}: SKIPPED (inputs, code and parameters unchanged)")
+                    stage_results.append(PipelineStageResult(
+                        stage_name=stage_name,
+                        success=True,
+                        output_dir=spec.outputs[0].path if spec.outputs else None,
+                        skipped=True
+                    ))
+                    if journal is not None:
+                        await asyncio.to_thread(
+                            journal.record, stage_name, output_dir=spec.outputs[0].path if spec.outputs else None
+                        )
+                    continue
+                
+                cache_key = None
+                if cache is not None and stage_name in CACHEABLE_STAGES:
+                    cache_key = await asyncio.to_thread(
+                        cache.key,
+                        stage_name,
+                        scene_digest,
+                        house_key,
+                        [path for path in spec.code if path != custom_data_paths],
+                        spec.params
+                    )
+                    if await asyncio.to_thread(cache.materialize, cache_key, spec.outputs):
+                        logger.info(f"Stage {stage_name}: SKIPPED (outputs linked from the stage cache)")
+                        stage_results.append(PipelineStageResult(
+                            stage_name=stage_name,
+                            success=True,
+                            output_dir=spec.outputs[0].path,
+                            skipped=True
+                        ))
+                        if manifest is not None:
+                            await asyncio.to_thread(manifest.record, spec, key)
+                        if journal is not None:
+                            await asyncio.to_thread(journal.record, stage_name, output_dir=spec.outputs[0].path)
+                        continue
+                    # Never rewrite files that are still linked from the cache
+                    await asyncio.to_thread(detach_outputs, spec.outputs)
+                
+                # Wait for the stage's resource pool, then stop at the stage
+                # boundary if the process started shutting down meanwhile
+                async with stage_slot(stage_name, self.stage_resource_class(stage_name)):
+                    check_drain(stage_name)
+                    for job_id in job_ids:
+                        await asyncio.to_thread(update_job, job_id, current_stage=STAGE_JOB_LABELS[stage_name])
+                    start_time = time.time()
+                    stage_result = await spec.run()
+                stage_results.append(stage_result)
+                if stage_result.resources is not None:
+                    share = stage_result.resources.share(max(1, len(job_ids)))
+                    for job_id in job_ids or [None]:
+                        await asyncio.to_thread(
+                            record_stage_usage, job_id, stage_name, share.to_dict(), failed=not stage_result.success
+                        )
+                
+                if stage_result.success:
+                    if manifest is not None:
+                        await asyncio.to_thread(manifest.record, spec, key)
+                    if cache_key is not None:
+                        await asyncio.to_thread(cache.store, cache_key, stage_name, spec.outputs)
+                    if journal is not None:
+                        await asyncio.to_thread(
+                            journal.record,
+                            stage_name,
+                            output_dir=stage_result.output_dir,
+                            duration=time.time() - start_time
+                        )
+                    continue
+                if manifest is not None:
+                    await asyncio.to_thread(manifest.invalidate, stage_name)
+                if spec.optional:
+                    # Rendering is optional - log warning but don't fail the pipeline
+                    logger.warning(f"Stage {stage_name} failed (optional): {stage_result.error_message}")
+                    logger.warning("Continuing without PNG renders - scene.json with textures is complete")
+                else:
+                    for result in results.values():
+                        result.failed_stage = stage_result.stage_name
+                        result.error_message = stage_result.error_message
+                    return results
             
-            # Stage 6: Rendering (optional - requires render.json config)
-            if job_id:
-                update_job(job_id, current_stage="rendering")
-            stage_result = self._run_rendering(split, drop, custom_data_paths)
-            result.stage_results.append(stage_result)
-            if not stage_result.success:
-                # Rendering is optional - log warning but don't fail the pipeline
-                logger.warning(f"Stage rendering failed (optional): {stage_result.error_message}")
-                logger.warning("Continuing without PNG renders - scene.json with textures is complete")
+            for house_id, result in results.items():
+                dirs = house_dirs[house_id]
+                
+                # Find the final scene.json with embedded textures
+                embedded_scene_json = dirs["embed_textures"] / f"{house_id}.scene.json"
+                if embedded_scene_json.exists():
+                    result.final_scene_json = embedded_scene_json
+                
+                # Collect rendered outputs (only this house's when several share the root)
+                renders_dir = dirs["renders"]
+                pattern = "*.png" if len(results) == 1 else f"{house_id}*.png"
+                result.rendered_images = list(renders_dir.glob(pattern))
+                
+                video_path = renders_dir / f"{house_id}.mp4"
+                if video_path.exists():
+                    result.rendered_video = video_path
+                
+                result.success = True
+                logger.info(f"✓ Full pipeline completed successfully for {house_id}")
+                logger.info(f"  Final scene.json: {result.final_scene_json}")
+                logger.info(f"  Rendered images: {len(result.rendered_images)}")
+                logger.info(f"  Rendered video: {result.rendered_video}")
             
-            # Collect rendered outputs
-            renders_dir = dirs["renders"]
-            result.rendered_images = list(renders_dir.glob("*.png"))
-            
-            video_path = renders_dir / f"{house_id}.mp4"
-            if video_path.exists():
-                result.rendered_video = video_path
-            
-            result.success = True
-            logger.info(f"✓ Full pipeline completed successfully for {house_id}")
-            logger.info(f"  Final scene.json: {result.final_scene_json}")
-            logger.info(f"  Rendered images: {len(result.rendered_images)}")
-            logger.info(f"  Rendered video: {result.rendered_video}")
-            
-            return result
+            return results
         
+        except PipelineInterrupted:
+            raise
         except Plan2SceneCommandError as e:
             logger.error(f"Pipeline stage failed: {e}")
-            result.error_message = str(e)
-            return result
+            for result in results.values():
+                result.error_message = str(e)
+            return results
         except Exception as e:
             logger.error(f"Unexpected pipeline error: {e}", exc_info=True)
-            result.error_message = str(e)
-            return result
+            for result in results.values():
+                result.error_message = str(e)
+            return results
+        finally:
+            if self._fused is not None:
+                await self._fused.close()
+                self._fused = None
     
-    def _run_fill_room_embeddings(self, split: str, drop: float, custom_data_paths: Path) -> PipelineStageResult:
+    def _stage_house(
+        self,
+        scene_json_path: Path,
+        house_id: str,
+        split: str,
+        drop: float,
+        keyed: bool = False
+    ) -> dict:
+        """
+        Create a house's directories and stage its scene.json where Plan2Scene reads it.
+        
+        The input copy keeps the converter's file name. With `keyed`, used when
+        several houses share the data root, it is renamed after the house key
+        instead, since converters name files after the upload and can collide.
+        """
+        dirs = self.prepare_directory_structure(house_id, split, drop)
+        
+        # Stage input scene.json in the input directory
+        input_name = f"{house_id}.scene.json" if keyed else scene_json_path.name
+        input_scene_json = dirs["input"] / input_name
+        if not input_scene_json.exists():
+            method = materialize_file(scene_json_path, input_scene_json)
+            logger.info(f"Staged scene.json at {input_scene_json} ({method})")
+        
+        # Also stage scene.json in the full_archs directory (expected by Plan2Scene)
+        arch_scene_json = dirs["full_archs"] / f"{house_id}.scene.json"
+        if not arch_scene_json.exists():
+            method = materialize_file(scene_json_path, arch_scene_json)
+            logger.info(f"Staged scene.json at {arch_scene_json} ({method})")
+        return dirs
+    
+    async def _run_stage_command(
+        self,
+        stage_name: str,
+        args: List[str],
+        output_dir: Path,
+        use_gpu: Optional[bool] = None
+    ) -> PipelineStageResult:
+        """
+        Run one stage's script under the stage's policy and report the outcome.
+        
+        Transient failures are retried in place after a backoff; the result
+        records the number of attempts and why the retried ones failed.
+        """
+        policy = self.policies.get(stage_name) or default_stage_policy()
+        timeout = policy.stage_timeout(stage_name)
+        logger.info(f"Stage {stage_name}: START" + (f" (timeout {timeout:.0f}s)" if timeout else ""))
+        start_time = time.time()
+        log = self.logs.stage(stage_name) if self.logs else None
+        resources: Optional[ResourceUsage] = None
+        retry_errors: List[str] = []
+        try:
+            for attempt in range(1, policy.max_attempts + 1):
+                try:
+                    if self._fused is not None and stage_name in FUSED_STAGES:
+                        command = await self._fused.run(args, timeout=timeout, log=log)
+                    else:
+                        command = await run_stage_script(args, use_gpu=use_gpu, timeout=timeout, log=log)
+                except Plan2SceneCommandError as e:
+                    resources = e.resources.combined(resources) if e.resources else resources
+                    if attempt < policy.max_attempts and policy.is_retryable(e):
+                        delay = policy.backoff_delay(attempt)
+                        logger.warning(
+                            f"Stage {stage_name}: attempt {attempt}/{policy.max_attempts} failed "
+                            f"({e.args[0]}), retrying in {delay:.0f}s"
+                        )
+                        retry_errors.append(e.args[0])
+                        if log is not None:
+                            log.write_line(f"[retrying in {delay:.0f}s: {e.args[0]}]")
+                            log.flush()
+                        await asyncio.sleep(delay)
+                        check_drain(stage_name)
+                        continue
+                    elapsed = time.time() - start_time
+                    logger.error(f"Stage {stage_name}: FAILED after {elapsed:.1f}s - {e}")
+                    return PipelineStageResult(
+                        stage_name=stage_name,
+                        success=False,
+                        error_message=str(e),
+                        resources=resources,
+                        attempts=attempt,
+                        retry_errors=retry_errors
+                    )
+                resources = command.resources.combined(resources) if command.resources else resources
+                elapsed = time.time() - start_time
+                logger.info(f"Stage {stage_name}: DONE in {elapsed:.1f}s" + (f" after {attempt} attempts" if attempt > 1 else ""))
+                return PipelineStageResult(
+                    stage_name=stage_name,
+                    success=True,
+                    output_dir=output_dir,
+                    resources=resources,
+                    attempts=attempt,
+                    retry_errors=retry_errors
+                )
+        finally:
+            if log is not None:
+                log.close()
+    
+    async def _run_fill_room_embeddings(self, split: str, drop: float, custom_data_paths: Path) -> PipelineStageResult:
         """Stage 1: Generate texture embeddings for rooms."""
-        import time
         stage_name = "fill_room_embeddings"
         script = self.scripts_root / "preprocessing" / "fill_room_embeddings.py"
         
@@ -328,29 +780,10 @@ class Plan2ScenePreprocessor:
             "--data-paths", str(custom_data_paths)
         ]
         
-        logger.info(f"Stage {stage_name}: START")
-        start_time = time.time()
-        try:
-            run_plan2scene_command(args)
-            elapsed = time.time() - start_time
-            logger.info(f"Stage {stage_name}: DONE in {elapsed:.1f}s")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=True,
-                output_dir=self.data_root / "processed" / "texture_gen" / split / f"drop_{drop:.1f}"
-            )
-        except Plan2SceneCommandError as e:
-            elapsed = time.time() - start_time
-            logger.error(f"Stage {stage_name}: FAILED after {elapsed:.1f}s - {e}")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=False,
-                error_message=str(e)
-            )
+        return await self._run_stage_command(stage_name, args, output_path)
     
-    def _run_vgg_crop_selector(self, split: str, drop: float, custom_data_paths: Path) -> PipelineStageResult:
+    async def _run_vgg_crop_selector(self, split: str, drop: float, custom_data_paths: Path) -> PipelineStageResult:
         """Stage 2: Select optimal texture crops using VGG."""
-        import time
         stage_name = "vgg_crop_selector"
         script = self.scripts_root / "crop_select" / "vgg_crop_selector.py"
         
@@ -374,27 +807,9 @@ class Plan2ScenePreprocessor:
             "--data-paths", str(custom_data_paths)
         ]
         
-        logger.info(f"Stage {stage_name}: START")
-        start_time = time.time()
-        try:
-            run_plan2scene_command(args)
-            elapsed = time.time() - start_time
-            logger.info(f"Stage {stage_name}: DONE in {elapsed:.1f}s")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=True,
-                output_dir=self.data_root / "processed" / "vgg_crop_select" / split / f"drop_{drop:.1f}"
-            )
-        except Plan2SceneCommandError as e:
-            elapsed = time.time() - start_time
-            logger.error(f"Stage {stage_name}: FAILED after {elapsed:.1f}s - {e}")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=False,
-                error_message=str(e)
-            )
+        return await self._run_stage_command(stage_name, args, output_path)
     
-    def _run_gnn_texture_prop(self, split: str, drop: float, custom_data_paths: Path) -> PipelineStageResult:
+    async def _run_gnn_texture_prop(self, split: str, drop: float, custom_data_paths: Path) -> PipelineStageResult:
         """Stage 3: Propagate textures using GNN."""
         script = self.scripts_root / "texture_prop" / "gnn_texture_prop.py"
         
@@ -406,8 +821,8 @@ class Plan2ScenePreprocessor:
             )
         
         # Paths to GNN model config and checkpoint
-        gnn_conf_path = settings.PLAN2SCENE_ROOT / "conf" / "plan2scene" / "texture_prop_conf" / "default.json"
-        gnn_checkpoint_path = settings.PLAN2SCENE_ROOT / "data" / "checkpoints" / "texture-prop-synth-v2-epoch250.ckpt"
+        gnn_conf_path = settings.gnn_conf_path
+        gnn_checkpoint_path = settings.gnn_checkpoint_path
         
         # Path to custom room types that includes all R2V room types
         labels_path = Path("/app/static/plan2scene_labels")
@@ -436,31 +851,12 @@ class Plan2ScenePreprocessor:
             "--labels-path", str(labels_path)
         ]
         
-        import time
         stage_name = "gnn_texture_prop"
-        logger.info(f"Stage {stage_name}: START")
         logger.info(f"  Config: {gnn_conf_path}")
         logger.info(f"  Checkpoint: {gnn_checkpoint_path}")
-        start_time = time.time()
-        try:
-            run_plan2scene_command(args)
-            elapsed = time.time() - start_time
-            logger.info(f"Stage {stage_name}: DONE in {elapsed:.1f}s")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=True,
-                output_dir=output_dir
-            )
-        except Plan2SceneCommandError as e:
-            elapsed = time.time() - start_time
-            logger.error(f"Stage {stage_name}: FAILED after {elapsed:.1f}s - {e}")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=False,
-                error_message=str(e)
-            )
+        return await self._run_stage_command(stage_name, args, output_dir)
     
-    def _run_seam_correct_textures(self, split: str, drop: float) -> PipelineStageResult:
+    async def _run_seam_correct_textures(self, split: str, drop: float) -> PipelineStageResult:
         """Stage 4: Make textures tileable (seam correction).
         
         Plan2Scene CLI signature:
@@ -470,50 +866,37 @@ class Plan2ScenePreprocessor:
         - input_dir: gnn_prop/<split>/drop_<drop>/tileable_texture_crops
         - output_dir: gnn_prop/<split>/drop_<drop>/texture_crops
         
-        NOTE: This stage requires Embark Studios' texture-synthesis tool.
-        If seam_correct.json config is missing, we skip this stage and copy
-        tileable_texture_crops -> texture_crops as-is.
+        The backend is chosen per deployment by SEAM_CORRECTION_BACKEND (see
+        seam_backend()): Embark Studios' texture-synthesis tool through the
+        Plan2Scene script, the built-in NumPy blending in seam_blend.py
+        (all crops of the job in one process), or no correction, in which
+        case tileable_texture_crops are staged as texture_crops as-is.
         """
-        script = self.scripts_root / "postprocessing" / "seam_correct_textures.py"
-        
-        if not script.exists():
-            return PipelineStageResult(
-                stage_name="seam_correct_textures",
-                success=False,
-                error_message=f"Script not found: {script}"
-            )
+        stage_name = "seam_correct_textures"
+        backend = self.seam_backend()
         
         # Build paths according to Plan2Scene directory structure
         base_dir = self.data_root / "processed" / "gnn_prop" / split / f"drop_{drop}"
         input_dir = base_dir / "tileable_texture_crops"
         output_dir = base_dir / "texture_crops"
         
-        # Check if seam_correct config exists
-        seam_config = Path("/plan2scene/conf/plan2scene/seam_correct.json")
-        
-        if not seam_config.exists():
-            # Skip seam correction - just copy tileable crops to texture crops
-            import time
+        if backend == "copy":
+            # Skip seam correction - stage tileable crops as texture crops (reflinked when possible)
             start_time = time.time()
             logger.warning(
-                "Stage seam_correct_textures: SKIPPED (seam_correct.json not found - "
-                "requires Embark Studios texture-synthesis tool). "
-                "Copying tileable textures without seam correction."
+                "Stage seam_correct_textures: SKIPPED (SEAM_CORRECTION_BACKEND=copy, or embark "
+                "without seam_correct.json). Copying tileable textures without seam correction."
             )
             output_dir.mkdir(parents=True, exist_ok=True)
             
-            # Copy all files from tileable_texture_crops to texture_crops
-            import shutil
+            # Materialize all files from tileable_texture_crops in texture_crops
+            methods = {}
             if input_dir.exists():
-                for item in input_dir.iterdir():
-                    dest = output_dir / item.name
-                    if item.is_file():
-                        shutil.copy2(item, dest)
-                    elif item.is_dir():
-                        shutil.copytree(item, dest, dirs_exist_ok=True)
+                methods = await asyncio.to_thread(materialize_tree, input_dir, output_dir)
             
             elapsed = time.time() - start_time
-            logger.info(f"Stage seam_correct_textures: SKIPPED (copied in {elapsed:.1f}s)")
+            staged = ", ".join(f"{count} by {method}" for method, count in sorted(methods.items())) or "no files"
+            logger.info(f"Stage seam_correct_textures: SKIPPED (staged {staged} in {elapsed:.1f}s)")
             return PipelineStageResult(
                 stage_name="seam_correct_textures",
                 success=True,
@@ -523,6 +906,25 @@ class Plan2ScenePreprocessor:
         # Ensure output directory exists
         output_dir.mkdir(parents=True, exist_ok=True)
         
+        if backend == "numpy":
+            args = [
+                "python", str(SEAM_BLEND_SCRIPT),
+                str(input_dir),
+                str(output_dir),
+                "--method", settings.SEAM_BLEND_METHOD,
+                "--blend-width", str(settings.SEAM_BLEND_WIDTH)
+            ]
+            return await self._run_stage_command(stage_name, args, output_dir, use_gpu=False)
+        
+        script = self.scripts_root / "postprocessing" / "seam_correct_textures.py"
+        
+        if not script.exists():
+            return PipelineStageResult(
+                stage_name=stage_name,
+                success=False,
+                error_message=f"Script not found: {script}"
+            )
+        
         args = [
             "python", str(script),
             str(input_dir),
@@ -531,29 +933,9 @@ class Plan2ScenePreprocessor:
             "--drop", str(drop)
         ]
         
-        import time
-        stage_name = "seam_correct_textures"
-        logger.info(f"Stage {stage_name}: START")
-        start_time = time.time()
-        try:
-            run_plan2scene_command(args, use_gpu=settings.plan2scene_gpu_enabled)
-            elapsed = time.time() - start_time
-            logger.info(f"Stage {stage_name}: DONE in {elapsed:.1f}s")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=True,
-                output_dir=output_dir
-            )
-        except Plan2SceneCommandError as e:
-            elapsed = time.time() - start_time
-            logger.error(f"Stage {stage_name}: FAILED after {elapsed:.1f}s - {e}")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=False,
-                error_message=str(e)
-            )
+        return await self._run_stage_command(stage_name, args, output_dir, use_gpu=settings.plan2scene_gpu_enabled)
     
-    def _run_embed_textures(self, split: str, drop: float, custom_data_paths: Path) -> PipelineStageResult:
+    async def _run_embed_textures(self, split: str, drop: float, custom_data_paths: Path) -> PipelineStageResult:
         """Stage 5: Embed textures into scene.json.
         
         Plan2Scene CLI signature:
@@ -594,29 +976,10 @@ class Plan2ScenePreprocessor:
         if custom_data_paths and custom_data_paths.exists():
             args.extend(["--data-paths", str(custom_data_paths)])
         
-        import time
         stage_name = "embed_textures"
-        logger.info(f"Stage {stage_name}: START")
-        start_time = time.time()
-        try:
-            run_plan2scene_command(args, use_gpu=settings.plan2scene_gpu_enabled)
-            elapsed = time.time() - start_time
-            logger.info(f"Stage {stage_name}: DONE in {elapsed:.1f}s")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=True,
-                output_dir=output_path
-            )
-        except Plan2SceneCommandError as e:
-            elapsed = time.time() - start_time
-            logger.error(f"Stage {stage_name}: FAILED after {elapsed:.1f}s - {e}")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=False,
-                error_message=str(e)
-            )
+        return await self._run_stage_command(stage_name, args, output_path, use_gpu=settings.plan2scene_gpu_enabled)
     
-    def _run_rendering(self, split: str, drop: float, custom_data_paths: Path) -> PipelineStageResult:
+    async def _run_rendering(self, split: str, drop: float, custom_data_paths: Path) -> PipelineStageResult:
         """Stage 6: Render PNG previews.
         
         Plan2Scene CLI signature:
@@ -658,25 +1021,5 @@ class Plan2ScenePreprocessor:
         if custom_data_paths and custom_data_paths.exists():
             args.extend(["--data-paths", str(custom_data_paths)])
         
-        import time
         stage_name = "render_house_jsons"
-        logger.info(f"Stage {stage_name}: START")
-        start_time = time.time()
-        try:
-            run_plan2scene_command(args, use_gpu=settings.plan2scene_gpu_enabled)
-            elapsed = time.time() - start_time
-            logger.info(f"Stage {stage_name}: DONE in {elapsed:.1f}s")
-            # Renders are created alongside the arch.json files
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=True,
-                output_dir=search_path
-            )
-        except Plan2SceneCommandError as e:
-            elapsed = time.time() - start_time
-            logger.error(f"Stage {stage_name}: FAILED after {elapsed:.1f}s - {e}")
-            return PipelineStageResult(
-                stage_name=stage_name,
-                success=False,
-                error_message=str(e)
-            )
+        return await self._run_stage_command(stage_name, args, search_path, use_gpu=settings.plan2scene_gpu_enabled)
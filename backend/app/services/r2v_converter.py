@@ -11,6 +11,7 @@ import json
 
 from app.config import settings
 from app.services.plan2scene_commands import run_r2v_command, Plan2SceneCommandError
+from app.services.job_logs import StageLog
 
 logger = logging.getLogger(__name__)
 
@@ -137,11 +138,12 @@ def normalize_scene_json(scene_path: Path) -> Tuple[int, int, str, str]:
     return room_count, normalized_room_count, original_id, normalized_id
 
 
-def convert_r2v_to_scene_json(
+async def convert_r2v_to_scene_json(
     r2v_output_path: Path,
     out_dir: Path,
     scale_factor: float = 0.08,
-    r2v_annot: bool = False
+    r2v_annot: bool = False,
+    log: Optional[StageLog] = None
 ) -> Path:
     """
     Convert R2V output to Plan2Scene scene.json format.
@@ -154,6 +156,7 @@ def convert_r2v_to_scene_json(
         out_dir: Output directory for generated scene.json
         scale_factor: Scale factor for coordinate conversion (default: 0.08 per Plan2Scene docs)
         r2v_annot: Whether the input is an R2V annotation file (vs direct vector)
+        log: Stage log that receives the converter's output
     
     Returns:
         Path to the generated *.scene.json file
@@ -204,7 +207,7 @@ def convert_r2v_to_scene_json(
     logger.info(f"  R2V annotation format: {r2v_annot}")
     
     try:
-        result = run_r2v_command(args)
+        result = await run_r2v_command(args, timeout=settings.stage_timeout("convert_r2v"), log=log)
         logger.info(f"✓ R2V conversion completed successfully")
         
         # The R2V converter saves files based on the input filename, not the output directory
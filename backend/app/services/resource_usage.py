@@ -0,0 +1,183 @@
+"""
+Per-stage resource accounting.
+
+When RESOURCE_ACCOUNTING is on, stage commands are started through
+`rusage_shim.py`, which waits for the command with os.wait4 and reports the
+CPU time, peak RSS and storage I/O of the command and everything it spawned.
+While the command runs, ProcessTreeSampler reads /proc every
+RESOURCE_SAMPLE_INTERVAL seconds for the stage's process group, which adds
+the peak combined RSS of processes running at the same time (wait4 only
+knows the largest single process) and keeps I/O figures for commands that
+are killed before the shim can report.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SHIM_PATH = Path(__file__).resolve().parent / "rusage_shim.py"
+
+_PROC = Path("/proc")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+@dataclass
+class ResourceUsage:
+    """Resources consumed by one stage command and its descendants."""
+    wall_seconds: float = 0.0
+    user_cpu_seconds: float = 0.0
+    sys_cpu_seconds: float = 0.0
+    max_rss_bytes: int = 0  # Largest single process (wait4)
+    peak_tree_rss_bytes: int = 0  # Largest sampled sum over the process group
+    peak_processes: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def combined(self, other: Optional["ResourceUsage"]) -> "ResourceUsage":
+        """Usage of two runs together: times and I/O add up, peaks take the larger."""
+        if other is None:
+            return self
+        return ResourceUsage(
+            wall_seconds=round(self.wall_seconds + other.wall_seconds, 3),
+            user_cpu_seconds=round(self.user_cpu_seconds + other.user_cpu_seconds, 3),
+            sys_cpu_seconds=round(self.sys_cpu_seconds + other.sys_cpu_seconds, 3),
+            max_rss_bytes=max(self.max_rss_bytes, other.max_rss_bytes),
+            peak_tree_rss_bytes=max(self.peak_tree_rss_bytes, other.peak_tree_rss_bytes),
+            peak_processes=max(self.peak_processes, other.peak_processes),
+            read_bytes=self.read_bytes + other.read_bytes,
+            write_bytes=self.write_bytes + other.write_bytes,
+        )
+
+    def share(self, parts: int) -> "ResourceUsage":
+        """One of `parts` equal shares of a run: times and I/O are divided, peaks are kept."""
+        if parts <= 1:
+            return self
+        return ResourceUsage(
+            wall_seconds=round(self.wall_seconds / parts, 3),
+            user_cpu_seconds=round(self.user_cpu_seconds / parts, 3),
+            sys_cpu_seconds=round(self.sys_cpu_seconds / parts, 3),
+            max_rss_bytes=self.max_rss_bytes,
+            peak_tree_rss_bytes=self.peak_tree_rss_bytes,
+            peak_processes=self.peak_processes,
+            read_bytes=self.read_bytes // parts,
+            write_bytes=self.write_bytes // parts,
+        )
+
+
+def wrap_command(args: List[str]) -> Tuple[List[str], Path]:
+    """
+    Prefix `args` with the rusage shim.
+
+    Returns:
+        (wrapped args, path the shim writes its JSON report to)
+    """
+    fd, report = tempfile.mkstemp(prefix="p2s-rusage-", suffix=".json")
+    os.close(fd)
+    return [sys.executable, str(SHIM_PATH), report, "--", *args], Path(report)
+
+
+def read_shim_report(report: Path) -> Dict[str, Any]:
+    """Load and delete a shim report; empty if the shim never wrote one."""
+    try:
+        text = report.read_text()
+        return json.loads(text) if text else {}
+    except (OSError, ValueError):
+        return {}
+    finally:
+        report.unlink(missing_ok=True)
+
+
+def _read_stat(pid: str) -> Optional[Tuple[int, int]]:
+    """(process group, RSS bytes) from /proc/<pid>/stat, or None if it is gone."""
+    try:
+        stat = (_PROC / pid / "stat").read_text()
+    except OSError:
+        return None
+    # Fields after the parenthesised command name: state ppid pgrp ... rss is the 22nd
+    fields = stat[stat.rfind(")") + 2:].split()
+    return int(fields[2]), int(fields[21]) * _PAGE_SIZE
+
+
+def _read_io(pid: str) -> Optional[Tuple[int, int]]:
+    try:
+        text = (_PROC / pid / "io").read_text()
+    except OSError:
+        return None
+    values = dict(line.split(": ", 1) for line in text.splitlines())
+    return int(values.get("read_bytes", 0)), int(values.get("write_bytes", 0))
+
+
+class ProcessTreeSampler:
+    """Periodic /proc sampling of every process in one process group."""
+
+    def __init__(self, pgid: int, interval: float):
+        self.pgid = pgid
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_processes = 0
+        # Last I/O counters seen per pid; processes that exit keep their last sample
+        self._io: Dict[str, Tuple[int, int]] = {}
+
+    @property
+    def available(self) -> bool:
+        return sys.platform.startswith("linux") and _PROC.is_dir()
+
+    def sample(self) -> None:
+        rss = 0
+        count = 0
+        for pid in os.listdir(_PROC):
+            if not pid.isdigit():
+                continue
+            stat = _read_stat(pid)
+            if stat is None or stat[0] != self.pgid:
+                continue
+            rss += stat[1]
+            count += 1
+            io = _read_io(pid)
+            if io is not None:
+                self._io[pid] = io
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_processes = max(self.peak_processes, count)
+
+    @property
+    def io_bytes(self) -> Tuple[int, int]:
+        return (
+            sum(read for read, _ in self._io.values()),
+            sum(write for _, write in self._io.values()),
+        )
+
+    async def run(self) -> None:
+        """Sample until cancelled."""
+        if not self.available:
+            return
+        while True:
+            try:
+                await asyncio.to_thread(self.sample)
+            except Exception as e:
+                logger.debug(f"Process sampling for group {self.pgid} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+def combine_usage(report: Dict[str, Any], sampler: Optional[ProcessTreeSampler], wall_seconds: float) -> ResourceUsage:
+    """Merge the shim report with the sampler's view of the process group."""
+    usage = ResourceUsage(wall_seconds=round(wall_seconds, 3))
+    for name in ("user_cpu_seconds", "sys_cpu_seconds", "max_rss_bytes", "read_bytes", "write_bytes"):
+        if name in report:
+            setattr(usage, name, report[name])
+    if sampler is not None:
+        usage.peak_tree_rss_bytes = max(sampler.peak_rss, usage.max_rss_bytes)
+        usage.peak_processes = sampler.peak_processes
+        if "read_bytes" not in report:
+            usage.read_bytes, usage.write_bytes = sampler.io_bytes
+    return usage
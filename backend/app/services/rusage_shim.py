@@ -0,0 +1,89 @@
+"""
+Resource accounting wrapper for stage commands.
+
+Usage:
+    python rusage_shim.py <result.json> -- <command> [args...]
+
+Runs the command as a child, waits for it with os.wait4 and writes its
+resource usage to <result.json>: CPU time and peak RSS of the command and
+every descendant it waited for, plus the bytes the tree read from and wrote
+to storage (from /proc/self/io, which absorbs the I/O of reaped children).
+The shim then exits with the command's status, or re-raises the signal
+that killed it, so callers see the same return code as without the shim.
+
+Kept free of app imports: it runs under the stage's interpreter and cwd.
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+
+def _read_proc_io():
+    """read_bytes/write_bytes from /proc/self/io, or {} where unavailable."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ", 1) for line in f.read().splitlines())
+        return {
+            "read_bytes": int(fields.get("read_bytes", 0)),
+            "write_bytes": int(fields.get("write_bytes", 0)),
+        }
+    except (OSError, ValueError):
+        return {}
+
+
+def main(argv):
+    if len(argv) < 4 or argv[2] != "--":
+        sys.stderr.write("usage: rusage_shim.py <result.json> -- <command> [args...]\n")
+        return 2
+    result_path, command = argv[1], argv[3:]
+
+    start = time.monotonic()
+    try:
+        child = subprocess.Popen(command)
+    except OSError as e:
+        sys.stderr.write(f"{command[0]}: {e}\n")
+        return 127
+
+    # Forward termination requests to the command
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda sig, _frame: child.send_signal(sig))
+
+    while True:
+        try:
+            _pid, status, rusage = os.wait4(child.pid, 0)
+            break
+        except InterruptedError:
+            continue
+    wall = time.monotonic() - start
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_scale = 1 if sys.platform == "darwin" else 1024
+    usage = {
+        "wall_seconds": round(wall, 3),
+        "user_cpu_seconds": round(rusage.ru_utime, 3),
+        "sys_cpu_seconds": round(rusage.ru_stime, 3),
+        "max_rss_bytes": rusage.ru_maxrss * rss_scale,
+        "read_bytes": rusage.ru_inblock * 512,
+        "write_bytes": rusage.ru_oublock * 512,
+    }
+    usage.update(_read_proc_io())
+    try:
+        with open(result_path, "w") as f:
+            json.dump(usage, f)
+    except OSError as e:
+        sys.stderr.write(f"rusage_shim: could not write {result_path}: {e}\n")
+
+    if os.WIFSIGNALED(status):
+        signum = os.WTERMSIG(status)
+        if signum not in (signal.SIGKILL, signal.SIGSTOP):
+            signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+    return os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
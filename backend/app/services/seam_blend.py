@@ -0,0 +1,159 @@
+"""
+Built-in seam correction: make texture crops tileable with NumPy.
+
+Usage:
+    python seam_blend.py <input_dir> <output_dir> [--method periodic|offset] [--blend-width F]
+
+Reads every image under <input_dir> (the tileable_texture_crops tree) and
+writes a tileable version at the same relative path under <output_dir>
+(texture_crops). Crops of the same size are stacked and processed as one
+array, in chunks of --batch-size, so a job's whole crop set takes a few
+vectorized passes in a single process. Other files are copied as they are.
+
+Methods:
+- periodic: gradient-domain edge blending. The periodic component of the
+  periodic-plus-smooth decomposition (Moisan 2011), computed with one FFT
+  over the batch. It removes the smooth field that causes the left/right
+  and top/bottom edge discontinuities and keeps all detail.
+- offset: offset-and-blend. The crop is rolled by half its size, which
+  tiles seamlessly but has a seam cross in the middle, then cross-faded
+  with the original over --blend-width of each edge, so the borders come
+  from the rolled copy and the centre from the original.
+
+Kept free of app imports: it runs as a stage command under the Plan2Scene
+interpreter, which provides numpy and Pillow.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+from collections import defaultdict
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg")
+
+
+def periodic_component(batch):
+    """Periodic component of a (B, H, W, C) float batch (periodic-plus-smooth decomposition)."""
+    import numpy as np
+
+    _, height, width, _ = batch.shape
+    boundary = np.zeros_like(batch)
+    boundary[:, 0] = batch[:, -1] - batch[:, 0]
+    boundary[:, -1] = -boundary[:, 0]
+    column = batch[:, :, -1] - batch[:, :, 0]
+    boundary[:, :, 0] += column
+    boundary[:, :, -1] -= column
+
+    rows = np.cos(2.0 * np.pi * np.arange(height) / height)[:, None]
+    cols = np.cos(2.0 * np.pi * np.arange(width) / width)[None, :]
+    denominator = 2.0 * rows + 2.0 * cols - 4.0
+    denominator[0, 0] = 1.0
+    spectrum = np.fft.fft2(boundary, axes=(1, 2)) / denominator[None, :, :, None]
+    spectrum[:, 0, 0] = 0.0
+    smooth = np.real(np.fft.ifft2(spectrum, axes=(1, 2)))
+    return batch - smooth
+
+
+def offset_blend(batch, blend_width):
+    """Cross-fade a (B, H, W, C) float batch with its half-size roll near the edges."""
+    import numpy as np
+
+    _, height, width, _ = batch.shape
+    rolled = np.roll(batch, (height // 2, width // 2), axis=(1, 2))
+
+    def ramp(size):
+        # 0 at the edges, rising to 1 within blend_width of the size (at most half of it)
+        span = max(1.0, min(blend_width, 0.5) * size)
+        distance = np.minimum(np.arange(size), np.arange(size)[::-1]) + 0.5
+        return np.clip(distance / span, 0.0, 1.0)
+
+    weight = np.minimum(ramp(height)[:, None], ramp(width)[None, :])[None, :, :, None]
+    return weight * batch + (1.0 - weight) * rolled
+
+
+def make_tileable(batch, method, blend_width):
+    if method == "offset":
+        return offset_blend(batch, blend_width)
+    return periodic_component(batch)
+
+
+def _replace(path, write):
+    """
+    Write `path` through a temporary file in the same directory, then rename
+    it over the target: the old file may be a hardlink to crops or cache
+    entries that must not change.
+    """
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    # Keep the suffix so PIL still infers the format
+    temp = os.path.join(directory, f".{name}.{os.getpid()}.tmp{os.path.splitext(name)[1]}")
+    try:
+        write(temp)
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.unlink(temp)
+        raise
+
+
+def _save(image, path):
+    from PIL import Image
+
+    _replace(path, Image.fromarray(image).save)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--method", choices=("periodic", "offset"), default="periodic")
+    parser.add_argument("--blend-width", type=float, default=0.25, help="offset: blended fraction of each edge")
+    parser.add_argument("--batch-size", type=int, default=64, help="crops per vectorized pass")
+    args = parser.parse_args(argv[1:])
+
+    import numpy as np
+    from PIL import Image
+
+    if not os.path.isdir(args.input_dir):
+        print(f"No crops at {args.input_dir}; nothing to correct")
+        os.makedirs(args.output_dir, exist_ok=True)
+        return 0
+
+    # Group crops by (size, mode) so each group stacks into one array
+    groups = defaultdict(list)
+    copied = 0
+    for dirpath, _dirnames, filenames in os.walk(args.input_dir):
+        for name in sorted(filenames):
+            source = os.path.join(dirpath, name)
+            target = os.path.join(args.output_dir, os.path.relpath(source, args.input_dir))
+            if not name.lower().endswith(IMAGE_SUFFIXES):
+                _replace(target, lambda temp, source=source: shutil.copy2(source, temp))
+                copied += 1
+                continue
+            with Image.open(source) as image:
+                mode = image.mode if image.mode in ("L", "RGB", "RGBA") else "RGB"
+                groups[(image.size, mode)].append((source, target))
+
+    corrected = 0
+    for (_size, mode), crops in groups.items():
+        for start in range(0, len(crops), args.batch_size):
+            chunk = crops[start:start + args.batch_size]
+            arrays = []
+            for source, _target in chunk:
+                with Image.open(source) as image:
+                    array = np.asarray(image.convert(mode), dtype=np.float32)
+                arrays.append(array[..., None] if array.ndim == 2 else array)
+            batch = np.stack(arrays)
+            result = np.clip(np.rint(make_tileable(batch, args.method, args.blend_width)), 0, 255).astype(np.uint8)
+            for (_source, target), image in zip(chunk, result):
+                _save(image[..., 0] if mode == "L" else image, target)
+            corrected += len(chunk)
+            print(f"Corrected {corrected} crops", flush=True)
+
+    print(f"Made {corrected} crops tileable ({args.method}); copied {copied} other files")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,195 @@
+"""
+Cross-job cache of stage outputs.
+
+Templated floor plans come back again and again, and for the same layout
+room embeddings, VGG crop selection and GNN texture propagation compute
+the same outputs every time. StageCache stores the output tree of those
+stages under STAGE_CACHE_DIR, addressed by a hash of:
+
+- the house's scene.json, normalized (parsed and re-serialized with sorted keys)
+- the house key, since Plan2Scene names its outputs after it
+- the stage's script, config and checkpoint contents
+- the stage parameters (split, drop)
+
+On a hit the cached files are hardlinked into the job's `plan2scene_data`
+(copied when the cache is on another filesystem) and the stage does not
+run. Entries are written to a temporary directory and renamed into place,
+so concurrent processes never see partial entries. Every hit refreshes
+the entry's last-use time. Once the cache holds more than
+STAGE_CACHE_MAX_BYTES, the least recently used entries are evicted.
+
+Materialized files share their inodes with the cache. A stage that runs
+for real in that data root would overwrite them in place, so
+detach_outputs() first replaces hardlinked files in its outputs with
+private copies.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.services.file_links import materialize_file
+from app.services.stage_dag import Artifact, artifact_digest
+
+logger = logging.getLogger(__name__)
+
+# Stages whose outputs depend only on the scene, the models and their parameters
+CACHEABLE_STAGES = ("fill_room_embeddings", "vgg_crop_selector", "gnn_texture_prop")
+
+_META = "meta.json"
+
+
+def normalized_scene_digest(scene_json_path: Path) -> str:
+    """Hash of a scene.json that ignores formatting and key order."""
+    try:
+        data = json.loads(Path(scene_json_path).read_text())
+    except ValueError:
+        return hashlib.sha256(Path(scene_json_path).read_bytes()).hexdigest()
+    normalized = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def detach_outputs(artifacts: List[Artifact]) -> None:
+    """Give hardlinked files in `artifacts` their own inode before a stage rewrites them."""
+    for artifact in artifacts:
+        if not artifact.path.exists():
+            continue
+        for _rel, path in artifact.files():
+            if path.stat().st_nlink > 1:
+                private = path.with_name(f".{path.name}.detach")
+                shutil.copy2(path, private)
+                os.replace(private, path)
+
+
+class StageCache:
+    """Content-addressed store of stage output trees with LRU eviction."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def key(
+        self,
+        stage_name: str,
+        scene_digest: str,
+        house_key: str,
+        code: List[Path],
+        params: Dict[str, Any]
+    ) -> str:
+        payload = {
+            "stage": stage_name,
+            "scene": scene_digest,
+            "house": house_key,
+            "code": {str(path): artifact_digest(Artifact(path)) for path in code},
+            "params": params,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def materialize(self, key: str, outputs: List[Artifact]) -> bool:
+        """
+        Link a cached entry's files into the stage's output artifacts.
+
+        Returns:
+            True on a hit; False on a miss or if the entry vanished while linking
+        """
+        entry = self._entry(key)
+        meta = entry / _META
+        if not meta.exists():
+            return False
+        try:
+            for index, artifact in enumerate(outputs):
+                source = entry / str(index)
+                for rel, path in Artifact(source).files():
+                    materialize_file(path, artifact.path / rel, mode="hardlink")
+            os.utime(meta)
+        except OSError as e:
+            # Typically evicted by another process mid-way; the stage runs and overwrites what was linked
+            logger.warning(f"Could not use stage cache entry {key[:12]}: {e}")
+            return False
+        return True
+
+    def store(self, key: str, stage_name: str, outputs: List[Artifact]) -> None:
+        """Copy a stage's outputs into the cache under `key`, then evict down to the size cap."""
+        entry = self._entry(key)
+        if (entry / _META).exists():
+            return
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=f".{key}.", dir=entry.parent))
+        size = 0
+        try:
+            for index, artifact in enumerate(outputs):
+                for rel, path in artifact.files():
+                    # Entries must not share inodes with job files: clone or copy
+                    dest = staging / str(index) / rel
+                    materialize_file(path, dest, mode="reflink")
+                    size += dest.stat().st_size
+            (staging / _META).write_text(json.dumps({"stage": stage_name, "size": size, "created": time.time()}))
+            os.rename(staging, entry)
+        except OSError as e:
+            # Another process stored the same entry first, or the disk is full
+            shutil.rmtree(staging, ignore_errors=True)
+            if not (entry / _META).exists():
+                logger.warning(f"Could not cache {stage_name} outputs: {e}")
+            return
+        logger.info(f"Cached {stage_name} outputs ({size} bytes) as {key[:12]}")
+        self.evict()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Every complete entry with its size and last use, least recently used first."""
+        found = []
+        for meta in self.root.glob(f"*/*/{_META}"):
+            if meta.parent.name.startswith("."):
+                continue  # Being stored or evicted
+            try:
+                info = json.loads(meta.read_text())
+                found.append({"path": meta.parent, "size": info.get("size", 0), "last_used": meta.stat().st_mtime})
+            except (OSError, ValueError):
+                continue
+        return sorted(found, key=lambda entry: entry["last_used"])
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = self.entries()
+            total = sum(entry["size"] for entry in entries)
+            for entry in entries:
+                if total <= self.max_bytes:
+                    break
+                # Rename first so readers never link from a half-deleted entry
+                doomed = entry["path"].with_name(f".{entry['path'].name}.evict")
+                try:
+                    os.rename(entry["path"], doomed)
+                except OSError:
+                    continue
+                shutil.rmtree(doomed, ignore_errors=True)
+                total -= entry["size"]
+                logger.info(f"Evicted stage cache entry {entry['path'].name[:12]} ({entry['size']} bytes)")
+
+
+_cache: Optional[StageCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_stage_cache() -> Optional[StageCache]:
+    """Return the shared stage cache, or None if STAGE_CACHE_MAX_BYTES is 0."""
+    global _cache
+    if settings.STAGE_CACHE_MAX_BYTES <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = StageCache(settings.stage_cache_dir, settings.STAGE_CACHE_MAX_BYTES)
+    return _cache
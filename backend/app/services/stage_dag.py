@@ -0,0 +1,225 @@
+"""
+Declarative stage graph with a content-hash manifest.
+
+Each preprocessing stage is declared as a StageSpec: the artifacts (files
+or directory trees) it reads and writes, the code and config files it runs,
+and its parameters. StageGraph orders the stages by the dependencies those
+declarations imply: a stage depends on every stage whose outputs overlap
+its inputs.
+
+StageManifest (`<data root>/stage_manifest.json`) records, for each stage
+that succeeded, a key hashing the contents of its inputs, code and
+parameters, and the hash of the outputs it produced. A stage whose key is
+unchanged and whose outputs still hash to the recorded value is up to date
+and is skipped, so a rerun after editing one input only repeats the stages
+that input reaches.
+
+Artifacts inside a directory another stage owns (e.g. `archs/` under the
+VGG crop selection output) are carved out with `exclude`, which takes
+relative subpaths or file name globs.
+"""
+
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Artifact:
+    """A file or directory tree a stage reads or writes, minus excluded parts."""
+    path: Path
+    exclude: Tuple[str, ...] = ()
+
+    def excludes(self, rel: str) -> bool:
+        """True if the relative path (file or directory) is carved out of this artifact."""
+        for pattern in self.exclude:
+            if rel == pattern or rel.startswith(pattern + "/") or fnmatch.fnmatch(os.path.basename(rel), pattern):
+                return True
+        return False
+
+    def files(self) -> List[Tuple[str, Path]]:
+        """(relative path, path) of every file in the artifact, sorted."""
+        if self.path.is_file():
+            return [(self.path.name, self.path)]
+        found = []
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            base = Path(dirpath)
+            rel_base = base.relative_to(self.path).as_posix()
+            prefix = "" if rel_base == "." else rel_base + "/"
+            dirnames[:] = sorted(name for name in dirnames if not self.excludes(prefix + name))
+            for name in filenames:
+                if not self.excludes(prefix + name):
+                    found.append((prefix + name, base / name))
+        return sorted(found)
+
+    def overlaps(self, other: "Artifact") -> bool:
+        """True if the two artifacts share any path once exclusions are applied."""
+        if self.path == other.path:
+            return True
+        if other.path.is_relative_to(self.path):
+            return not self.excludes(other.path.relative_to(self.path).as_posix())
+        if self.path.is_relative_to(other.path):
+            return not other.excludes(self.path.relative_to(other.path).as_posix())
+        return False
+
+
+# Content digests of files, keyed by (path, size, mtime) so large
+# checkpoints are read once per process
+_file_digests: Dict[Tuple[str, int, int], str] = {}
+_file_digests_lock = threading.Lock()
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's contents."""
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    with _file_digests_lock:
+        cached = _file_digests.get(key)
+    if cached is not None:
+        return cached
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _file_digests_lock:
+        _file_digests[key] = value
+    return value
+
+
+def artifact_digest(artifact: Artifact) -> Optional[str]:
+    """Hash of an artifact's file names and contents, or None if it does not exist."""
+    if not artifact.path.exists():
+        return None
+    digest = hashlib.sha256()
+    for rel, path in artifact.files():
+        digest.update(rel.encode())
+        digest.update(b"\0")
+        digest.update(file_digest(path).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+@dataclass
+class StageSpec:
+    """A stage's declared inputs, outputs, code and parameters, and how to run it."""
+    name: str
+    run: Callable[[], Awaitable[Any]]
+    inputs: List[Artifact] = field(default_factory=list)
+    outputs: List[Artifact] = field(default_factory=list)
+    code: List[Path] = field(default_factory=list)  # Scripts, configs, checkpoints; missing ones hash as absent
+    params: Dict[str, Any] = field(default_factory=dict)
+    optional: bool = False  # Failure is logged and does not stop the graph
+
+    def key(self) -> str:
+        """Hash of everything that determines the stage's outputs."""
+        payload = {
+            "stage": self.name,
+            "inputs": {str(artifact.path): artifact_digest(artifact) for artifact in self.inputs},
+            "code": {str(path): artifact_digest(Artifact(path)) for path in self.code},
+            "params": self.params,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def outputs_digest(self) -> Optional[str]:
+        """Combined hash of the stage's outputs, or None if any is missing."""
+        digests = [artifact_digest(artifact) for artifact in self.outputs]
+        if any(digest is None for digest in digests):
+            return None
+        return hashlib.sha256("\n".join(digests).encode()).hexdigest()
+
+
+class StageGraph:
+    """Stages ordered so each runs after every stage whose outputs it reads."""
+
+    def __init__(self, specs: List[StageSpec]):
+        self.specs = {spec.name: spec for spec in specs}
+        self.dependencies: Dict[str, List[str]] = {
+            spec.name: [
+                other.name for other in specs
+                if other is not spec and any(
+                    needed.overlaps(produced) for needed in spec.inputs for produced in other.outputs
+                )
+            ]
+            for spec in specs
+        }
+        self.order = self._sort([spec.name for spec in specs])
+
+    def _sort(self, declared: List[str]) -> List[StageSpec]:
+        """Topological order, keeping declaration order among independent stages."""
+        ordered: List[str] = []
+        while len(ordered) < len(declared):
+            ready = [
+                name for name in declared
+                if name not in ordered and all(dep in ordered for dep in self.dependencies[name])
+            ]
+            if not ready:
+                remaining = [name for name in declared if name not in ordered]
+                raise ValueError(f"Stage dependencies form a cycle among: {', '.join(remaining)}")
+            ordered.append(ready[0])
+        return [self.specs[name] for name in ordered]
+
+    def __iter__(self):
+        return iter(self.order)
+
+
+class StageManifest:
+    """Per-data-root record of the inputs and outputs of every stage that succeeded."""
+
+    FILENAME = "stage_manifest.json"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    @classmethod
+    def for_data_root(cls, data_root: Path) -> "StageManifest":
+        return cls(Path(data_root) / cls.FILENAME)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path.exists():
+            return {}
+        try:
+            return json.loads(self.path.read_text()).get("stages", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable stage manifest {self.path}: {e}")
+            return {}
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"stages": self._entries}, indent=2))
+        os.replace(tmp_path, self.path)
+
+    def is_up_to_date(self, spec: StageSpec, key: str) -> bool:
+        """True if the stage last succeeded with this key and its outputs are unchanged since."""
+        entry = self._entries.get(spec.name)
+        if entry is None or entry.get("key") != key:
+            return False
+        return entry.get("outputs") is not None and spec.outputs_digest() == entry["outputs"]
+
+    def record(self, spec: StageSpec, key: str) -> None:
+        with self._lock:
+            self._entries[spec.name] = {
+                "key": key,
+                "outputs": spec.outputs_digest(),
+                "completed_at": datetime.utcnow().isoformat(),
+            }
+            self._save()
+
+    def invalidate(self, stage_name: str) -> None:
+        with self._lock:
+            if self._entries.pop(stage_name, None) is not None:
+                self._save()
@@ -0,0 +1,83 @@
+"""
+Per-job stage journal.
+
+Records which pipeline stages of a job completed and what they produced, in
+`<job_dir>/stage_journal.json`. A retried or recovered job consults the
+journal to resume from the first incomplete stage instead of recomputing
+stages whose outputs are already on disk.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StageJournal:
+    """JSON-file journal of completed stages for one job."""
+
+    FILENAME = "stage_journal.json"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    @classmethod
+    def for_job_dir(cls, job_dir: Path) -> "StageJournal":
+        return cls(Path(job_dir) / cls.FILENAME)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path.exists():
+            return {}
+        try:
+            return json.loads(self.path.read_text()).get("stages", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable stage journal {self.path}: {e}")
+            return {}
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"stages": self._entries}, indent=2))
+        os.replace(tmp_path, self.path)
+
+    def get(self, stage_name: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(stage_name)
+
+    def is_complete(self, stage_name: str) -> bool:
+        """True if the stage was recorded and its output directory still exists."""
+        entry = self._entries.get(stage_name)
+        if entry is None:
+            return False
+        output_dir = entry.get("output_dir")
+        return output_dir is None or Path(output_dir).exists()
+
+    def record(
+        self,
+        stage_name: str,
+        output_dir: Optional[Path] = None,
+        duration: Optional[float] = None,
+        **outputs: Any
+    ) -> None:
+        """Mark a stage complete along with its output directory and any named outputs."""
+        with self._lock:
+            self._entries[stage_name] = {
+                "completed_at": datetime.utcnow().isoformat(),
+                "output_dir": str(output_dir) if output_dir else None,
+                "duration": duration,
+                "outputs": {key: str(value) for key, value in outputs.items()},
+            }
+            self._save()
+
+    def first_incomplete(self, stage_order: Iterable[str]) -> Optional[str]:
+        """Return the first stage in `stage_order` that has not completed, or None."""
+        for stage_name in stage_order:
+            if not self.is_complete(stage_name):
+                return stage_name
+        return None
@@ -0,0 +1,77 @@
+"""
+Retry and timeout policies for pipeline stages.
+
+A stage command that fails transiently (killed by the OOM killer, a file
+race with a concurrent job, a flaky GPU driver) is rerun in place with
+exponential backoff instead of failing the whole job. Whether a failure is
+transient is decided by its return code and the tail of its stderr; every
+other failure, and by default a timeout, fails the stage on the first
+attempt as before.
+"""
+
+import re
+from dataclasses import dataclass, field, replace
+from typing import FrozenSet, Optional, Tuple
+
+from app.config import settings
+from app.services.plan2scene_commands import Plan2SceneCommandError, Plan2SceneCommandTimeout
+
+# Killed by SIGKILL/SIGTERM (e.g. the OOM killer), directly or as reported by a wrapping shell
+TRANSIENT_RETURNCODES = frozenset({-9, -15, 137, 143})
+
+# stderr lines that indicate a transient condition rather than a bug or bad input
+TRANSIENT_STDERR_PATTERNS = (
+    r"Resource temporarily unavailable",
+    r"Too many open files",
+    r"Cannot allocate memory",
+    r"No space left on device",
+    r"Bus error",
+    r"Stale file handle",
+    r"BrokenPipeError",
+    r"ConnectionResetError",
+    r"CUDA error: (an illegal memory access|unspecified launch failure)",
+    r"CUDA out of memory",
+)
+
+
+@dataclass(frozen=True)
+class StageRetryPolicy:
+    """How often and under which failures a stage command is rerun."""
+    max_attempts: int = 1
+    backoff: float = 5.0  # Seconds before the first retry
+    backoff_multiplier: float = 2.0
+    max_backoff: float = 300.0
+    timeout: Optional[float] = None  # None: settings.stage_timeout(stage)
+    retry_returncodes: FrozenSet[int] = TRANSIENT_RETURNCODES
+    retry_stderr_patterns: Tuple[str, ...] = TRANSIENT_STDERR_PATTERNS
+    retry_on_timeout: bool = False
+    _compiled: Tuple[re.Pattern, ...] = field(init=False, repr=False, compare=False, default=())
+
+    def __post_init__(self):
+        object.__setattr__(self, "_compiled", tuple(re.compile(p) for p in self.retry_stderr_patterns))
+
+    def stage_timeout(self, stage_name: str) -> Optional[float]:
+        if self.timeout is not None:
+            return self.timeout if self.timeout > 0 else None
+        return settings.stage_timeout(stage_name)
+
+    def is_retryable(self, error: Plan2SceneCommandError) -> bool:
+        if isinstance(error, Plan2SceneCommandTimeout):
+            return self.retry_on_timeout
+        if error.returncode in self.retry_returncodes:
+            return True
+        stderr = error.stderr or ""
+        return any(pattern.search(stderr) for pattern in self._compiled)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Seconds to wait after failed attempt number `attempt` (1-based)."""
+        return min(self.backoff * self.backoff_multiplier ** (attempt - 1), self.max_backoff)
+
+
+def default_stage_policy(**overrides) -> StageRetryPolicy:
+    """The policy from STAGE_MAX_ATTEMPTS / STAGE_RETRY_BACKOFF, with per-stage overrides."""
+    policy = StageRetryPolicy(
+        max_attempts=max(1, settings.STAGE_MAX_ATTEMPTS),
+        backoff=settings.STAGE_RETRY_BACKOFF,
+    )
+    return replace(policy, **overrides) if overrides else policy
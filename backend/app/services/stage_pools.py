@@ -0,0 +1,114 @@
+"""
+Per-resource-class stage pools.
+
+Job slots bound how many pipelines run at once, but a job only uses one
+kind of resource at a time: while one job is in GNN texture propagation on
+the GPU, another could be converting its R2V annotation or rendering on
+the CPU. Every stage therefore declares a resource class (STAGE_RESOURCE_CLASSES)
+and waits for a slot in that class's pool before it runs, so admitting
+more jobs than the GPU can serve (GPU_PIPELINE_SLOTS) turns the pipeline
+into an assembly line instead of oversubscribing the GPU.
+
+Pool sizes come from STAGE_POOLS, e.g. "gpu=1,cpu=2,io=4"; a class that is
+not listed is unbounded. Pools are per API/worker process, like job slots.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_CLASSES = ("gpu", "cpu", "io")
+
+# Resource class of every stage of both GPU pipelines
+STAGE_RESOURCE_CLASSES: Dict[str, str] = {
+    "convert_r2v": "cpu",
+    "fill_room_embeddings": "gpu",
+    "vgg_crop_selector": "gpu",
+    "gnn_texture_prop": "gpu",
+    "seam_correct_textures": "gpu",
+    "embed_textures": "gpu",
+    "render_house_jsons": "cpu",
+}
+
+
+def parse_pool_sizes(spec: str) -> Dict[str, int]:
+    """Parse "gpu=1,cpu=2" into {"gpu": 1, "cpu": 2}, ignoring unknown classes."""
+    sizes: Dict[str, int] = {}
+    for entry in spec.split(","):
+        name, _, value = entry.partition("=")
+        name = name.strip()
+        if not name or not value.strip():
+            continue
+        if name not in RESOURCE_CLASSES:
+            logger.warning(f"Ignoring unknown stage resource class in STAGE_POOLS: {name}")
+            continue
+        sizes[name] = max(1, int(value))
+    return sizes
+
+
+class StagePools:
+    """A bounded pool per resource class; stages hold a slot while they run."""
+
+    def __init__(self, sizes: Dict[str, int]):
+        self.sizes = dict(sizes)
+        self._semaphores = {name: asyncio.Semaphore(size) for name, size in self.sizes.items()}
+        self._in_use: Dict[str, int] = {name: 0 for name in RESOURCE_CLASSES}
+        self._waiting: Dict[str, int] = {name: 0 for name in RESOURCE_CLASSES}
+
+    @asynccontextmanager
+    async def slot(self, resource_class: str) -> AsyncIterator[None]:
+        """Hold a slot in `resource_class`'s pool for the duration of the block."""
+        semaphore = self._semaphores.get(resource_class)
+        if semaphore is not None:
+            self._waiting[resource_class] += 1
+            try:
+                await semaphore.acquire()
+            finally:
+                self._waiting[resource_class] -= 1
+        self._in_use[resource_class] = self._in_use.get(resource_class, 0) + 1
+        try:
+            yield
+        finally:
+            self._in_use[resource_class] -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per class: pool size (0 = unbounded), stages running and stages waiting."""
+        return {
+            name: {
+                "size": self.sizes.get(name, 0),
+                "in_use": self._in_use.get(name, 0),
+                "waiting": self._waiting.get(name, 0),
+            }
+            for name in RESOURCE_CLASSES
+        }
+
+
+_pools: Optional[StagePools] = None
+
+
+def get_stage_pools() -> StagePools:
+    """Return this process's stage pools, sized from STAGE_POOLS."""
+    global _pools
+    if _pools is None:
+        _pools = StagePools(parse_pool_sizes(settings.STAGE_POOLS))
+    return _pools
+
+
+def resource_class_for(stage_name: str) -> str:
+    """A stage's declared class; GPU stages count as CPU when the GPU is disabled."""
+    resource_class = STAGE_RESOURCE_CLASSES.get(stage_name, "cpu")
+    if resource_class == "gpu" and not settings.plan2scene_gpu_enabled:
+        return "cpu"
+    return resource_class
+
+
+def stage_slot(stage_name: str, resource_class: Optional[str] = None):
+    """Hold a pool slot for a stage, in its declared class unless `resource_class` overrides it."""
+    return get_stage_pools().slot(resource_class or resource_class_for(stage_name))
@@ -0,0 +1,275 @@
+"""
+Warm Plan2Scene stage worker.
+
+Usage:
+    python stage_worker_main.py <control fd>
+
+Started by StageWorkerPool with the Plan2Scene environment. Imports torch
+and the Plan2Scene package once, then serves stage scripts one at a time:
+each request on the control socket is a JSON line with the script's argv,
+working directory, environment additions and CPU thread budget. The script
+runs in this interpreter via runpy as `__main__`, exactly as
+`python script.py args...` would, and its output goes to this process's
+stdout/stderr, followed by an end-of-request marker line on each stream.
+The reply is a JSON line with the exit status and resource usage.
+
+Checkpoints read with torch.load are kept in memory keyed by path and
+modification time, so model weights are read and unpickled once per worker.
+Every caller gets a deep copy (a memory copy, far cheaper than the load), so
+a script that moves, loads into or modifies what it loaded cannot leak that
+into the next request. The cache is least-recently-used and bounded by
+STAGE_WORKER_CHECKPOINT_CACHE_BYTES of checkpoint files (0 disables it).
+
+Between requests, modules imported from the script's own directory are
+dropped so their globals start fresh. A script that leaves threads running
+cannot be cleaned up in-process, so the reply asks for the worker to be
+replaced.
+
+The reported max_rss_bytes is the peak of the request itself: the kernel's
+high-water mark is reset before each request (or, where that is not
+supported, RSS is sampled while the request runs), not the worker's
+lifetime peak.
+
+Kept free of app imports: it runs under the Plan2Scene interpreter and cwd.
+"""
+
+import copy
+import importlib
+import json
+import os
+import resource
+import runpy
+import socket
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+END_MARKER = "\x00p2s-stage-end"
+
+# Modules imported before the first request
+PRELOAD = [name for name in os.environ.get("STAGE_WORKER_PRELOAD", "").split(",") if name.strip()]
+
+# Checkpoint cache budget in bytes of checkpoint file size
+CACHE_BYTES = int(os.environ.get("STAGE_WORKER_CHECKPOINT_CACHE_BYTES", str(4 << 30)))
+
+_checkpoints = OrderedDict()  # key -> (loaded object, file size), least recently used first
+_cached_bytes = 0
+
+
+def _preload():
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name.strip())
+        except Exception as e:
+            sys.stderr.write(f"[stage worker] could not preload {name}: {e}\n")
+    _cache_checkpoints()
+
+
+def _cache_checkpoints():
+    """Memoize torch.load for checkpoint files, keyed by path and mtime."""
+    torch = sys.modules.get("torch")
+    if torch is None or getattr(torch.load, "_p2s_cached", False):
+        return
+    original = torch.load
+
+    def cached_load(f, *args, **kwargs):
+        global _cached_bytes
+        if not isinstance(f, (str, os.PathLike)):
+            return original(f, *args, **kwargs)
+        path = os.path.abspath(os.fspath(f))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return original(f, *args, **kwargs)
+        if stat.st_size > CACHE_BYTES:
+            return original(f, *args, **kwargs)
+        key = (path, stat.st_mtime_ns, repr(kwargs.get("map_location")))
+        if key in _checkpoints:
+            _checkpoints.move_to_end(key)
+        else:
+            _checkpoints[key] = (original(f, *args, **kwargs), stat.st_size)
+            _cached_bytes += stat.st_size
+            while _cached_bytes > CACHE_BYTES:
+                _evicted, size = _checkpoints.popitem(last=False)[1]
+                _cached_bytes -= size
+        try:
+            return copy.deepcopy(_checkpoints[key][0])
+        except Exception:
+            # Not copyable (e.g. holds open handles): load a private instance
+            return original(f, *args, **kwargs)
+
+    cached_load._p2s_cached = True
+    torch.load = cached_load
+
+
+def _io_bytes():
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ", 1) for line in f.read().splitlines())
+        return int(fields.get("read_bytes", 0)), int(fields.get("write_bytes", 0))
+    except (OSError, ValueError):
+        return 0, 0
+
+
+def _status_kib(field):
+    """A kB field of /proc/self/status (VmRSS, VmHWM), or None."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class _PeakRss:
+    """Peak RSS of this process over one request."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self._peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        try:
+            # Resets VmHWM to the current RSS (Linux 4.0+)
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            self._exact = _status_kib("VmHWM") is not None
+        except OSError:
+            self._exact = False
+        if not self._exact:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+
+    def _sample(self):
+        while True:
+            self._peak = max(self._peak, _status_kib("VmRSS") or 0)
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self):
+        """Peak RSS in bytes since start()."""
+        if self._exact:
+            return (_status_kib("VmHWM") or 0) * 1024
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, _status_kib("VmRSS") or 0)
+        return self._peak * 1024
+
+
+def _set_threads(threads):
+    if not threads:
+        return
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+                 "PLAN2SCENE_CPU_THREADS"):
+        os.environ[name] = str(threads)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        try:
+            torch.set_num_threads(int(threads))
+        except Exception:
+            pass
+
+
+def _drop_script_modules(script_dir, before):
+    """Forget modules a request imported from its script's directory."""
+    script_dir = os.path.join(os.path.abspath(script_dir), "")
+    for name in set(sys.modules) - before:
+        path = getattr(sys.modules.get(name), "__file__", None) or ""
+        if os.path.abspath(path).startswith(script_dir):
+            del sys.modules[name]
+
+
+def run_request(request):
+    """Run one stage script as __main__ and return its exit status."""
+    argv = request["argv"]
+    saved_argv, saved_path, saved_cwd = sys.argv, list(sys.path), os.getcwd()
+    saved_env = dict(os.environ)
+    saved_modules = set(sys.modules)
+    sys.argv = list(argv)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(argv[0])))
+    os.environ.update(request.get("env") or {})
+    _set_threads(request.get("threads"))
+    try:
+        os.chdir(request.get("cwd") or saved_cwd)
+        runpy.run_path(argv[0], run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        sys.stderr.write(f"{e.code}\n")
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.argv, sys.path[:] = saved_argv, saved_path
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+        _drop_script_modules(os.path.dirname(argv[0]), saved_modules)
+        # Pick up torch if the script imported it for the first time
+        _cache_checkpoints()
+
+
+def main(argv):
+    control = socket.socket(fileno=int(argv[1]))
+    stream = control.makefile("rwb")
+    _preload()
+    while True:
+        line = stream.readline()
+        if not line:
+            return 0
+        request = json.loads(line)
+        threads_before = set(threading.enumerate())
+        start = time.monotonic()
+        self_before = resource.getrusage(resource.RUSAGE_SELF)
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        io_before = _io_bytes()
+        peak_rss = _PeakRss()
+        peak_rss.start()
+
+        returncode = run_request(request)
+
+        self_peak = peak_rss.stop()
+        self_after = resource.getrusage(resource.RUSAGE_SELF)
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        io_after = _io_bytes()
+        rss_scale = 1 if sys.platform == "darwin" else 1024
+        # Children's ru_maxrss is a lifetime maximum too; it only says something about
+        # this request if a child spawned by it set a new maximum
+        children_peak = 0
+        if children_after.ru_maxrss > children_before.ru_maxrss:
+            children_peak = children_after.ru_maxrss * rss_scale
+        usage = {
+            "wall_seconds": round(time.monotonic() - start, 3),
+            "user_cpu_seconds": round(
+                self_after.ru_utime - self_before.ru_utime + children_after.ru_utime - children_before.ru_utime, 3
+            ),
+            "sys_cpu_seconds": round(
+                self_after.ru_stime - self_before.ru_stime + children_after.ru_stime - children_before.ru_stime, 3
+            ),
+            # Peak during this request (resident models included), not the worker's lifetime peak
+            "max_rss_bytes": max(self_peak, children_peak),
+            "read_bytes": io_after[0] - io_before[0],
+            "write_bytes": io_after[1] - io_before[1],
+        }
+        for out in (sys.stdout, sys.stderr):
+            out.write(f"\n{END_MARKER}\n")
+            out.flush()
+        # Threads the script left running would carry its state into the next request
+        leftover = [thread for thread in threading.enumerate() if thread not in threads_before and thread.is_alive()]
+        reply = {"returncode": returncode, "usage": usage, "recycle": bool(leftover)}
+        stream.write((json.dumps(reply) + "\n").encode())
+        stream.flush()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,421 @@
+"""
+Warm stage worker pool.
+
+Every stage in Plan2ScenePreprocessor is a `python script.py ...` command,
+and on small houses most of its run time is interpreter startup: importing
+torch, sitecustomize patching, and loading the GNN checkpoint and VGG
+weights. With STAGE_WORKERS > 0, stage scripts are instead run inside
+long-lived worker processes (`stage_worker_main.py`) that import Plan2Scene
+once and keep loaded checkpoints in memory. A request travels over a local
+socket; the script's output is streamed into the stage log like a
+subprocess's.
+
+A worker runs one script at a time. If every worker is busy, or the command
+is not a plain Python script, the stage falls back to a fresh subprocess.
+Timeouts and job cancellation kill the worker (it is replaced on demand),
+and workers are recycled after STAGE_WORKER_MAX_RUNS scripts, or after a
+script that leaves threads running, so leaks in stage code cannot
+accumulate. Each worker caches at most STAGE_WORKER_CHECKPOINT_CACHE_MB of
+checkpoints.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.lifecycle import JobCancelled, current_run, kill_process_group
+from app.services.cpu_allocator import CpuLease, fallback_thread_env, get_cpu_allocator
+from app.services.job_logs import StageLog, tail_buffer
+from app.services.plan2scene_commands import (
+    CommandResult,
+    Plan2SceneCommandError,
+    Plan2SceneCommandTimeout,
+    plan2scene_env,
+    run_plan2scene_command,
+)
+from app.services.resource_usage import ResourceUsage
+
+logger = logging.getLogger(__name__)
+
+WORKER_MAIN = Path(__file__).resolve().parent / "stage_worker_main.py"
+END_MARKER = "\x00p2s-stage-end"
+
+
+class _Request:
+    """Output routing for the script a worker is currently running."""
+
+    def __init__(self, log: Optional[StageLog]):
+        self.log = log
+        self.tails = {"stdout": tail_buffer(), "stderr": tail_buffer()}
+        self.ended = {"stdout": asyncio.Event(), "stderr": asyncio.Event()}
+
+
+class StageWorker:
+    """One warm worker process and its control connection."""
+
+    def __init__(self, interpreter: str, use_gpu: bool):
+        self.interpreter = interpreter
+        self.use_gpu = use_gpu
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.runs = 0
+        self.retire = False  # Replace instead of reusing once released
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._request: Optional[_Request] = None
+        self._pumps: List[asyncio.Task] = []
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> None:
+        parent_sock, child_sock = socket.socketpair()
+        env = plan2scene_env(self.use_gpu)
+        env["PYTHONUNBUFFERED"] = "1"
+        env["STAGE_WORKER_PRELOAD"] = settings.STAGE_WORKER_PRELOAD
+        env["STAGE_WORKER_CHECKPOINT_CACHE_BYTES"] = str(settings.STAGE_WORKER_CHECKPOINT_CACHE_MB << 20)
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                self.interpreter, str(WORKER_MAIN), str(child_sock.fileno()),
+                cwd=str(settings.PLAN2SCENE_ROOT),
+                env=env,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                pass_fds=(child_sock.fileno(),),
+                start_new_session=True,
+                limit=1024 * 1024
+            )
+        finally:
+            child_sock.close()
+        self._reader, self._writer = await asyncio.open_unix_connection(sock=parent_sock)
+        self._pumps = [
+            asyncio.create_task(self._pump(self.process.stdout, "stdout")),
+            asyncio.create_task(self._pump(self.process.stderr, "stderr")),
+        ]
+        logger.info(f"Started warm stage worker {self.process.pid} (gpu={self.use_gpu})")
+
+    async def _pump(self, stream: asyncio.StreamReader, name: str) -> None:
+        """Route worker output to the current request until the stream closes."""
+        # A blank line is held back one line: the one right before an end marker is the worker's
+        blank_pending = False
+        while True:
+            try:
+                raw = await stream.readline()
+            except ValueError:
+                # Line longer than the stream limit; the reader discarded it
+                continue
+            if not raw:
+                break
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            request = self._request
+            if line == END_MARKER:
+                blank_pending = False
+                if request is not None:
+                    request.ended[name].set()
+                continue
+            if blank_pending:
+                self._emit(request, name, "")
+                blank_pending = False
+            if line == "":
+                blank_pending = True
+                continue
+            self._emit(request, name, line)
+        request = self._request
+        if request is not None:
+            request.ended[name].set()
+
+    @staticmethod
+    def _emit(request: Optional[_Request], name: str, line: str) -> None:
+        if request is None:
+            return
+        request.tails[name].append(line)
+        if request.log is not None:
+            request.log.write_line(line, name)
+            request.log.flush()
+
+    def _pin(self, lease: Optional[CpuLease]) -> None:
+        """Apply a core set (or the allocator's full set) to every thread of the worker."""
+        allocator = get_cpu_allocator()
+        if self.process is None or allocator is None:
+            return
+        cores = lease.cores if lease is not None else allocator.cores
+        try:
+            for tid in os.listdir(f"/proc/{self.process.pid}/task"):
+                os.sched_setaffinity(int(tid), cores)
+        except OSError as e:
+            logger.debug(f"Could not pin stage worker {self.process.pid}: {e}")
+
+    async def run(
+        self,
+        argv: List[str],
+        cwd: Path,
+        timeout: Optional[float],
+        log: Optional[StageLog],
+        threads: Optional[int] = None,
+        lease: Optional[CpuLease] = None
+    ) -> Tuple[int, str, str, Dict[str, Any]]:
+        """
+        Run a script in the worker.
+
+        Returns:
+            (returncode, stdout tail, stderr tail, usage); a worker that died
+            mid-request reports its own exit status
+
+        Raises:
+            Plan2SceneCommandTimeout: If the script ran longer than `timeout`
+        """
+        request = _Request(log)
+        self._request = request
+        self.runs += 1
+        self._pin(lease)
+        run = current_run()
+        if run is not None:
+            run.register_process(self.process)
+        if log is not None:
+            log.write_line(f"$ {' '.join(argv)}  [warm worker {self.process.pid}]")
+        message = {"argv": argv, "cwd": str(cwd), "threads": threads}
+
+        async def exchange() -> Optional[Dict[str, Any]]:
+            self._writer.write((json.dumps(message) + "\n").encode())
+            await self._writer.drain()
+            line = await self._reader.readline()
+            if not line:
+                await self.process.wait()
+                return None
+            await asyncio.gather(request.ended["stdout"].wait(), request.ended["stderr"].wait())
+            return json.loads(line)
+
+        reply = None
+        try:
+            reply = await asyncio.wait_for(exchange(), timeout)
+        except asyncio.TimeoutError:
+            await self.stop()
+            raise Plan2SceneCommandTimeout(
+                message=f"Command timed out after {timeout:.0f}s",
+                command=argv,
+                stderr="\n".join(request.tails["stderr"]),
+                returncode=self.process.returncode
+            )
+        except BaseException:
+            await self.stop()
+            raise
+        finally:
+            if run is not None:
+                run.unregister_process(self.process)
+            self._request = None
+        if reply is None:
+            returncode = self.process.returncode
+            usage: Dict[str, Any] = {}
+            logger.warning(f"Stage worker {self.process.pid} exited with {returncode} during a request")
+        else:
+            returncode = reply["returncode"]
+            usage = reply.get("usage") or {}
+            if reply.get("recycle"):
+                logger.info(f"Stage worker {self.process.pid} has threads left running by {argv[1]}; replacing it")
+                self.retire = True
+        if log is not None:
+            log.write_line(f"[exit {returncode}]")
+            log.flush()
+        return returncode, "\n".join(request.tails["stdout"]), "\n".join(request.tails["stderr"]), usage
+
+    async def stop(self) -> None:
+        """Kill the worker's process group and wait for it."""
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            kill_process_group(self.process)
+            await asyncio.shield(self.process.wait())
+        if self._writer is not None:
+            self._writer.close()
+        for pump in self._pumps:
+            pump.cancel()
+
+
+class StageWorkerPool:
+    """Up to `size` warm workers per process, keyed by interpreter and GPU mode."""
+
+    def __init__(self, size: int, max_runs: int):
+        self.size = size
+        self.max_runs = max_runs
+        self._idle: Dict[Tuple[str, bool], List[StageWorker]] = {}
+        self._live = 0
+
+    async def acquire(self, interpreter: str, use_gpu: bool) -> Optional[StageWorker]:
+        """An idle worker (started if there is room), or None if all are busy."""
+        idle = self._idle.setdefault((interpreter, use_gpu), [])
+        while idle:
+            worker = idle.pop()
+            if worker.alive:
+                return worker
+            self._live -= 1
+        if self._live >= self.size:
+            # Make room by retiring an idle worker of another kind
+            for workers in self._idle.values():
+                if workers:
+                    await workers.pop().stop()
+                    self._live -= 1
+                    break
+            else:
+                return None
+        worker = StageWorker(interpreter, use_gpu)
+        self._live += 1
+        try:
+            await worker.start()
+        except BaseException:
+            self._live -= 1
+            await worker.stop()
+            raise
+        return worker
+
+    async def release(self, worker: StageWorker) -> None:
+        if worker.alive and worker.runs < self.max_runs and not worker.retire:
+            self._idle.setdefault((worker.interpreter, worker.use_gpu), []).append(worker)
+            return
+        self._live -= 1
+        await worker.stop()
+
+    async def shutdown(self) -> None:
+        for workers in self._idle.values():
+            while workers:
+                await workers.pop().stop()
+                self._live -= 1
+
+
+_pool: Optional[StageWorkerPool] = None
+
+
+def get_stage_worker_pool() -> Optional[StageWorkerPool]:
+    """Return this process's warm worker pool, or None if STAGE_WORKERS is 0."""
+    global _pool
+    if settings.STAGE_WORKERS <= 0:
+        return None
+    if _pool is None:
+        _pool = StageWorkerPool(settings.STAGE_WORKERS, settings.STAGE_WORKER_MAX_RUNS)
+    return _pool
+
+
+def _is_python_script(args: List[str]) -> bool:
+    return len(args) >= 2 and Path(args[0]).name.startswith("python") and args[1].endswith(".py")
+
+
+async def run_stage_script(
+    args: List[str],
+    use_gpu: Optional[bool] = None,
+    timeout: Optional[float] = None,
+    log: Optional[StageLog] = None
+) -> CommandResult:
+    """
+    Run a stage's `python script.py ...` command in a warm worker when one
+    is free, otherwise as a subprocess via run_plan2scene_command.
+
+    Raises:
+        Plan2SceneCommandError: If the script exits non-zero
+        Plan2SceneCommandTimeout: If the script exceeds `timeout`
+    """
+    pool = get_stage_worker_pool()
+    if use_gpu is None:
+        use_gpu = settings.plan2scene_gpu_enabled
+    worker = None
+    if pool is not None and _is_python_script(args):
+        worker = await pool.acquire(args[0], use_gpu)
+    if worker is None:
+        return await run_plan2scene_command(args, use_gpu=use_gpu, timeout=timeout, log=log)
+
+    try:
+        return await _run_in_worker(worker, args, use_gpu, timeout, log)
+    finally:
+        await pool.release(worker)
+
+
+async def _run_in_worker(
+    worker: StageWorker,
+    args: List[str],
+    use_gpu: bool,
+    timeout: Optional[float],
+    log: Optional[StageLog]
+) -> CommandResult:
+    """Run a `python script.py ...` command in `worker`, raising like run_plan2scene_command."""
+    lease = None
+    threads = None
+    if not use_gpu:
+        allocator = get_cpu_allocator()
+        if allocator is not None:
+            lease = allocator.acquire()
+            threads = lease.threads if lease is not None else int(fallback_thread_env()["OMP_NUM_THREADS"])
+    logger.info(f"Executing Plan2Scene script in warm worker: {' '.join(args)}")
+    start = time.monotonic()
+    try:
+        returncode, stdout, stderr, usage = await worker.run(
+            args[1:], settings.PLAN2SCENE_ROOT, timeout, log, threads=threads, lease=lease
+        )
+    finally:
+        if lease is not None:
+            lease.release()
+
+    run = current_run()
+    if run is not None and run.cancelled:
+        raise JobCancelled(f"Job {run.job_id} cancelled while running {args[1]}")
+    resources = None
+    if settings.RESOURCE_ACCOUNTING:
+        resources = ResourceUsage(
+            wall_seconds=round(time.monotonic() - start, 3),
+            **{key: usage[key] for key in (
+                "user_cpu_seconds", "sys_cpu_seconds", "max_rss_bytes", "read_bytes", "write_bytes"
+            ) if key in usage},
+        )
+        resources.peak_tree_rss_bytes = resources.max_rss_bytes
+        resources.peak_processes = 1
+    if returncode != 0:
+        raise Plan2SceneCommandError(
+            message=f"Plan2Scene command failed with return code {returncode}",
+            command=args,
+            stderr=stderr,
+            returncode=returncode,
+            resources=resources
+        )
+    return CommandResult(returncode=returncode, stdout=stdout, stderr=stderr, command=args, resources=resources)
+
+
+class FusedStageRunner:
+    """
+    One dedicated interpreter that runs a job's model-driven stage scripts
+    back to back.
+
+    Used by Plan2ScenePreprocessor when STAGE_FUSION is on: the embedding,
+    VGG crop selection, GNN propagation and texture embedding scripts share
+    one process, so torch, Plan2Scene and their configs are imported once
+    per job and checkpoints are loaded once. Each script is still its own
+    request, so timing and failures stay attributed to the stage. A worker
+    killed by a timeout or crash is replaced on the next stage.
+    """
+
+    def __init__(self, use_gpu: Optional[bool] = None):
+        self.use_gpu = settings.plan2scene_gpu_enabled if use_gpu is None else use_gpu
+        self._worker: Optional[StageWorker] = None
+
+    async def run(
+        self,
+        args: List[str],
+        timeout: Optional[float] = None,
+        log: Optional[StageLog] = None
+    ) -> CommandResult:
+        if not _is_python_script(args):
+            return await run_plan2scene_command(args, use_gpu=self.use_gpu, timeout=timeout, log=log)
+        if self._worker is None or not self._worker.alive:
+            if self._worker is not None:
+                await self._worker.stop()
+            self._worker = StageWorker(args[0], self.use_gpu)
+            await self._worker.start()
+        return await _run_in_worker(self._worker, args, self.use_gpu, timeout, log)
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            await self._worker.stop()
+            self._worker = None
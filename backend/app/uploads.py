@@ -0,0 +1,376 @@
+"""
+Upload ingestion with size limits.
+
+Request bodies on upload routes are counted as they arrive by
+UploadSizeLimitMiddleware, so an oversized upload is rejected with 413
+before the rest of the body is read; a declared Content-Length over the
+limit is rejected without reading any of it. Accepted files are copied to
+UPLOAD_DIR in fixed-size chunks in a worker thread and hashed on the fly,
+so memory per upload stays flat and the event loop is never blocked on
+disk writes.
+
+Large floorplans can instead be sent through a resumable upload session
+(ResumableUploads): the client declares the file size, PATCHes chunks at
+explicit offsets, and on a dropped connection asks for the current offset
+and continues from there. Sessions that see no chunk for
+UPLOAD_SESSION_TTL seconds are removed.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterable, Optional, Tuple
+from uuid import uuid4
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+CHUNK_SIZE = 1024 * 1024
+
+# Headroom for multipart boundaries, part headers and form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(HTTPException):
+    """Raised when an upload exceeds its size limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Upload exceeds the {limit}-byte limit.")
+
+
+def copy_with_digest(source: BinaryIO, dest: Path, max_bytes: int) -> str:
+    """
+    Copy `source` to `dest` in CHUNK_SIZE pieces, hashing as it goes.
+
+    Returns:
+        Hex SHA-256 of the copied bytes
+
+    Raises:
+        UploadTooLarge: If more than `max_bytes` are read; `dest` is removed
+    """
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(dest, "wb") as out:
+            while chunk := source.read(CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+    return digest.hexdigest()
+
+
+async def save_upload(upload: UploadFile, dest: Path, max_bytes: int) -> str:
+    """Stream an UploadFile to `dest` in a worker thread and return its SHA-256."""
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    await upload.seek(0)
+    return await asyncio.to_thread(copy_with_digest, upload.file, dest, max_bytes)
+
+
+def remove_uploads(paths: Iterable[Path]) -> None:
+    """Delete saved upload files, ignoring None entries and missing files."""
+    for path in paths:
+        if path is not None:
+            path.unlink(missing_ok=True)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware capping request body size on the given POST routes.
+
+    Rejects up front when Content-Length exceeds `max_body_bytes`, and
+    otherwise stops reading with 413 as soon as the streamed body does.
+    """
+
+    def __init__(self, app, max_body_bytes: int, paths: Iterable[str]):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.max_body_bytes
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(scope, receive, send, limit)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise UploadTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            if response_started:
+                raise
+            await self._reject(scope, receive, send, limit)
+
+    @staticmethod
+    async def _reject(scope, receive, send, limit: int):
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"Request body exceeds the {limit}-byte limit."},
+            headers={"Connection": "close"},
+        )
+        await response(scope, receive, send)
+
+
+def max_convert_body_bytes(max_upload_bytes: int, max_annotation_bytes: int) -> int:
+    """Largest acceptable /api/convert body: both files plus multipart framing."""
+    return max_upload_bytes + max_annotation_bytes + MULTIPART_OVERHEAD
+
+
+class UploadOffsetMismatch(HTTPException):
+    """Raised when a chunk does not start at the session's current offset."""
+
+    def __init__(self, offset: int):
+        super().__init__(
+            status_code=409,
+            detail=f"Chunk offset does not match the upload offset {offset}.",
+            headers={"Upload-Offset": str(offset)},
+        )
+
+
+class UploadGone(HTTPException):
+    """Raised when a session was finalized (e.g. by a concurrent request) or expired."""
+
+    def __init__(self, upload_id: str):
+        super().__init__(status_code=404, detail=f"Upload {upload_id} not found; it was finalized or expired.")
+
+
+@dataclass
+class UploadSession:
+    """A resumable upload in progress; the bytes received so far live in `part_path`."""
+    upload_id: str
+    filename: str
+    kind: str  # floorplan or annotation
+    size: int
+    content_type: Optional[str]
+    part_path: Path
+    created_at: str
+
+    @property
+    def offset(self) -> int:
+        """Bytes received so far; the partial file on disk is the source of truth."""
+        try:
+            return self.part_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    @property
+    def complete(self) -> bool:
+        return self.offset == self.size
+
+
+class ResumableUploads:
+    """
+    Resumable upload sessions stored under `root`.
+
+    Each session is a `<upload_id>.json` metadata file plus a
+    `<upload_id>.part` file that chunks are appended to. The offset is the
+    size of the partial file, so any API process sharing `root` can accept
+    the next chunk. A running SHA-256 is kept in memory per session while
+    chunks arrive in order; if it is missing (e.g. after a restart or when
+    chunks hit different processes) the file is hashed once on finalize.
+
+    Sessions idle for longer than `ttl` seconds (no chunk, judged by the
+    files' mtimes) are swept when new sessions are created.
+    """
+
+    # Shortest time between two sweeps of expired sessions
+    SWEEP_INTERVAL = 60.0
+
+    def __init__(self, root: Path, ttl: float = 24 * 3600):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._hashers: Dict[str, Tuple[Any, int]] = {}
+        self._last_sweep = 0.0
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.root / f"{upload_id}.json"
+
+    def create(self, filename: str, kind: str, size: int, content_type: Optional[str] = None) -> UploadSession:
+        if time.time() - self._last_sweep >= self.SWEEP_INTERVAL:
+            self.expire_stale()
+        upload_id = uuid4().hex
+        session = UploadSession(
+            upload_id=upload_id,
+            filename=Path(filename).name,
+            kind=kind,
+            size=size,
+            content_type=content_type,
+            part_path=self.root / f"{upload_id}.part",
+            created_at=datetime.utcnow().isoformat(),
+        )
+        session.part_path.touch()
+        meta = asdict(session)
+        meta["part_path"] = str(session.part_path)
+        tmp_path = self._meta_path(upload_id).with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, self._meta_path(upload_id))
+        self._hashers[upload_id] = (hashlib.sha256(), 0)
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        if not upload_id.isalnum():
+            return None
+        try:
+            meta = json.loads(self._meta_path(upload_id).read_text())
+        except (OSError, ValueError):
+            return None
+        meta["part_path"] = Path(meta["part_path"])
+        return UploadSession(**meta)
+
+    def expire_stale(self) -> int:
+        """
+        Remove sessions idle for longer than the TTL, and in-memory state of
+        sessions that no longer exist (finalized by another process).
+
+        Returns:
+            Number of sessions removed
+        """
+        self._last_sweep = now = time.time()
+        removed = 0
+        for meta_path in self.root.glob("*.json"):
+            upload_id = meta_path.stem
+            lock = self._locks.get(upload_id)
+            if lock is not None and lock.locked():
+                continue  # A chunk is being written or the session finalized
+            part_path = self.root / f"{upload_id}.part"
+            try:
+                last_active = max(
+                    path.stat().st_mtime for path in (meta_path, part_path) if path.exists()
+                )
+            except (OSError, ValueError):
+                continue
+            if now - last_active < self.ttl:
+                continue
+            part_path.unlink(missing_ok=True)
+            meta_path.unlink(missing_ok=True)
+            removed += 1
+        for upload_id in list(self._hashers) + list(self._locks):
+            if not self._meta_path(upload_id).exists():
+                self._hashers.pop(upload_id, None)
+                lock = self._locks.get(upload_id)
+                if lock is not None and not lock.locked():
+                    self._locks.pop(upload_id, None)
+        return removed
+
+    async def append(self, session: UploadSession, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """
+        Append a request body stream to the session at `offset`.
+
+        Data is written in CHUNK_SIZE batches from a worker thread and never
+        re-read. Returns the new offset.
+
+        Raises:
+            UploadOffsetMismatch: If `offset` is not the current offset
+            UploadTooLarge: If the data would run past the declared size
+            UploadGone: If the session was finalized or expired meanwhile
+        """
+        upload_id = session.upload_id
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            if not self._meta_path(upload_id).exists():
+                raise UploadGone(upload_id)
+            current = session.offset
+            if offset != current:
+                raise UploadOffsetMismatch(current)
+
+            hasher, hashed = self._hashers.get(upload_id, (None, -1))
+            if hashed != current:
+                hasher = None
+                self._hashers.pop(upload_id, None)
+
+            out = await asyncio.to_thread(open, session.part_path, "ab")
+            buffer = bytearray()
+
+            async def flush():
+                nonlocal current
+                data = bytes(buffer)
+                buffer.clear()
+                await asyncio.to_thread(out.write, data)
+                current += len(data)
+                if hasher is not None:
+                    hasher.update(data)
+                    self._hashers[upload_id] = (hasher, current)
+
+            try:
+                async for chunk in chunks:
+                    if current + len(buffer) + len(chunk) > session.size:
+                        raise UploadTooLarge(session.size)
+                    buffer += chunk
+                    if len(buffer) >= CHUNK_SIZE:
+                        await flush()
+                if buffer:
+                    await flush()
+            finally:
+                await asyncio.to_thread(out.close)
+            return current
+
+    async def finalize(self, session: UploadSession, dest: Path) -> str:
+        """
+        Move a complete upload to `dest`, drop the session and return the
+        file's SHA-256.
+
+        Raises:
+            UploadGone: If another request (in any process) finalized the
+                session first, or it expired
+        """
+        upload_id = session.upload_id
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            if not self._meta_path(upload_id).exists():
+                raise UploadGone(upload_id)
+            hasher, hashed = self._hashers.pop(upload_id, (None, -1))
+            try:
+                if hasher is not None and hashed == session.size:
+                    digest = hasher.hexdigest()
+                else:
+                    digest = await asyncio.to_thread(file_sha256, session.part_path)
+                os.replace(session.part_path, dest)
+            except FileNotFoundError:
+                raise UploadGone(upload_id)
+            self._meta_path(upload_id).unlink(missing_ok=True)
+        self._locks.pop(upload_id, None)
+        return digest
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file, read in CHUNK_SIZE pieces."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        while chunk := source.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,6 +1,7 @@
 import asyncio
 from .services.plan2scene import run_plan2scene
 from .jobs import update_job
+from .lifecycle import JobCancelled, PipelineInterrupted, check_cancelled
 from pathlib import Path
 from typing import Optional
 import logging
@@ -18,16 +19,72 @@ async def process_job(job_id: str, upload_path: Path, output_dir: Path, r2v_path
         r2v_path: Optional path to R2V annotation file
     """
     try:
-        update_job(job_id, status="processing")
+        # Conditional writes: a DELETE handled by another process (the API in
+        # external WORKER_MODE) must not be overwritten by this run
+        if not update_job(job_id, current_stage="starting", if_status="processing"):
+            raise JobCancelled(f"Job {job_id} is no longer processing")
         await run_plan2scene(job_id, upload_path, output_dir, r2v_path)
+        check_cancelled("finalize")
         
         # Assume output files are named standardly
         scene_url = f"/static/jobs/{job_id}/scene.glb"
         video_url = f"/static/jobs/{job_id}/walkthrough.mp4"
         
-        update_job(job_id, status="done", scene_url=scene_url, video_url=video_url)
+        if not update_job(job_id, status="done", scene_url=scene_url, video_url=video_url, if_status="processing"):
+            logger.warning(f"Job {job_id} finished after it was cancelled; result not recorded")
+            return
         logger.info(f"Job {job_id} completed successfully.")
         
+    except JobCancelled as e:
+        # DELETE /api/jobs/{id} already recorded the cancellation
+        logger.warning(f"Job {job_id} stopped: {e}")
+        raise
+    except PipelineInterrupted as e:
+        # Process is draining; the scheduler hands the job back to the queue
+        logger.warning(f"Job {job_id} interrupted: {e}")
+        update_job(job_id, current_stage="queued")
+        raise
     except Exception as e:
         logger.error(f"Job {job_id} failed: {e}")
-        update_job(job_id, status="failed")
+        update_job(job_id, status="failed", if_status="processing")
+
+
+async def run_worker(slots: Optional[int] = None, worker_id: Optional[str] = None) -> None:
+    """Consume the job queue until SIGINT/SIGTERM, then drain in-flight jobs."""
+    import signal
+    from .config import settings
+    from .recovery import recover_jobs
+    from .scheduler import build_scheduler
+    from .services.stage_workers import get_stage_worker_pool
+
+    scheduler = build_scheduler(total_slots=slots, worker_id=worker_id)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await asyncio.to_thread(recover_jobs, scheduler)
+    scheduler.start()
+    await stop.wait()
+    logger.info("Worker shutting down, draining in-flight jobs")
+    await scheduler.drain(settings.DRAIN_TIMEOUT)
+    pool = get_stage_worker_pool()
+    if pool is not None:
+        await pool.shutdown()
+
+
+def main() -> None:
+    """Entry point for `python -m app.worker`: a dedicated pipeline worker daemon."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Plan2Scene pipeline worker")
+    parser.add_argument("--slots", type=int, default=None, help="Concurrent pipelines (defaults to PIPELINE_SLOTS)")
+    parser.add_argument("--worker-id", default=None, help="Lease owner name (defaults to host:pid)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(args.slots, args.worker_id))
+
+
+if __name__ == "__main__":
+    main()
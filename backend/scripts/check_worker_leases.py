@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Multi-worker lease check for the durable job queue.
+
+Starts several `python -m app.worker` processes against a throwaway SQLite
+database, enqueues demo jobs, SIGKILLs one worker while it holds a lease,
+and verifies that every job still finishes and the queue drains.
+
+Usage:
+    cd backend && python scripts/check_worker_leases.py
+
+Environment variables:
+    LEASE_CHECK_WORKERS: Number of worker processes (default: 3)
+    LEASE_CHECK_JOBS: Number of jobs to enqueue (default: 6)
+    LEASE_CHECK_TIMEOUT: Seconds to wait for all jobs (default: 120)
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+WORKERS = int(os.getenv("LEASE_CHECK_WORKERS", "3"))
+JOBS = int(os.getenv("LEASE_CHECK_JOBS", "6"))
+TIMEOUT = int(os.getenv("LEASE_CHECK_TIMEOUT", "120"))
+
+work_dir = Path(tempfile.mkdtemp(prefix="lease_check_"))
+os.environ.update({
+    "MODE": "demo",
+    "JOB_STORE": "sqlite",
+    "JOB_DB_PATH": str(work_dir / "jobs.db"),
+    "QUEUE_LEASE_TTL": "3",
+    "QUEUE_HEARTBEAT_INTERVAL": "1",
+    "QUEUE_POLL_INTERVAL": "0.5",
+    "DEMO_PIPELINE_SLOTS": str(JOBS),
+})
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.jobs import create_job, get_job  # noqa: E402
+from app.job_queue import get_job_queue  # noqa: E402
+
+
+def main() -> int:
+    queue = get_job_queue()
+    job_ids = []
+    for i in range(JOBS):
+        job_id = f"lease-check-{i}"
+        output_dir = work_dir / "jobs" / job_id
+        output_dir.mkdir(parents=True)
+        create_job(job_id)
+        queue.enqueue(job_id, "demo", work_dir / "floorplan.png", output_dir)
+        job_ids.append(job_id)
+    print(f"[LEASE] Enqueued {JOBS} jobs in {work_dir}")
+
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "app.worker", "--slots", "1", "--worker-id", f"worker-{i}"],
+            cwd=str(BACKEND_DIR),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        for i in range(WORKERS)
+    ]
+    print(f"[LEASE] Started {WORKERS} workers")
+
+    try:
+        # Kill the first worker that holds a lease
+        victim = None
+        deadline = time.time() + 30
+        while victim is None and time.time() < deadline:
+            row = queue.db.connect().execute(
+                "SELECT job_id, worker_id FROM job_queue WHERE state = 'running' LIMIT 1"
+            ).fetchone()
+            if row:
+                victim = int(row["worker_id"].split("-")[1])
+                workers[victim].send_signal(signal.SIGKILL)
+                print(f"[LEASE] Killed worker-{victim} while it held {row['job_id']}")
+            time.sleep(0.2)
+        if victim is None:
+            print("[LEASE] FAIL: no worker claimed a job")
+            return 1
+
+        deadline = time.time() + TIMEOUT
+        while time.time() < deadline:
+            statuses = {job_id: get_job(job_id).status for job_id in job_ids}
+            if all(status != "processing" for status in statuses.values()):
+                break
+            time.sleep(1)
+
+        stats = queue.stats()
+        failed = [job_id for job_id, status in statuses.items() if status != "done"]
+        print(f"[LEASE] Final statuses: {statuses}")
+        print(f"[LEASE] Queue: {stats}")
+        if failed or stats["queued"] or stats["running"]:
+            print(f"[LEASE] FAIL: unfinished jobs {failed}")
+            return 1
+        print("[LEASE] OK: all jobs finished after worker loss")
+        return 0
+    finally:
+        for proc in workers:
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in workers:
+            proc.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
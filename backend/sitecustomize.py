@@ -8,6 +8,7 @@ Also provides CPU fallback mode patches when GPU is disabled or incompatible:
 - No-op noise_cuda module stub
 - YAML config device override (cuda → cpu)
 - torch.load() wrapper for CPU-safe checkpoint loading
+- torch thread count capped at the stage's CPU budget
 """
 
 import sys
@@ -263,11 +264,32 @@ def patch_torch_load_for_cpu():
             print(f"[sitecustomize] ⚠ Failed to patch torch.load: {e}")
 
 
+def apply_cpu_thread_budget():
+    """Cap torch's intra-op threads at the budget the backend assigned this stage.
+    
+    In CPU fallback mode the backend pins each stage to its own cores and
+    passes the core count in PLAN2SCENE_CPU_THREADS; torch would otherwise
+    start one thread per host core and fight concurrent jobs for them.
+    """
+    threads = os.environ.get("PLAN2SCENE_CPU_THREADS")
+    if FORCE_CPU and threads:
+        try:
+            import torch
+            
+            torch.set_num_threads(int(threads))
+            torch.set_num_interop_threads(1)
+            
+            print(f"[sitecustomize] ✓ Limited torch to {threads} CPU threads")
+        except Exception as e:
+            print(f"[sitecustomize] ⚠ Failed to set torch thread budget: {e}")
+
+
 # Apply patches on import
 patch_torchvision()
 create_noise_cuda_stub()
 patch_plan2scene_config_loader()
 patch_torch_load_for_cpu()
+apply_cpu_thread_budget()
 
 
 def patch_conv2d_dilation_fix():
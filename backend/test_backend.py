@@ -17,6 +17,9 @@ def test_imports():
         print("  ✓ Importing config...")
         from app.config import settings
         
+        print("  ✓ Importing job store...")
+        from app.jobs import get_job_store, SQLiteJobStore
+        
         print("  ✓ Importing plan2scene_commands...")
         from app.services.plan2scene_commands import run_plan2scene_command, Plan2SceneCommandError
         
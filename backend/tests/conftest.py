@@ -0,0 +1,17 @@
+"""
+Shared setup for the backend behavior tests.
+
+Makes `app` importable from this checkout and points the job database (and
+with it the state directory: queue, stage cache, batches, lock files) at a
+throwaway directory before app.config is first imported.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("JOB_DB_PATH", str(Path(tempfile.mkdtemp(prefix="plan2scene-tests-")) / "jobs.db"))
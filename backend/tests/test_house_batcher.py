@@ -0,0 +1,97 @@
+"""Cross-job house batching: two jobs through one batch, split back into their own data roots."""
+
+import asyncio
+import json
+from pathlib import Path
+
+from app.services.house_batcher import HouseBatcher, PipelineSlots, split_house_outputs
+from app.services.job_logs import JobLogs
+from app.services.preprocessing_pipeline import FullPipelineResult, Plan2ScenePreprocessor
+from app.services.stage_journal import StageJournal
+
+
+# House keys of every run_houses call
+calls = []
+
+
+def _write(path: Path, text: str) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+async def _fake_run_houses(self, scenes, split="test", drop=0.0, job_ids=None, journal=None):
+    """Stand-in for the Plan2Scene stages: one output per stage directory, named after the house key."""
+    root = self.data_root
+    calls.append(sorted(scenes))
+    _write(root / "input" / "data_lists" / f"{split}.txt", "".join(f"{key}\n" for key in scenes))
+    results = {}
+    for key in scenes:
+        crops = root / "processed" / "texture_crops" / split / f"drop_{drop:.1f}" / key
+        _write(crops / f"{key}_room0.png", "crop")
+        scene = _write(
+            root / "processed" / "embed_textures" / split / f"drop_{drop:.1f}" / f"{key}.scene.json",
+            json.dumps({"scene": {"arch": {"id": key}}, "textures": f"{key}/{key}_room0.png"}),
+        )
+        video = _write(root / "processed" / "renders" / split / f"drop_{drop:.1f}" / f"{key}.mp4", "video")
+        results[key] = FullPipelineResult(success=True, house_id=key, final_scene_json=scene, rendered_video=video)
+    journal.record("embed_textures", output_dir=root / "processed" / "embed_textures" / split / f"drop_{drop:.1f}")
+    return results
+
+
+def test_two_jobs_share_one_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(Plan2ScenePreprocessor, "run_houses", _fake_run_houses)
+    calls.clear()
+    batcher = HouseBatcher(
+        tmp_path / "batches", window=0.2, max_houses=8, slots=PipelineSlots(tmp_path / "slots", 1)
+    )
+
+    async def submit(job_id):
+        job_dir = tmp_path / "jobs" / job_id
+        scene = _write(job_dir / "r2v_conversion" / "uploads.scene.json", "{}")
+        journal = StageJournal.for_job_dir(job_dir)
+        result = await batcher.run(
+            job_id, scene, "uploads", job_dir / "plan2scene_data", JobLogs.for_job_dir(job_dir), journal
+        )
+        return job_dir, journal, result
+
+    async def main():
+        # A slot held elsewhere does not stop the batch from collecting
+        async with batcher.slots.hold():
+            first = asyncio.create_task(submit("job1"))
+            await asyncio.sleep(0.3)
+            second = asyncio.create_task(submit("job2"))
+            await asyncio.sleep(0.1)
+        return await asyncio.gather(first, second)
+
+    outcomes = asyncio.run(main())
+
+    assert calls == [["uploads_job1", "uploads_job2"]]
+    for job_id, (job_dir, journal, result) in zip(("job1", "job2"), outcomes):
+        data = job_dir / "plan2scene_data"
+        assert result.success and result.house_id == "uploads"
+        assert result.final_scene_json == data / "processed/embed_textures/test/drop_0.0/uploads.scene.json"
+        assert result.rendered_video.read_text() == "video"
+        scene = json.loads(result.final_scene_json.read_text())
+        assert scene["scene"]["arch"]["id"] == "uploads"
+        assert scene["textures"] == "uploads/uploads_room0.png"
+        assert (data / "processed/texture_crops/test/drop_0.0/uploads/uploads_room0.png").exists()
+        # The job's own house list and data paths, not the batch's
+        assert (data / "input/data_lists/test.txt").read_text() == "uploads\n"
+        data_paths = (data / "data_paths.json").read_text()
+        assert str(data.resolve()) in data_paths and "batches" not in data_paths
+        assert journal.is_complete("embed_textures")
+        assert journal.get("embed_textures")["output_dir"].startswith(str(data))
+    assert not any((tmp_path / "batches").iterdir())
+
+
+def test_split_leaves_other_houses_behind(tmp_path):
+    root, dest = tmp_path / "batch", tmp_path / "job"
+    _write(root / "processed/full_archs/test/uploads_a.scene.json", "uploads_a")
+    _write(root / "processed/full_archs/test/uploads_b.scene.json", "uploads_b")
+
+    split_house_outputs(root, dest, "uploads_a", "uploads")
+
+    assert [path.name for path in (dest / "processed/full_archs/test").iterdir()] == ["uploads.scene.json"]
+    assert (dest / "processed/full_archs/test/uploads.scene.json").read_text() == "uploads"
+    assert (root / "processed/full_archs/test/uploads_b.scene.json").exists()
@@ -0,0 +1,109 @@
+"""Job queue leases: priority order, mode limits, expiry, reclaim and the attempt budget."""
+
+import time
+from pathlib import Path
+
+from app.job_queue import JobQueue
+
+
+def _queue(tmp_path, **kwargs) -> JobQueue:
+    return JobQueue(tmp_path / "queue.db", **kwargs)
+
+
+def _enqueue(queue: JobQueue, job_id: str, mode: str = "gpu", priority: int = 0) -> None:
+    queue.enqueue(job_id, mode, Path(f"uploads/{job_id}.png"), Path(f"jobs/{job_id}"), priority=priority)
+
+
+def _expire(queue: JobQueue, job_id: str) -> None:
+    """Age a lease past its expiry without sleeping for the TTL."""
+    queue.db.connect().execute(
+        "UPDATE job_queue SET lease_expires_at = ? WHERE job_id = ?", (time.time() - 1, job_id)
+    )
+
+
+def test_claim_order_and_mode_limits(tmp_path):
+    queue = _queue(tmp_path)
+    _enqueue(queue, "low")
+    _enqueue(queue, "high", priority=5)
+    _enqueue(queue, "demo", mode="demo")
+
+    assert queue.position("high") == 1 and queue.position("demo") == 3
+    first = queue.claim("w1", {"gpu": 1})
+    assert first.job_id == "high" and first.attempts == 1
+    # gpu is saturated by the running lease, so the demo job goes next
+    assert queue.claim("w1", {"gpu": 1}).job_id == "demo"
+    assert queue.claim("w1", {"gpu": 1}) is None
+    assert queue.complete("high", first.lease_token)
+    assert queue.claim("w1", {"gpu": 1}).job_id == "low"
+
+
+def test_expired_lease_is_reclaimed_and_old_holder_loses_it(tmp_path):
+    queue = _queue(tmp_path)
+    _enqueue(queue, "job")
+    first = queue.claim("w1")
+    assert queue.heartbeat("job", first.lease_token)
+    assert queue.claim("w2") is None
+
+    _expire(queue, "job")
+    requeued, abandoned = queue.requeue_expired()
+    assert requeued == ["job"] and abandoned == []
+    second = queue.claim("w2")
+    assert second.attempts == 2
+    # The first worker's token no longer renews or completes the job
+    assert not queue.heartbeat("job", first.lease_token)
+    assert not queue.complete("job", first.lease_token)
+    assert queue.complete("job", second.lease_token)
+    assert not queue.contains("job")
+
+
+def test_job_is_abandoned_after_max_attempts(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    _enqueue(queue, "job")
+    queue.claim("w1")
+    _expire(queue, "job")
+    # An expired lease under the budget is claimable directly
+    assert queue.claim("w2").attempts == 2
+    _expire(queue, "job")
+    assert queue.claim("w3") is None
+
+    requeued, abandoned = queue.requeue_expired()
+    assert requeued == [] and abandoned == ["job"]
+    assert not queue.contains("job")
+
+
+def test_drained_leases_do_not_use_attempts(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    _enqueue(queue, "job")
+    for _ in range(5):
+        entry = queue.claim("w1")
+        assert queue.requeue("job", entry.lease_token)
+        assert queue.position("job") == 1
+    entry = queue.claim("w1")
+    assert entry.attempts == 1
+
+
+def test_cancelled_run_holds_its_slot_until_released(tmp_path):
+    queue = _queue(tmp_path)
+    _enqueue(queue, "job")
+    _enqueue(queue, "next")
+    entry = queue.claim("w1", {"gpu": 1})
+
+    assert queue.remove("job")
+    assert queue.contains("job")
+    assert not queue.heartbeat("job", entry.lease_token)
+    assert queue.claim("w1", {"gpu": 1}) is None
+    assert queue.complete("job", entry.lease_token)
+    assert queue.claim("w1", {"gpu": 1}).job_id == "next"
+
+
+def test_release_worker_requeues_its_leases(tmp_path):
+    queue = _queue(tmp_path)
+    _enqueue(queue, "a")
+    _enqueue(queue, "b")
+    queue.claim("dead")
+    queue.claim("alive")
+
+    assert sorted(queue.running_workers()) == ["alive", "dead"]
+    assert queue.release_worker("dead") == ["a"]
+    assert queue.position("a") == 1
+    assert queue.running_workers() == ["alive"]
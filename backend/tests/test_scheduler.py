@@ -0,0 +1,83 @@
+"""Scheduler drain: jobs stop at a stage boundary (or are cancelled) and return to the queue."""
+
+import asyncio
+import threading
+from pathlib import Path
+
+from app import lifecycle
+from app.job_queue import JobQueue
+from app.lifecycle import check_drain
+from app.scheduler import JobScheduler
+
+
+def _scheduler(tmp_path, runner, slots: int = 2) -> JobScheduler:
+    queue = JobQueue(tmp_path / "queue.db", max_attempts=2)
+    return JobScheduler(runner, queue, total_slots=slots, worker_id="w1", poll_interval=0.01, heartbeat_interval=60)
+
+
+async def _started(scheduler: JobScheduler, count: int) -> None:
+    while len(scheduler._running) < count:
+        await asyncio.sleep(0.01)
+
+
+def test_drain_requeues_interrupted_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(lifecycle, "_drain_requested", threading.Event())
+    endings = {}
+
+    async def runner(job_id, upload_path, output_dir, r2v_path):
+        # "stuck" never reaches a stage boundary and has to be cancelled
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                if job_id != "stuck":
+                    check_drain("next")
+        except BaseException as e:
+            endings[job_id] = type(e).__name__
+            raise
+
+    async def main():
+        scheduler = _scheduler(tmp_path, runner)
+        for job_id in ("polite", "stuck"):
+            await scheduler.submit(job_id, Path("upload.png"), Path("out"))
+        scheduler.start()
+        await _started(scheduler, 2)
+        await scheduler.drain(timeout=0.2)
+        return scheduler
+
+    scheduler = asyncio.run(main())
+
+    assert endings == {"polite": "PipelineInterrupted", "stuck": "CancelledError"}
+    assert not scheduler._running and not scheduler._leases
+    queue = scheduler.queue
+    assert sorted(job_id for job_id in ("polite", "stuck") if queue.position(job_id)) == ["polite", "stuck"]
+    # Drained runs do not count against the attempt budget
+    assert queue.claim("w2").attempts == 1
+
+
+def test_finished_and_cancelled_jobs_leave_the_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(lifecycle, "_drain_requested", threading.Event())
+
+    async def runner(job_id, upload_path, output_dir, r2v_path):
+        if job_id == "quick":
+            return
+        await asyncio.sleep(60)
+
+    async def main():
+        scheduler = _scheduler(tmp_path, runner, slots=1)
+        await scheduler.submit("quick", Path("upload.png"), Path("out"))
+        await scheduler.submit("slow", Path("upload.png"), Path("out"))
+        assert await scheduler.queue_position("slow") == 2
+        scheduler.start()
+        while await asyncio.to_thread(scheduler.queue.contains, "quick"):
+            await asyncio.sleep(0.01)
+        await _started(scheduler, 1)
+        assert await scheduler.cancel("slow")
+        while scheduler._settling or scheduler._running:
+            await asyncio.sleep(0.01)
+        await scheduler.shutdown()
+        return scheduler
+
+    scheduler = asyncio.run(main())
+
+    assert not scheduler.queue.contains("quick")
+    assert not scheduler.queue.contains("slow")
@@ -0,0 +1,61 @@
+"""Built-in seam correction: corrected crops wrap around without a visible seam."""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services import seam_blend  # noqa: E402
+
+
+def _seam_and_interior(batch):
+    """Mean absolute step across the wrap-around edges and between interior neighbours."""
+    seam = (np.abs(batch[:, 0] - batch[:, -1]).mean() + np.abs(batch[:, :, 0] - batch[:, :, -1]).mean()) / 2
+    interior = (np.abs(np.diff(batch, axis=1)).mean() + np.abs(np.diff(batch, axis=2)).mean()) / 2
+    return seam, interior
+
+
+def _crops():
+    """Two RGB crops with a strong gradient (a hard seam when tiled) plus texture noise."""
+    rng = np.random.default_rng(0)
+    ys, xs = np.mgrid[0:48, 0:64].astype(np.float32)
+    gradient = np.stack([ys * 3, xs * 2, ys + xs], axis=-1)
+    return np.stack([gradient, gradient[::-1]]) + rng.normal(0, 4, (2, 48, 64, 3)).astype(np.float32)
+
+
+@pytest.mark.parametrize("method", ["periodic", "offset"])
+def test_output_tiles_without_a_seam(method):
+    batch = _crops()
+    seam, interior = _seam_and_interior(batch)
+    assert seam > 10 * interior
+
+    result = seam_blend.make_tileable(batch, method, 0.25)
+
+    assert result.shape == batch.shape
+    seam, interior = _seam_and_interior(result)
+    assert seam < 2 * interior
+
+
+def test_periodic_keeps_detail():
+    batch = _crops()
+    result = seam_blend.periodic_component(batch)
+    # Only a smooth field is removed, so second differences (the texture) barely change
+    for axis in (1, 2):
+        detail = np.diff(batch, n=2, axis=axis)[:, 2:-2, 2:-2]
+        kept = np.diff(result, n=2, axis=axis)[:, 2:-2, 2:-2]
+        assert np.abs(detail - kept).mean() < 0.05 * np.abs(detail).mean()
+
+
+def test_main_writes_tileable_crops_and_copies_other_files(tmp_path):
+    image_module = pytest.importorskip("PIL.Image")
+    source, dest = tmp_path / "tileable_texture_crops", tmp_path / "texture_crops"
+    (source / "house").mkdir(parents=True)
+    image_module.fromarray(np.clip(_crops()[0], 0, 255).astype(np.uint8)).save(source / "house" / "room0.png")
+    (source / "house" / "crops.json").write_text("{}")
+
+    assert seam_blend.main(["seam_blend.py", str(source), str(dest)]) == 0
+
+    with image_module.open(dest / "house" / "room0.png") as image:
+        result = np.asarray(image, dtype=np.float32)[None]
+    seam, interior = _seam_and_interior(result)
+    assert seam < 2 * interior
+    assert (dest / "house" / "crops.json").read_text() == "{}"
@@ -0,0 +1,76 @@
+"""Stage output cache: keys, hits and misses, detaching linked outputs and LRU eviction."""
+
+import os
+
+from app.services.stage_cache import StageCache, detach_outputs, normalized_scene_digest
+from app.services.stage_dag import Artifact
+
+
+def _outputs(root, text: str):
+    (root / "crops").mkdir(parents=True, exist_ok=True)
+    (root / "crops" / "room0.png").write_text(text)
+    return [Artifact(root / "crops")]
+
+
+def _key(cache: StageCache, tmp_path, house_key: str = "house") -> str:
+    script = tmp_path / "stage.py"
+    if not script.exists():
+        script.write_text("print('stage')")
+    return cache.key("vgg_crop_selector", "scene", house_key, [script], {"split": "test", "drop": 0.0})
+
+
+def test_scene_digest_ignores_formatting(tmp_path):
+    compact, pretty = tmp_path / "a.scene.json", tmp_path / "b.scene.json"
+    compact.write_text('{"b":1,"a":[1,2]}')
+    pretty.write_text('{\n  "a": [1, 2],\n  "b": 1\n}')
+
+    assert normalized_scene_digest(compact) == normalized_scene_digest(pretty)
+
+
+def test_key_changes_with_code_and_house(tmp_path):
+    cache = StageCache(tmp_path / "cache", max_bytes=1 << 20)
+    key = _key(cache, tmp_path)
+
+    assert _key(cache, tmp_path, "other") != key
+    (tmp_path / "stage.py").write_text("print('changed stage')")
+    assert _key(cache, tmp_path) != key
+
+
+def test_miss_then_hit_links_outputs(tmp_path):
+    cache = StageCache(tmp_path / "cache", max_bytes=1 << 20)
+    key = _key(cache, tmp_path)
+    job_outputs = [Artifact(tmp_path / "job2" / "crops")]
+
+    assert not cache.materialize(key, job_outputs)
+    cache.store(key, "vgg_crop_selector", _outputs(tmp_path / "job1", "crop"))
+    assert cache.materialize(key, job_outputs)
+
+    linked = tmp_path / "job2" / "crops" / "room0.png"
+    assert linked.read_text() == "crop"
+    # The stored entry is a private copy of job1's file, shared with job2 by hardlink
+    assert not os.path.samefile(linked, tmp_path / "job1" / "crops" / "room0.png")
+    assert linked.stat().st_nlink == 2
+
+    detach_outputs(job_outputs)
+    assert linked.stat().st_nlink == 1
+    linked.write_text("rewritten")
+    assert cache.materialize(key, [Artifact(tmp_path / "job3" / "crops")])
+    assert (tmp_path / "job3" / "crops" / "room0.png").read_text() == "crop"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = StageCache(tmp_path / "cache", max_bytes=10)
+    keys = [cache.key("gnn_texture_prop", f"scene{i}", "house", [], {}) for i in range(3)]
+    for index, key in enumerate(keys[:2]):
+        cache.store(key, "gnn_texture_prop", _outputs(tmp_path / f"job{index}", "12345"))
+    # Use the first entry after the second, so the second is least recently used
+    for when, key in ((100, keys[1]), (200, keys[0])):
+        meta = cache._entry(key) / "meta.json"
+        os.utime(meta, (when, when))
+
+    cache.store(keys[2], "gnn_texture_prop", _outputs(tmp_path / "job2", "12345"))
+
+    assert sum(entry["size"] for entry in cache.entries()) == 10
+    assert cache.materialize(keys[0], [Artifact(tmp_path / "a" / "crops")])
+    assert not cache.materialize(keys[1], [Artifact(tmp_path / "b" / "crops")])
+    assert cache.materialize(keys[2], [Artifact(tmp_path / "c" / "crops")])
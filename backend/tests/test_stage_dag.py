@@ -0,0 +1,89 @@
+"""Stage graph ordering and manifest skip/invalidate decisions."""
+
+import pytest
+
+from app.services.stage_dag import Artifact, StageGraph, StageManifest, StageSpec
+
+
+async def _noop():
+    return None
+
+
+def _spec(name, inputs=(), outputs=(), **kwargs) -> StageSpec:
+    return StageSpec(
+        name=name,
+        run=_noop,
+        inputs=[Artifact(path) for path in inputs],
+        outputs=[Artifact(path) for path in outputs],
+        **kwargs
+    )
+
+
+def test_graph_orders_stages_by_what_they_read(tmp_path):
+    scene, crops, embedded = tmp_path / "scene.json", tmp_path / "crops", tmp_path / "embedded"
+    specs = [
+        _spec("embed", inputs=[crops], outputs=[embedded]),
+        _spec("render", inputs=[embedded]),
+        _spec("crop", inputs=[scene], outputs=[crops]),
+        _spec("report", inputs=[scene]),
+    ]
+
+    graph = StageGraph(specs)
+
+    # Dependencies first; independent stages keep their declared order
+    assert [spec.name for spec in graph] == ["crop", "embed", "render", "report"]
+    assert graph.dependencies["render"] == ["embed"]
+
+
+def test_excluded_subtree_is_not_a_dependency(tmp_path):
+    specs = [
+        StageSpec("read_rest", _noop, inputs=[Artifact(tmp_path / "out", exclude=("cache",))]),
+        _spec("write_cache", outputs=[tmp_path / "out" / "cache"]),
+    ]
+
+    assert [spec.name for spec in StageGraph(specs)] == ["read_rest", "write_cache"]
+
+
+def test_cycle_is_rejected(tmp_path):
+    a, b = tmp_path / "a", tmp_path / "b"
+    with pytest.raises(ValueError, match="cycle"):
+        StageGraph([_spec("one", inputs=[a], outputs=[b]), _spec("two", inputs=[b], outputs=[a])])
+
+
+def test_manifest_skips_until_inputs_outputs_or_params_change(tmp_path):
+    source, output = tmp_path / "in.txt", tmp_path / "out"
+    source.write_text("v1")
+    (output / "result.txt").parent.mkdir()
+    (output / "result.txt").write_text("done")
+    spec = _spec("stage", inputs=[source], outputs=[output], params={"drop": 0.0})
+    manifest = StageManifest.for_data_root(tmp_path)
+
+    assert not manifest.is_up_to_date(spec, spec.key())
+    manifest.record(spec, spec.key())
+    assert manifest.is_up_to_date(spec, spec.key())
+    # Survives a reload from disk
+    assert StageManifest.for_data_root(tmp_path).is_up_to_date(spec, spec.key())
+
+    spec.params["drop"] = 0.1
+    assert not manifest.is_up_to_date(spec, spec.key())
+    spec.params["drop"] = 0.0
+
+    (output / "result.txt").write_text("tampered output")
+    assert not manifest.is_up_to_date(spec, spec.key())
+    manifest.record(spec, spec.key())
+
+    source.write_text("v2 input")
+    assert not manifest.is_up_to_date(spec, spec.key())
+
+
+def test_invalidate_forgets_a_stage(tmp_path):
+    output = tmp_path / "out.txt"
+    output.write_text("done")
+    spec = _spec("stage", outputs=[output])
+    manifest = StageManifest.for_data_root(tmp_path)
+    manifest.record(spec, spec.key())
+
+    manifest.invalidate("stage")
+
+    assert not manifest.is_up_to_date(spec, spec.key())
+    assert not StageManifest.for_data_root(tmp_path).is_up_to_date(spec, spec.key())
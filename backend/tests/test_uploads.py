@@ -0,0 +1,74 @@
+"""Resumable upload sessions: offsets, resuming, size limits, expiry and finalize."""
+
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+
+from app.uploads import ResumableUploads, UploadGone, UploadOffsetMismatch, UploadTooLarge
+
+
+async def _body(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_chunks_resume_at_offset_and_finalize(tmp_path):
+    uploads = ResumableUploads(tmp_path / "sessions")
+    data = b"floorplan-" * 1000
+
+    async def main():
+        session = uploads.create("../plan.png", "floorplan", len(data), "image/png")
+        assert session.filename == "plan.png" and session.offset == 0
+        assert await uploads.append(session, 0, _body(data[:3000], data[3000:4000])) == 4000
+        # A retried chunk at a stale offset is refused with the current one
+        with pytest.raises(UploadOffsetMismatch) as stale:
+            await uploads.append(session, 0, _body(data[:100]))
+        assert stale.value.headers["Upload-Offset"] == "4000"
+        # Another process (no in-memory hash) picks the session up from disk
+        other = ResumableUploads(tmp_path / "sessions")
+        resumed = other.get(session.upload_id)
+        assert resumed.offset == 4000
+        assert await other.append(resumed, 4000, _body(data[4000:])) == len(data)
+        digest = await other.finalize(resumed, tmp_path / "plan.png")
+        return session, digest
+
+    session, digest = asyncio.run(main())
+
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / "plan.png").read_bytes() == data
+    assert uploads.get(session.upload_id) is None
+
+
+def test_finalize_twice_and_oversized_chunks(tmp_path):
+    uploads = ResumableUploads(tmp_path / "sessions")
+
+    async def main():
+        session = uploads.create("plan.png", "floorplan", 4)
+        with pytest.raises(UploadTooLarge):
+            await uploads.append(session, 0, _body(b"12", b"345"))
+        assert session.offset == 0
+        await uploads.append(session, 0, _body(b"1234"))
+        assert await uploads.finalize(session, tmp_path / "plan.png") == hashlib.sha256(b"1234").hexdigest()
+        with pytest.raises(UploadGone):
+            await uploads.finalize(session, tmp_path / "again.png")
+        with pytest.raises(UploadGone):
+            await uploads.append(session, 4, _body(b"5"))
+
+    asyncio.run(main())
+
+
+def test_idle_sessions_expire(tmp_path):
+    uploads = ResumableUploads(tmp_path / "sessions", ttl=60)
+    idle = uploads.create("idle.png", "floorplan", 10)
+    active = uploads.create("active.png", "floorplan", 10)
+    past = time.time() - 120
+    for path in (idle.part_path, uploads._meta_path(idle.upload_id)):
+        os.utime(path, (past, past))
+
+    assert uploads.expire_stale() == 1
+
+    assert uploads.get(idle.upload_id) is None and not idle.part_path.exists()
+    assert uploads.get(active.upload_id) is not None
@@ -5,7 +5,7 @@ import UploadZone from "./components/UploadZone";
 import ProcessingSteps from "./components/ProcessingSteps";
 import ResultDashboard from "./components/ResultDashboard";
 import PipelineModeBadge from "./components/PipelineModeBadge";
-import { createJob, getJobStatus, getConfig, JobStatusResponse, PipelineConfig } from "./api";
+import { createJob, getJobStatus, getConfig, subscribeJobEvents, JobStatusResponse, PipelineConfig } from "./api";
 
 const App: React.FC = () => {
     const [jobId, setJobId] = useState<string | null>(null);
@@ -26,6 +26,7 @@ const App: React.FC = () => {
         if (!jobId) return;
 
         let cancelled = false;
+        let interval: ReturnType<typeof setInterval> | undefined;
         const poll = async () => {
             try {
                 const status = await getJobStatus(jobId);
@@ -37,11 +38,25 @@ const App: React.FC = () => {
             }
         };
 
-        poll();
-        const interval = setInterval(poll, 2000); // Poll every 2s
+        // Stream updates; fall back to polling every 2s if the stream is unavailable
+        const unsubscribe = subscribeJobEvents(
+            jobId,
+            (status) => {
+                if (!cancelled) {
+                    setJob(status);
+                }
+            },
+            () => {
+                if (!cancelled && !interval) {
+                    poll();
+                    interval = setInterval(poll, 2000);
+                }
+            }
+        );
         return () => {
             cancelled = true;
-            clearInterval(interval);
+            unsubscribe();
+            if (interval) clearInterval(interval);
         };
     }, [jobId]);
 
@@ -19,6 +19,8 @@ export interface JobStatusResponse {
     error?: string;
     current_stage?: string;
     failed_stage?: string;
+    queue_position?: number;
+    version?: number;
 }
 
 export async function getConfig(): Promise<PipelineConfig> {
@@ -58,3 +60,28 @@ export async function getJobStatus(jobId: string): Promise<JobStatusResponse> {
     }
     return res.json();
 }
+
+/**
+ * Stream job status updates over server-sent events.
+ * Returns a function that closes the stream.
+ */
+export function subscribeJobEvents(
+    jobId: string,
+    onStatus: (status: JobStatusResponse) => void,
+    onError: () => void
+): () => void {
+    const source = new EventSource(`${API_BASE}/api/jobs/${jobId}/events`);
+    source.addEventListener("job", (event) => {
+        const status: JobStatusResponse = JSON.parse((event as MessageEvent).data);
+        onStatus(status);
+        if (["done", "failed", "cancelled"].includes(status.status)) {
+            source.close();
+        }
+    });
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+            onError();
+        }
+    };
+    return () => source.close();
+}